@@ -0,0 +1,334 @@
+'''
+bench.py
+
+Microbenchmarks for the tetris engine hot paths.
+
+Usage: python bench.py [-o results.json] [-r repeat] [-k name]
+       python bench.py compare old.json new.json [-t threshold]
+
+Every benchmark runs on a headless board with fixed seeds, so no display
+is needed and two runs do the same work. Results are written as JSON
+(to stdout without -o). compare prints the change for every benchmark
+and exits with status 1 if any got slower by more than the threshold
+(default 0.10, i.e. 10%). import_tetris times a headless import of the
+tetris module in a fresh interpreter and fails if it loads tkinter.
+The results also give the memory allocated per board cell (one Block),
+measured with tracemalloc.
+
+@author chindesaurus
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import random
+
+from tetris import Tetris, Board, Block, Point, I_shape, T_shape
+
+
+SEED = 2009
+REPEAT = 5
+TARGET_TIME = 0.2   # seconds per repeat, used to pick the loop count
+
+
+############################################################
+# BOARDS
+############################################################
+
+def dense_board(full_rows, rng, height=12):
+    ''' Parameters: full_rows - type: int - complete rows at the bottom
+                    rng - type: random.Random
+                    height - type: int - rows of the stack
+        Return value: type: Board
+
+        Builds a headless board whose stack is height rows high. The
+        bottom full_rows rows are complete, the others have one gap.
+    '''
+    board = Board(None, Tetris.BOARD_WIDTH, Tetris.BOARD_HEIGHT)
+    for row in range(height):
+        y = Tetris.BOARD_HEIGHT - 1 - row
+        gap = None if row < full_rows else rng.randrange(Tetris.BOARD_WIDTH)
+        for x in range(Tetris.BOARD_WIDTH):
+            if x != gap:
+                board.add_block(Block(Point(x, y), 'gray'))
+    return board
+
+
+############################################################
+# BENCHMARKS
+############################################################
+# Each benchmark takes a loop count and returns the seconds spent doing
+# that many operations. Setup work is kept outside the timed region.
+
+def bench_board_can_move(loops):
+    board = dense_board(0, random.Random(SEED))
+    squares = [(x, y) for y in range(-1, Tetris.BOARD_HEIGHT + 1)
+               for x in range(-1, Tetris.BOARD_WIDTH + 1)]
+    squares = squares * (loops // len(squares) + 1)
+    squares = squares[:loops]
+    can_move = board.can_move
+    start = time.perf_counter()
+    for x, y in squares:
+        can_move(x, y)
+    return time.perf_counter() - start
+
+
+def bench_shape_can_move(loops):
+    board = dense_board(0, random.Random(SEED))
+    shape = T_shape(Point(Tetris.BOARD_WIDTH // 2, 4))
+    start = time.perf_counter()
+    for i in range(loops):
+        shape.can_move(board, 0, 1)
+    return time.perf_counter() - start
+
+
+def bench_shape_rotate(loops):
+    board = dense_board(0, random.Random(SEED))
+    shape = T_shape(Point(Tetris.BOARD_WIDTH // 2, 3))
+    start = time.perf_counter()
+    for i in range(loops):
+        shape.rotate(board)
+    return time.perf_counter() - start
+
+
+def bench_hard_drop(loops):
+    game = Tetris(None, seed=SEED)
+    game.board = dense_board(0, random.Random(SEED))
+    shape = game.current_shape
+    elapsed = 0.0
+    for i in range(loops):
+        top = shape.get_blocks()[0].y
+        start = time.perf_counter()
+        game.do_drop()
+        elapsed += time.perf_counter() - start
+        shape.move(0, top - shape.get_blocks()[0].y)
+    return elapsed
+
+
+def bench_gravity(rows):
+    # a frame of gravity of rows rows per frame: 1G moves the shape a
+    # row, 20G drops it to where it lands
+    def bench(loops):
+        game = Tetris(None, seed=SEED)
+        game.board = dense_board(0, random.Random(SEED))
+        game.gravity = rows
+        shape = game.current_shape
+        elapsed = 0.0
+        for i in range(loops):
+            top = shape.get_blocks()[0].y
+            start = time.perf_counter()
+            game.fall(game.gravity_rows())
+            elapsed += time.perf_counter() - start
+            shape.move(0, top - shape.get_blocks()[0].y)
+        return elapsed
+    return bench
+
+
+def bench_add_shape(loops):
+    board = dense_board(0, random.Random(SEED))
+    shape = I_shape(Point(Tetris.BOARD_WIDTH // 2, 2))
+    elapsed = 0.0
+    for i in range(loops):
+        start = time.perf_counter()
+        board.add_shape(shape)
+        elapsed += time.perf_counter() - start
+        for block in shape.get_blocks():
+            board.remove_block(block.x, block.y)
+    return elapsed
+
+
+def bench_remove_complete_rows(lines):
+    def bench(loops):
+        rng = random.Random(SEED)
+        elapsed = 0.0
+        for i in range(loops):
+            board = dense_board(lines, rng)
+            start = time.perf_counter()
+            board.remove_complete_rows()
+            elapsed += time.perf_counter() - start
+        return elapsed
+    return bench
+
+
+def bench_create_new_shape(loops):
+    game = Tetris(None, seed=SEED)
+    start = time.perf_counter()
+    for i in range(loops):
+        game.create_new_shape()
+    return time.perf_counter() - start
+
+
+_IMPORT_SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import tetris
+elapsed = time.perf_counter() - start
+if 'tkinter' in sys.modules:
+    sys.exit('importing tetris loaded tkinter')
+print(elapsed)
+'''
+
+def bench_import_tetris(loops):
+    # a fresh interpreter per import, timing only the import itself
+    elapsed = 0.0
+    for i in range(loops):
+        output = subprocess.check_output([sys.executable, '-c', _IMPORT_SCRIPT],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+        elapsed += float(output)
+    return elapsed
+
+
+BENCHMARKS = [
+    ('board_can_move', bench_board_can_move),
+    ('shape_can_move', bench_shape_can_move),
+    ('shape_rotate', bench_shape_rotate),
+    ('hard_drop', bench_hard_drop),
+    ('gravity_1g', bench_gravity(1)),
+    ('gravity_20g', bench_gravity(Tetris.BOARD_HEIGHT)),
+    ('add_shape', bench_add_shape),
+    ('remove_complete_rows_1', bench_remove_complete_rows(1)),
+    ('remove_complete_rows_2', bench_remove_complete_rows(2)),
+    ('remove_complete_rows_3', bench_remove_complete_rows(3)),
+    ('remove_complete_rows_4', bench_remove_complete_rows(4)),
+    ('create_new_shape', bench_create_new_shape),
+    ('import_tetris', bench_import_tetris),
+]
+
+
+############################################################
+# MEMORY
+############################################################
+
+def cell_memory(cells=4000):
+    ''' Parameters: cells - type: int - blocks to make
+        Return value: type: float
+
+        Returns the bytes allocated per block, as seen by tracemalloc,
+        for blocks in the seven piece colors.
+    '''
+    import tracemalloc
+    colors = ['cyan', 'blue', 'orange', 'yellow', 'green', 'purple', 'red']
+    blocks = [None] * cells
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        for i in range(cells):
+            blocks[i] = Block(Point(i % Tetris.BOARD_WIDTH,
+                                    i // Tetris.BOARD_WIDTH), colors[i % 7])
+        return (tracemalloc.get_traced_memory()[0] - start) / cells
+    finally:
+        tracemalloc.stop()
+
+
+############################################################
+# HARNESS
+############################################################
+
+def calibrate(func):
+    ''' Returns a loop count that makes one repeat of func take about
+        TARGET_TIME seconds.
+    '''
+    loops = 1
+    while True:
+        elapsed = func(loops)
+        if elapsed >= TARGET_TIME / 10 or loops >= 10 ** 7:
+            break
+        loops *= 10
+    return max(1, int(loops * TARGET_TIME / max(elapsed, 1e-9)))
+
+
+def run(names=None, repeat=REPEAT):
+    ''' Parameters: names - type: list of strings - substrings to select by
+                    repeat - type: int
+        Return value: type: dict
+
+        Runs the benchmarks and returns the results: for each one the
+        loop count and the time per operation in nanoseconds of every
+        repeat, with their minimum and median.
+    '''
+    results = {}
+    for name, func in BENCHMARKS:
+        if names and not any(n in name for n in names):
+            continue
+        loops = calibrate(func)
+        times = sorted(func(loops) / loops * 1e9 for i in range(repeat))
+        results[name] = {'loops': loops,
+                         'ns_per_op': times,
+                         'min': times[0],
+                         'median': times[len(times) // 2]}
+        sys.stderr.write('%-24s %12.1f ns/op\n' % (name, times[0]))
+    memory = {'bytes_per_cell': cell_memory()}
+    sys.stderr.write('%-24s %12.1f bytes\n' % ('cell_memory',
+                                               memory['bytes_per_cell']))
+    return {'meta': {'python': platform.python_version(),
+                     'implementation': platform.python_implementation(),
+                     'machine': platform.machine(),
+                     'seed': SEED,
+                     'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'benchmarks': results,
+            'memory': memory}
+
+
+def compare(old, new, threshold):
+    ''' Parameters: old - type: dict - results of run
+                    new - type: dict - results of run
+                    threshold - type: float - allowed slowdown, 0.1 is 10%
+        Return value: type: list of strings - the regressed benchmarks
+
+        Prints the change of the minimum time of every benchmark found
+        in both results.
+    '''
+    regressions = []
+    for name in sorted(new['benchmarks']):
+        if name not in old['benchmarks']:
+            continue
+        before = old['benchmarks'][name]['min']
+        after = new['benchmarks'][name]['min']
+        change = after / before - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('%-24s %12.1f -> %12.1f ns/op %+7.1f%%%s' %
+              (name, before, after, change * 100, flag))
+    if 'memory' in old and 'memory' in new:
+        before = old['memory']['bytes_per_cell']
+        after = new['memory']['bytes_per_cell']
+        print('%-24s %12.1f -> %12.1f bytes %+7.1f%%' %
+              ('cell_memory', before, after, (after / before - 1) * 100))
+    return regressions
+
+
+def main(argv):
+    if len(argv) > 1 and argv[1] == 'compare':
+        parser = argparse.ArgumentParser(prog='bench.py compare')
+        parser.add_argument('old')
+        parser.add_argument('new')
+        parser.add_argument('-t', '--threshold', type=float, default=0.10)
+        args = parser.parse_args(argv[2:])
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        return 1 if compare(old, new, args.threshold) else 0
+
+    parser = argparse.ArgumentParser(prog='bench.py')
+    parser.add_argument('-o', '--output')
+    parser.add_argument('-r', '--repeat', type=int, default=REPEAT)
+    parser.add_argument('-k', '--name', action='append')
+    args = parser.parse_args(argv[1:])
+    results = run(args.name, args.repeat)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,416 @@
+'''
+bench_render.py
+
+Rendering benchmarks: drives scripted games through the real Window and
+CanvasFrame and measures what the Tk side costs.
+
+Usage: python bench_render.py [-o results.json] [-n frames] [-k name]
+                              [--renderer canvas|pixmap] [--size WxH]
+       python bench_render.py --ops [-n frames] [-k name] [--size WxH]
+       python bench_render.py --region N [-n repeat] [-o results.json]
+
+If DISPLAY is not set, an Xvfb virtual display is started for the run
+(Xvfb must be installed). Every scripted key press is one frame: the key
+is handled by Tetris.key_pressed and the window is then updated so the
+canvas is redrawn. For every scenario the results hold the wall time per
+frame, the number of Tk calls the canvas made per frame and the canvas
+item count after every frame. The output has the same layout as
+bench.py, so two runs can be compared with python bench.py compare.
+
+--renderer picks how the board is drawn (see tetris.Board.RENDERERS)
+and --size plays on a board of W by H squares instead of the usual 10 by
+20, e.g. to compare the renderers when the board holds many blocks.
+
+With --ops no display is used: the scenarios are played on a
+graphics.RecordingCanvasFrame and the canvas operations every frame
+triggers are counted by kind.
+
+With --region, an N by N region of random pixels is written to a
+graphics.Pixmap with setRegion and read back with getRegion, both
+ways getRegion can read it (PPM data and Tk's color strings). The
+bytes read back must be the bytes written; the time of every transfer
+is reported.
+
+@author chindesaurus
+'''
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+from graphics import Window, RecordingCanvasFrame, Pixmap, PixmapCanvas
+from tetris import Tetris, Board, Block, Point
+
+
+SEED = 2009
+FRAMES = 200
+REGION_REPEAT = 20
+
+
+############################################################
+# VIRTUAL DISPLAY
+############################################################
+
+def start_xvfb():
+    ''' Starts an Xvfb server on a free display number, points DISPLAY
+        at it and stops it again on exit.
+    '''
+    if not shutil.which('Xvfb'):
+        raise SystemExit('bench_render.py: DISPLAY is not set and Xvfb '
+                         'is not installed')
+    for number in range(99, 199):
+        if os.path.exists('/tmp/.X%d-lock' % number):
+            continue
+        server = subprocess.Popen(['Xvfb', ':%d' % number,
+                                   '-screen', '0', '4096x4096x24', '-nolisten', 'tcp'],
+                                  stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+        # wait for the server to create its socket
+        for i in range(50):
+            if os.path.exists('/tmp/.X11-unix/X%d' % number):
+                break
+            if server.poll() is not None:
+                break
+            time.sleep(0.1)
+        if server.poll() is None:
+            os.environ['DISPLAY'] = ':%d' % number
+            atexit.register(server.terminate)
+            return
+    raise SystemExit('bench_render.py: could not start Xvfb')
+
+
+############################################################
+# TK CALL COUNTING
+############################################################
+
+class CountingTk(object):
+    ''' Stands in for a widget's Tcl interpreter and counts the calls
+        made through it. Everything else is passed through.
+    '''
+
+    def __init__(self, tk):
+        self.tk = tk
+        self.calls = 0
+
+    def call(self, *args):
+        self.calls += 1
+        return self.tk.call(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.tk, name)
+
+
+class _Key(object):
+    # the part of a Tk key event that Tetris.key_pressed reads
+    def __init__(self, keysym):
+        self.keysym = keysym
+
+
+############################################################
+# SCENARIOS
+############################################################
+# A scenario gets a running game and yields the keys to press, one per
+# frame. Between keys it may change the board; only the key presses are
+# timed.
+
+def scenario_spawn(game, frames):
+    # lock the shape straight away so every frame spawns a new one
+    for i in range(frames):
+        if i % 2 == 0:
+            reset_if_high(game)
+        yield 'space' if i % 2 == 0 else 'Down'
+
+
+def scenario_move(game, frames):
+    keys = ['Left'] * 4 + ['Right'] * 4
+    for i in range(frames):
+        yield keys[i % len(keys)]
+
+
+def scenario_rotate(game, frames):
+    # leave room above the shape to rotate into
+    game.do_move('Down')
+    game.do_move('Down')
+    for i in range(frames):
+        yield 'Up'
+
+
+def scenario_hard_drop(game, frames):
+    # spread the pieces over the columns so the stack grows slowly
+    column = 0
+    for i in range(frames):
+        reset_if_high(game)
+        shift = column - game.current_shape.get_blocks()[1].x
+        key = 'Left' if shift < 0 else 'Right'
+        for j in range(abs(shift)):
+            game.do_move(key)
+        column = (column + 3) % game.board.width
+        yield 'space'
+        game.do_move('Down')
+
+
+def scenario_line_clear(game, frames):
+    # fill the bottom four rows except the last column and drop a
+    # vertical I piece into the gap
+    board = game.board
+    for i in range(frames):
+        clear_board(game)
+        for y in range(board.height - 4, board.height):
+            for x in range(board.width - 1):
+                block = Block(Point(x, y), 'gray')
+                block.draw(board.canvas)
+                board.add_block(block)
+        for block in game.current_shape.get_blocks():
+            block.undraw()
+        game.current_shape = game.SHAPES[0](Point(board.width // 2, 0))
+        board.draw_shape(game.current_shape)
+        game.do_move('Down')
+        game.do_move('Down')
+        game.do_rotate()
+        while game.current_shape.can_move(board, 1, 0):
+            game.do_move('Right')
+        game.do_drop()
+        yield 'Down'
+
+
+SCENARIOS = [
+    ('spawn', scenario_spawn),
+    ('move', scenario_move),
+    ('rotate', scenario_rotate),
+    ('hard_drop', scenario_hard_drop),
+    ('line_clear', scenario_line_clear),
+]
+
+
+def clear_board(game):
+    ''' Removes every block from the board. '''
+    for block in game.board.grid.values():
+        block.undraw()
+    game.board.clear()
+
+
+def reset_if_high(game):
+    ''' Clears the board when the stack gets near the top, so scripted
+        games do not end.
+    '''
+    if any(y < 8 for x, y in game.board.grid):
+        clear_board(game)
+
+
+############################################################
+# HARNESS
+############################################################
+
+def timings(times):
+    ''' Parameters: times - type: list of float - nanoseconds
+        Return value: type: dict - the times and their summary, laid out
+        like a bench.py result
+    '''
+    ordered = sorted(times)
+    return {'ns_per_op': times,
+            'min': ordered[0],
+            'median': ordered[len(ordered) // 2],
+            'p95': ordered[int(len(ordered) * 0.95)],
+            'max': ordered[-1]}
+
+
+def run_scenario(script, frames, renderer='canvas', width=Tetris.BOARD_WIDTH,
+                 height=Tetris.BOARD_HEIGHT):
+    ''' Parameters: script - type: function(game, frames) - the scenario
+                    frames - type: int
+                    renderer - type: string - see tetris.Board.RENDERERS
+                    width - type: int - board width in squares
+                    height - type: int - board height in squares
+        Return value: type: dict
+
+        Plays the scenario in a new window and returns the per frame
+        wall times (ns), Tk call counts and canvas item counts.
+    '''
+    win = Window("Tetris benchmark")
+    game = Tetris(win, seed=SEED, renderer=renderer, width=width,
+                  height=height)
+    game.stop()
+    win.update()
+
+    # the pixmap renderer puts its Tk canvas behind a PixmapCanvas and
+    # also calls Tk through its image
+    canvas = game.board.canvas.canvas
+    counter = CountingTk(win.tk)
+    if isinstance(canvas, PixmapCanvas):
+        canvas.pixmap.image.tk = counter
+        canvas = canvas.target
+    canvas.tk = counter
+
+    times, calls, items = [], [], []
+    for key in script(game, frames):
+        win.update()
+        before = counter.calls
+        start = time.perf_counter()
+        game.key_pressed(_Key(key))
+        win.update()
+        times.append((time.perf_counter() - start) * 1e9)
+        calls.append(counter.calls - before)
+        items.append(len(canvas.find_all()))
+
+    win.destroy()
+    result = timings(times)
+    result.update(frames=len(times),
+                  tk_calls_per_frame=calls,
+                  tk_calls_mean=sum(calls) / len(calls),
+                  canvas_items=items)
+    return result
+
+
+def count_ops(script, frames, width=Tetris.BOARD_WIDTH,
+              height=Tetris.BOARD_HEIGHT):
+    ''' Parameters: script - type: function(game, frames) - the scenario
+                    frames - type: int
+                    width - type: int - board width in squares
+                    height - type: int - board height in squares
+        Return value: type: dict
+
+        Plays the scenario headless on a RecordingCanvasFrame and returns
+        the mean number of canvas operations per frame, by kind.
+    '''
+    frame = RecordingCanvasFrame(log=False)
+    game = Tetris(None, seed=SEED, canvas=frame, width=width, height=height)
+    recorder = frame.canvas
+    totals = {}
+    count = 0
+    for key in script(game, frames):
+        recorder.reset()
+        game.key_pressed(_Key(key))
+        for name, calls in recorder.counts.items():
+            totals[name] = totals.get(name, 0) + calls
+        count += 1
+    return dict((name, calls / count) for name, calls in totals.items())
+
+
+def run_ops(names=None, frames=FRAMES, width=Tetris.BOARD_WIDTH,
+            height=Tetris.BOARD_HEIGHT):
+    results = {}
+    for name, script in SCENARIOS:
+        if names and not any(n in name for n in names):
+            continue
+        ops = results[name] = count_ops(script, frames, width, height)
+        print('%-12s %6.1f ops/frame  %s' %
+              (name, sum(ops.values()),
+               ', '.join('%s %.1f' % item for item in sorted(ops.items()))))
+    return results
+
+
+def run_region(size=512, repeat=REGION_REPEAT):
+    ''' Parameters: size - type: int - the side of the region in pixels
+                    repeat - type: int - transfers timed each way
+        Return value: type: dict
+
+        Round-trips a size x size region of random pixels through a
+        Pixmap in a window and times setRegion, getRegion and the color
+        string read getRegion falls back to. Fails if any read does not
+        return the bytes written.
+    '''
+    if not os.environ.get('DISPLAY'):
+        start_xvfb()
+    win = Window("Tetris benchmark")
+    pixmap = Pixmap(size, size)
+    rng = random.Random(SEED)
+    sets, gets, colors = [], [], []
+    identical = True
+    for i in range(repeat):
+        data = rng.getrandbits(size * size * 24).to_bytes(size * size * 3,
+                                                          'little')
+        start = time.perf_counter()
+        pixmap.setRegion(0, 0, size, size, data)
+        sets.append((time.perf_counter() - start) * 1e9)
+        start = time.perf_counter()
+        read = pixmap.getRegion(0, 0, size, size)
+        gets.append((time.perf_counter() - start) * 1e9)
+        start = time.perf_counter()
+        fallback = pixmap._colorRegion(0, 0, size, size)
+        colors.append((time.perf_counter() - start) * 1e9)
+        identical = identical and read == data and fallback == data
+    win.destroy()
+    if not identical:
+        raise SystemExit('bench_render.py: the pixels read back differ '
+                         'from the pixels written')
+    results = {'region_set': timings(sets), 'region_get': timings(gets),
+               'region_get_colors': timings(colors)}
+    for name, result in sorted(results.items()):
+        sys.stderr.write('%-18s %dx%d  median %8.2f ms  max %8.2f ms\n' %
+                         (name, size, size, result['median'] / 1e6,
+                          result['max'] / 1e6))
+    return results
+
+
+def run(names=None, frames=FRAMES, renderer='canvas', width=Tetris.BOARD_WIDTH,
+        height=Tetris.BOARD_HEIGHT):
+    if not os.environ.get('DISPLAY'):
+        start_xvfb()
+    results = {}
+    for name, script in SCENARIOS:
+        if names and not any(n in name for n in names):
+            continue
+        result = results[name] = run_scenario(script, frames, renderer,
+                                              width, height)
+        sys.stderr.write('%-12s median %10.1f us  p95 %10.1f us  '
+                         '%5.1f Tk calls/frame  %4d items at end\n' %
+                         (name, result['median'] / 1e3, result['p95'] / 1e3,
+                          result['tk_calls_mean'], result['canvas_items'][-1]))
+    return {'meta': {'python': platform.python_version(),
+                     'implementation': platform.python_implementation(),
+                     'machine': platform.machine(),
+                     'display': os.environ.get('DISPLAY'),
+                     'renderer': renderer,
+                     'board': '%dx%d' % (width, height),
+                     'seed': SEED,
+                     'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'benchmarks': results}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='bench_render.py')
+    parser.add_argument('-o', '--output')
+    parser.add_argument('-n', '--frames', type=int,
+                        help='frames per scenario (default %d), or region '
+                             'transfers (default %d)' % (FRAMES, REGION_REPEAT))
+    parser.add_argument('-k', '--name', action='append')
+    parser.add_argument('--ops', action='store_true')
+    parser.add_argument('--renderer', choices=sorted(Board.RENDERERS),
+                        default='canvas')
+    parser.add_argument('--size', metavar='WxH')
+    parser.add_argument('--region', metavar='N', type=int,
+                        help='time N x N Pixmap region transfers instead')
+    args = parser.parse_args(argv[1:])
+    width, height = Tetris.BOARD_WIDTH, Tetris.BOARD_HEIGHT
+    if args.size:
+        width, height = [int(n) for n in args.size.lower().split('x')]
+    if args.ops:
+        run_ops(args.name, args.frames or FRAMES, width, height)
+        return 0
+    if args.region:
+        results = {'meta': {'python': platform.python_version(),
+                            'display': os.environ.get('DISPLAY'),
+                            'region': '%dx%d' % (args.region, args.region),
+                            'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+                   'benchmarks': run_region(args.region,
+                                            args.frames or REGION_REPEAT)}
+    else:
+        results = run(args.name, args.frames or FRAMES, args.renderer, width,
+                      height)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,351 @@
+'''
+capture.py
+
+Headless video capture of tetris games.
+
+A FrameBuffer rasterizes a game's board straight into one preallocated
+binary PPM (P6) frame, without Tk. Only the cells whose color changed
+since the previous frame are repainted, and every cell is painted by
+copying precomputed pixel rows, so rendering a frame allocates nothing.
+Frames are written back to back, which is the raw stream external
+encoders read, e.g.
+
+    python capture.py game.rep | ffmpeg -f image2pipe -c:v ppm -r 30 -i - game.mp4
+
+Usage: python capture.py REPLAY [-o FILE] [--fps N] [--cell PIXELS] [-j N]
+
+renders a replay (see replay.py) to FILE, or to standard output. With
+-j, segments of the game are rendered by N worker processes (0 for one
+per CPU) and joined in order, for long games. A game played with
+python tetris.py --capture FILE is captured live instead.
+
+@author chindesaurus
+'''
+import argparse
+import os
+import sys
+import time
+
+import replay
+from tetris import Tetris, Block
+
+
+FPS = 30
+
+# RGB values of the Tk color names the game uses
+COLORS = {'black': (0, 0, 0),
+          'white': (255, 255, 255),
+          'light gray': (211, 211, 211),
+          'gray': (190, 190, 190),
+          'blue': (0, 0, 255),
+          'orange': (255, 165, 0),
+          'cyan': (0, 255, 255),
+          'red': (255, 0, 0),
+          'green': (0, 255, 0),
+          'yellow': (255, 255, 0),
+          'magenta': (255, 0, 255),
+          'purple': (160, 32, 240)}
+
+
+def rgb(color):
+    ''' Parameters: color - type:string - a color name or #rrggbb
+        Return value: type:bytes - the r,g,b bytes of the color
+    '''
+    if color in COLORS:
+        return bytes(COLORS[color])
+    if color.startswith('#') and len(color) == 7:
+        return bytes.fromhex(color[1:])
+    raise ValueError('unknown color %r' % color)
+
+
+class FrameBuffer(object):
+    ''' FrameBuffer class: one video frame of a board
+        Attributes: width - type:int - board width in squares
+                    height - type:int - board height in squares
+                    cell - type:int - size of a square in pixels
+                    frame - type:bytearray - the PPM frame, header included
+                    cells - type:list - the color painted in each square
+    '''
+
+    def __init__(self, width=Tetris.BOARD_WIDTH, height=Tetris.BOARD_HEIGHT,
+                 cell=Block.BLOCK_SIZE, background='light gray'):
+        self.width = width
+        self.height = height
+        self.cell = cell
+        self.background = background
+        header = ('P6\n%d %d\n255\n' % (width * cell, height * cell)).encode('ascii')
+        self.offset = len(header)
+        self.stride = width * cell * 3
+        self.frame = bytearray(header) + bytearray(self.stride * height * cell)
+        self.view = memoryview(self.frame)
+        self.cells = [None] * (width * height)
+        self.colors = [background] * (width * height)
+        self.tiles = {}
+        self.clear()
+
+
+    def tile(self, color):
+        ''' Return value: type:list of bytes - the pixel rows of a square
+            of the given color; squares of the background color have no
+            outline
+        '''
+        rows = self.tiles.get(color)
+        if rows is None:
+            cell = self.cell
+            if color == self.background:
+                rows = [rgb(color) * cell] * cell
+            else:
+                # a black outline around the fill, like Block's rectangle
+                border = max(1, cell // 10)
+                edge = rgb('black') * cell
+                inner = (rgb('black') * border + rgb(color) * (cell - 2 * border)
+                         + rgb('black') * border)
+                rows = [edge] * border + [inner] * (cell - 2 * border) + \
+                       [edge] * border
+            self.tiles[color] = rows
+        return rows
+
+
+    def clear(self):
+        ''' Paints every square with the background. '''
+        for i in range(len(self.cells)):
+            self.paint(i, self.background)
+
+
+    def paint(self, i, color):
+        ''' Paints square i (y * width + x) with color. '''
+        cell = self.cell
+        stride = self.stride
+        y, x = divmod(i, self.width)
+        start = self.offset + y * cell * stride + x * cell * 3
+        end = start + cell * 3
+        view = self.view
+        for row in self.tile(color):
+            view[start:end] = row
+            start += stride
+            end += stride
+        self.cells[i] = color
+
+
+    def render(self, game):
+        ''' Parameters: game - type:Tetris
+            Return value: type:int - the number of squares repainted
+
+            Rasterizes the board and the falling shape of game.
+        '''
+        colors = self.colors
+        background = self.background
+        width = self.width
+        for i in range(len(colors)):
+            colors[i] = background
+        for block in game.board.grid.values():
+            colors[block.y * width + block.x] = block.config['fill']
+        if not game.over:
+            for block in game.current_shape.get_blocks():
+                if 0 <= block.y < self.height:
+                    colors[block.y * width + block.x] = block.config['fill']
+
+        cells = self.cells
+        painted = 0
+        for i in range(len(colors)):
+            if cells[i] != colors[i]:
+                self.paint(i, colors[i])
+                painted += 1
+        return painted
+
+
+    def write(self, stream):
+        ''' Writes the frame to a binary stream. '''
+        stream.write(self.view)
+
+
+############################################################
+# CAPTURE
+############################################################
+
+def render_replay(recording, stream, fps=FPS, cell=Block.BLOCK_SIZE):
+    ''' Parameters: recording - type:replay.Replay
+                    stream - type:binary file
+                    fps - type:int - frames per second of game time
+                    cell - type:int - size of a square in pixels
+        Return value: type:int - the number of frames written
+
+        Plays the replay headless and writes a frame every 1/fps seconds
+        of game time, as fast as it can.
+    '''
+    game = Tetris(None, seed=recording.seed)
+    frame = FrameBuffer(cell=cell)
+    frames = recording.duration() * fps // 1000 + 1
+    i = 0
+    for n in range(frames):
+        i = recording.play(game, i, n * 1000 // fps)
+        frame.render(game)
+        frame.write(stream)
+    return frames
+
+
+############################################################
+# PARALLEL RENDERING
+############################################################
+# A replay is split into segments of frames. One headless pass over the
+# inputs records the game state at the start of every segment; worker
+# processes then render the segments into temporary files, which are
+# copied to the output in order as they finish.
+
+def plan_segments(recording, fps=FPS, segments=8):
+    ''' Parameters: recording - type:replay.Replay
+                    fps - type:int
+                    segments - type:int - how many pieces to split into
+        Return value: type:list of tuples
+
+        Plays the replay headless, without rendering, and returns
+        (first frame, end frame, game state, next input) for each
+        segment; the state is the one the first frame shows.
+    '''
+    game = Tetris(None, seed=recording.seed)
+    frames = recording.duration() * fps // 1000 + 1
+    size = -(-frames // segments)
+    plan = []
+    i = 0
+    for first in range(0, frames, size):
+        i = recording.play(game, i, first * 1000 // fps)
+        plan.append((first, min(first + size, frames), game.get_state(), i))
+    return plan
+
+
+_worker = {}
+
+def _start_worker(recording, fps, cell, directory):
+    _worker.update(recording=recording, fps=fps, cell=cell,
+                   directory=directory)
+
+
+def _render_segment(segment):
+    # runs in a worker process: renders one segment into a file
+    first, end, state, i = segment
+    recording = _worker['recording']
+    fps = _worker['fps']
+    game = Tetris(None)
+    game.set_state(state)
+    frame = FrameBuffer(cell=_worker['cell'])
+    path = os.path.join(_worker['directory'], 'frames%08d.ppm' % first)
+    with open(path, 'wb') as f:
+        for n in range(first, end):
+            i = recording.play(game, i, n * 1000 // fps)
+            frame.render(game)
+            frame.write(f)
+    return path
+
+
+def render_replay_parallel(recording, stream, fps=FPS, cell=Block.BLOCK_SIZE,
+                           processes=None):
+    ''' Parameters: recording - type:replay.Replay
+                    stream - type:binary file
+                    fps - type:int
+                    cell - type:int
+                    processes - type:int - worker processes (default one
+                    per CPU)
+        Return value: type:int - the number of frames written
+
+        Writes the same frames as render_replay, rendering segments of
+        the game in parallel.
+    '''
+    import multiprocessing
+    import shutil
+    import tempfile
+    processes = processes or os.cpu_count() or 1
+    # a few segments per process, so the processes finish close together
+    plan = plan_segments(recording, fps, processes * 4)
+    directory = tempfile.mkdtemp(prefix='tetris-capture-')
+    try:
+        with multiprocessing.Pool(processes, _start_worker,
+                                  (recording, fps, cell, directory)) as pool:
+            for path in pool.imap(_render_segment, plan):
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, stream, 1 << 20)
+                os.remove(path)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return plan[-1][1]
+
+
+class LiveCapture(object):
+    ''' LiveCapture class: records a game being played in a window
+        Attributes: game - type:Tetris
+                    stream - type:binary file - where the frames go
+                    fps - type:int
+                    frames - type:int - frames written so far
+    '''
+
+    def __init__(self, game, stream, fps=FPS):
+        self.game = game
+        self.stream = stream
+        self.fps = fps
+        self.frames = 0
+        self.frame = FrameBuffer()
+        self.start = time.perf_counter()
+        self.timer = game.win.after(0, self.capture)
+
+
+    def capture(self):
+        # writes the frames due since the last call, so the video keeps
+        # to real time even when the timer fires late
+        due = int((time.perf_counter() - self.start) * self.fps) + 1
+        if due > self.frames:
+            self.frame.render(self.game)
+            while self.frames < due:
+                self.frame.write(self.stream)
+                self.frames += 1
+        self.timer = self.game.win.after(1000 // self.fps, self.capture)
+
+
+    def stop(self):
+        ''' Stops capturing while the window is still open. '''
+        self.game.win.after_cancel(self.timer)
+
+
+    def close(self):
+        ''' Flushes the stream, and closes it unless it is standard
+            output.
+        '''
+        self.stream.flush()
+        if self.stream is not sys.stdout.buffer:
+            self.stream.close()
+
+
+def open_output(path):
+    ''' Returns a binary stream for path, standard output for "-". '''
+    if path == '-':
+        return sys.stdout.buffer
+    return open(path, 'wb')
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='capture.py')
+    parser.add_argument('replay')
+    parser.add_argument('-o', '--output', default='-')
+    parser.add_argument('--fps', type=int, default=FPS)
+    parser.add_argument('--cell', type=int, default=Block.BLOCK_SIZE)
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='worker processes; 0 for one per CPU')
+    args = parser.parse_args(argv[1:])
+
+    recording = replay.load(args.replay)
+    stream = open_output(args.output)
+    start = time.perf_counter()
+    if args.jobs == 1:
+        frames = render_replay(recording, stream, args.fps, args.cell)
+    else:
+        frames = render_replay_parallel(recording, stream, args.fps,
+                                        args.cell, args.jobs)
+    stream.flush()
+    elapsed = time.perf_counter() - start
+    sys.stderr.write('%d frames (%.1f s of game) in %.2f s: %.0f frames/s, '
+                     '%.1fx real time\n' %
+                     (frames, frames / float(args.fps), elapsed,
+                      frames / elapsed, frames / float(args.fps) / elapsed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
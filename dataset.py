@@ -0,0 +1,283 @@
+'''
+dataset.py
+
+Memory-mapped training datasets of (state, action, outcome) samples.
+
+A dataset file is a 64-byte header followed by fixed-size records, one
+per sample:
+
+    board    - the occupancy of the board, one bit per square, square
+               y * width + x in bit (y * width + x) % 8 of byte
+               (y * width + x) // 8
+    piece    - uint8, the index of the piece in Tetris.SHAPES
+    cells    - 4 x uint16, the squares (y * width + x) the piece was
+               placed in
+    outcome  - float32, the return of the sample
+
+DatasetWriter appends records straight into a memory map of the file,
+growing the file (by doubling) when it is full, and keeps the sample
+count in the header up to date. Dataset maps a file read-only; with
+NumPy, arrays() gives zero-copy views of the records, so no Python
+object is made per sample and files larger than memory can be used.
+NumPy is optional and only needed for arrays() and boards().
+
+Usage: python dataset.py selfplay FILE [-n games] [--seed N]
+       python dataset.py info FILE
+
+selfplay appends samples from games played by picking random reachable
+placements (see movegen.py), the outcome being the discounted number of
+lines the game went on to clear.
+
+@author chindesaurus
+'''
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+from snapshot import Snapshot
+from tetris import Tetris
+import movegen
+
+
+MAGIC = b'TDS1'
+VERSION = 1
+# magic, version, width, height, record size, sample count
+HEADER = struct.Struct('<4sHBBHQ')
+HEADER_SIZE = 64
+CELLS = 4
+CAPACITY = 1 << 16     # records preallocated in a new file
+
+
+def record_format(width, height):
+    ''' Returns the struct format of one record for a board size. '''
+    return '<%dsB%dHf' % ((width * height + 7) // 8, CELLS)
+
+
+def pack_board(snapshot):
+    ''' Parameters: snapshot - type:Snapshot
+        Return value: type:bytes - the occupancy bits of the board
+    '''
+    bits = 0
+    width = snapshot.width
+    for y, row in enumerate(snapshot.rows):
+        if not any(row):
+            continue
+        for x, color in enumerate(row):
+            if color is not None:
+                bits |= 1 << (y * width + x)
+    return bits.to_bytes((width * snapshot.height + 7) // 8, 'little')
+
+
+class DatasetWriter(object):
+    ''' DatasetWriter class: appends samples to a dataset file
+        Attributes: path - type:string
+                    width - type:int - board width in squares
+                    height - type:int - board height in squares
+                    count - type:int - samples in the file
+                    capacity - type:int - samples the file has room for
+    '''
+
+    def __init__(self, path, width=Tetris.BOARD_WIDTH,
+                 height=Tetris.BOARD_HEIGHT, capacity=CAPACITY):
+        self.path = path
+        self.count = 0
+        if os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE:
+            # append to an existing dataset
+            self.file = open(path, 'r+b')
+            magic, version, old_width, old_height, size, self.count = \
+                HEADER.unpack(self.file.read(HEADER.size))
+            if magic != MAGIC or version != VERSION or \
+               (old_width, old_height) != (width, height):
+                self.file.close()
+                raise ValueError('%s is not a dataset of %dx%d boards' %
+                                 (path, width, height))
+        else:
+            self.file = open(path, 'w+b')
+        self.width = width
+        self.height = height
+        self.record = struct.Struct(record_format(width, height))
+        self.capacity = max(capacity, self.count)
+        self._map()
+
+
+    def _map(self):
+        # (re)maps the file at the current capacity
+        self.file.truncate(HEADER_SIZE + self.capacity * self.record.size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.width, self.height,
+                         self.record.size, self.count)
+
+
+    def append(self, board, piece, cells, outcome):
+        ''' Parameters: board - type:bytes - from pack_board
+                        piece - type:int - index in Tetris.SHAPES
+                        cells - type:sequence of (x, y) - where the piece went
+                        outcome - type:float
+
+            Appends a sample.
+        '''
+        if self.count == self.capacity:
+            self.map.close()
+            self.capacity *= 2
+            self._map()
+        width = self.width
+        self.record.pack_into(self.map,
+                              HEADER_SIZE + self.count * self.record.size,
+                              board, piece, *[y * width + x for x, y in cells],
+                              outcome)
+        self.count += 1
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, width, self.height,
+                         self.record.size, self.count)
+
+
+    def close(self):
+        ''' Writes the file out and trims the unused room. '''
+        self.map.flush()
+        self.map.close()
+        self.file.truncate(HEADER_SIZE + self.count * self.record.size)
+        self.file.close()
+
+
+class Dataset(object):
+    ''' Dataset class: a dataset file mapped read-only
+        Attributes: width - type:int
+                    height - type:int
+                    count - type:int - samples in the file
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, width, height, size, count = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a tetris dataset' % path)
+        self.width = width
+        self.height = height
+        self.record = struct.Struct(record_format(width, height))
+        self.count = min(count, (len(self.map) - HEADER_SIZE) // size)
+
+
+    def __len__(self):
+        return self.count
+
+
+    def __getitem__(self, i):
+        ''' Returns sample i as (board bytes, piece, cells, outcome). '''
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        values = self.record.unpack_from(self.map,
+                                         HEADER_SIZE + i * self.record.size)
+        cells = tuple(divmod(square, self.width)[::-1]
+                      for square in values[2:2 + CELLS])
+        return values[0], values[1], cells, values[-1]
+
+
+    def dtype(self):
+        ''' Returns the NumPy structured dtype of a record. '''
+        import numpy
+        return numpy.dtype([('board', numpy.uint8, ((self.width * self.height + 7) // 8,)),
+                            ('piece', numpy.uint8),
+                            ('cells', '<u2', (CELLS,)),
+                            ('outcome', '<f4')])
+
+
+    def arrays(self):
+        ''' Return value: type:numpy record array
+
+            A zero-copy view of the samples, with the fields board,
+            piece, cells and outcome. Needs NumPy.
+        '''
+        import numpy
+        return numpy.frombuffer(self.map, dtype=self.dtype(), count=self.count,
+                                offset=HEADER_SIZE)
+
+
+    def boards(self, start=0, stop=None):
+        ''' Returns the boards of samples start to stop unpacked to a
+            (samples, height, width) uint8 array. Needs NumPy; unlike
+            arrays() this makes a copy, so take a batch at a time.
+        '''
+        import numpy
+        packed = self.arrays()['board'][start:stop]
+        bits = numpy.unpackbits(packed, axis=1, bitorder='little')
+        return bits[:, :self.width * self.height].reshape(
+            len(packed), self.height, self.width)
+
+
+    def close(self):
+        self.map.close()
+
+
+############################################################
+# SELF-PLAY
+############################################################
+
+def selfplay(writer, games, seed=None, discount=0.95):
+    ''' Parameters: writer - type:DatasetWriter
+                    games - type:int
+                    seed - type:int
+                    discount - type:float
+        Return value: type:int - samples written
+
+        Plays games by placing every piece at a random reachable
+        placement and appends a sample per piece. The outcome of a
+        sample is the lines cleared from that piece on, discounted by
+        discount per piece.
+    '''
+    rng = random.Random(seed)
+    written = 0
+    width, height = writer.width, writer.height
+    for game in range(games):
+        snapshot = Snapshot(width, height)
+        samples = []
+        while True:
+            index = rng.randrange(len(Tetris.SHAPES))
+            piece = movegen.spawn_piece(Tetris.SHAPES[index], width)
+            placements = movegen.search(snapshot.can_move, width, height, piece)
+            if not placements:
+                break
+            cells, path = rng.choice(placements)
+            board = pack_board(snapshot)
+            snapshot, lines = snapshot.place(cells, piece.color)
+            samples.append((board, index, cells, lines))
+
+        # the returns, worked out backwards from the end of the game
+        outcomes = [0.0] * len(samples)
+        future = 0.0
+        for i in range(len(samples) - 1, -1, -1):
+            future = samples[i][3] + discount * future
+            outcomes[i] = future
+        for (board, index, cells, lines), outcome in zip(samples, outcomes):
+            writer.append(board, index, cells, outcome)
+        written += len(samples)
+    return written
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='dataset.py')
+    parser.add_argument('command', choices=['selfplay', 'info'])
+    parser.add_argument('path')
+    parser.add_argument('-n', '--games', type=int, default=100)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'selfplay':
+        writer = DatasetWriter(args.path)
+        written = selfplay(writer, args.games, args.seed)
+        writer.close()
+        print('%s: %d samples written, %d in total' %
+              (args.path, written, writer.count))
+    else:
+        data = Dataset(args.path)
+        print('%s: %d samples of %dx%d boards, %d bytes each' %
+              (args.path, len(data), data.width, data.height,
+               data.record.size))
+        data.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
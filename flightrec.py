@@ -0,0 +1,165 @@
+'''
+flightrec.py
+
+Flight recorder for tetris games: a fixed-size ring buffer of the last
+engine events, dumped to a small binary file when something goes wrong.
+
+Usage: python flightrec.py dump.bin
+
+prints a dump. The game keeps a recorder when started with
+--flight-recorder FILE (or TETRIS_FLIGHT_RECORDER=FILE); FILE is then
+written when the game ends, when an exception escapes a Tk callback or
+the program, and on SIGUSR1.
+
+Every event is stored as a tick number, an event code, the shape and
+the position of its center block and its rotation direction (or, for
+row clears, the number of rows). The buffer is a handful of
+preallocated arrays, so recording an event allocates nothing.
+
+@author chindesaurus
+'''
+import struct
+import sys
+import time
+from array import array
+
+
+SPAWN, MOVE, ROTATE, DROP, LOCK, ROW_CLEAR, GAME_OVER = range(1, 8)
+EVENT_NAMES = {SPAWN: 'spawn', MOVE: 'move', ROTATE: 'rotate', DROP: 'drop',
+               LOCK: 'lock', ROW_CLEAR: 'row_clear', GAME_OVER: 'game_over'}
+
+MAGIC = b'TFR1'
+HEADER = struct.Struct('<4sII16sd')    # magic, count, size, reason, time
+RECORD = struct.Struct('<IBBhhb')      # tick, event, shape, x, y, extra
+
+
+class FlightRecorder(object):
+    ''' FlightRecorder class: the last size engine events
+        Attributes: size - type:int - the number of events kept
+                    count - type:int - the number of events recorded so far
+                    path - type:string - where dump writes by default
+                    shape_ids - type:dict - shape class to the id stored
+                    CODES - type:dict - event name to event code, for
+                    callers that do not import this module
+    '''
+
+    CODES = dict((name, code) for code, name in EVENT_NAMES.items())
+
+    def __init__(self, shapes, size=4096, path='tetris-flight.bin'):
+        self.size = size
+        self.count = 0
+        self.path = path
+        self.shape_ids = dict((shape, i) for i, shape in enumerate(shapes))
+        self.shape_names = [shape.__name__ for shape in shapes]
+        self.ticks = array('I', [0]) * size
+        self.events = array('B', [0]) * size
+        self.shapes = array('B', [0]) * size
+        self.xs = array('h', [0]) * size
+        self.ys = array('h', [0]) * size
+        self.extras = array('b', [0]) * size
+
+
+    def record(self, tick, event, shape, extra=None):
+        ''' Parameters: tick - type:int - the game's tick counter
+                        event - type:int - one of the event codes
+                        shape - type:Shape - the current shape
+                        extra - type:int - stored instead of the rotation
+                        direction if given
+        '''
+        i = self.count % self.size
+        self.count += 1
+        center = shape.blocks[1]
+        self.ticks[i] = tick & 0xffffffff
+        self.events[i] = event
+        self.shapes[i] = self.shape_ids.get(shape.__class__, 255)
+        self.xs[i] = center.x
+        self.ys[i] = center.y
+        self.extras[i] = shape.rotation_dir if extra is None else extra
+
+
+    def entries(self):
+        ''' Return value: type: list of tuples
+
+            The recorded events, oldest first, as
+            (tick, event, shape id, x, y, extra).
+        '''
+        kept = min(self.count, self.size)
+        first = self.count - kept
+        return [(self.ticks[i], self.events[i], self.shapes[i], self.xs[i],
+                 self.ys[i], self.extras[i])
+                for i in (n % self.size for n in range(first, self.count))]
+
+
+    def dump(self, reason='', path=None):
+        ''' Writes the recorded events to path (default self.path).
+        '''
+        entries = self.entries()
+        with open(path or self.path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.count, len(entries),
+                                reason.encode('ascii', 'replace')[:16],
+                                time.time()))
+            for entry in entries:
+                f.write(RECORD.pack(*entry))
+            f.write(' '.join(self.shape_names).encode('ascii'))
+
+
+    def install(self, win=None):
+        ''' Dumps the buffer when an exception reaches the top level, when
+            one escapes a Tk callback of win, and on SIGUSR1.
+        '''
+        previous = sys.excepthook
+        def excepthook(*exc_info):
+            self.dump('exception')
+            previous(*exc_info)
+        sys.excepthook = excepthook
+
+        if win is not None:
+            report = win.report_callback_exception
+            def report_callback_exception(*exc_info):
+                self.dump('exception')
+                report(*exc_info)
+            win.report_callback_exception = report_callback_exception
+
+        import signal
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1,
+                          lambda signum, frame: self.dump('signal'))
+
+
+def load(path):
+    ''' Parameters: path - type:string
+        Return value: type: tuple (header dict, list of entries)
+
+        Reads a dump written by FlightRecorder.dump.
+    '''
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, count, kept, reason, when = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('%s is not a flight recorder dump' % path)
+    offset = HEADER.size
+    entries = []
+    for n in range(kept):
+        entries.append(RECORD.unpack_from(data, offset))
+        offset += RECORD.size
+    names = data[offset:].decode('ascii').split()
+    header = {'count': count, 'reason': reason.rstrip(b'\0').decode('ascii'),
+              'time': when, 'shapes': names}
+    return header, entries
+
+
+def main(argv):
+    header, entries = load(argv[1])
+    print('%s: %d events recorded, last %d kept, dumped on %s at %s' %
+          (argv[1], header['count'], len(entries), header['reason'] or '-',
+           time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(header['time']))))
+    names = header['shapes']
+    for tick, event, shape, x, y, extra in entries:
+        print('%8d %-10s %-8s x=%3d y=%3d %+d' %
+              (tick, EVENT_NAMES.get(event, event),
+               names[shape] if shape < len(names) else '?', x, y, extra))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -126,12 +126,15 @@ from __future__ import division
 #     Added ability to set text atttributes.
 #     Added Entry boxes.
 
-from builtins import map
-from builtins import object
-from past.utils import old_div
 import time, os, sys
-import tkinter
-tk = tkinter
+
+__all__ = ["GraphicsError", "BaseCanvasFrame", "CanvasFrame", "NullCanvas",
+           "RecordingCanvas", "NullCanvasFrame", "RecordingCanvasFrame",
+           "PixmapCanvas", "PixmapCanvasFrame",
+           "Transform", "GraphicsObject", "Point", "Rectangle", "Oval",
+           "Circle", "Line", "Polygon", "Text", "Entry", "Image", "Pixmap",
+           "GraphWin", "Window", "color_rgb", "DEFAULT_CONFIG",
+           "shared_config"]
 
 
 ##########################################################################
@@ -155,38 +158,32 @@ BAD_OPTION = "Illegal option value"
 ############################################################################
 # Graphics classes start here
 
-class CanvasFrame(tk.Frame):
-
-    """A CanvasFrame is a frame for displaying graphics."""
-
-    def __init__(self, parent, width=200, height=200):
+class BaseCanvasFrame(object):
 
-        tk.Frame.__init__(self, parent)
+    """Methods shared by every kind of CanvasFrame. A subclass sets
+    self.canvas to an object with the tk.Canvas methods and calls
+    _setup."""
 
+    def _setup(self, parent, width, height):
         self.parent = parent
-        self.canvas = tk.Canvas(parent, width = width, height = height)
-        self.canvas.pack()
-        parent.resizable(0,0)
         self.foreground = "black"
         self.items = []
         self.mouseX = None
         self.mouseY = None
-        self.canvas.bind("<Button-1>", self._onClick)
         self.height = height
         self.width = width
         self._mouseCallback = None
         self._keyboardCallback = None
         self.trans = None
         self.closed = False
-        parent.lift()
 
-    def __checkOpen(self):
+    def _checkOpen(self):
         if self.closed:
             raise GraphicsError("window is closed")
 
     def setBackground(self, color):
         """Set background color of the window"""
-        self.__checkOpen()
+        self._checkOpen()
         self.canvas.config(bg=color)
 
     def setCoords(self, x1, y1, x2, y2):
@@ -195,61 +192,26 @@ class CanvasFrame(tk.Frame):
         self.trans = Transform(self.width, self.height, x1, y1, x2, y2)
 
     def close(self):
-        if self.closed: return
-        self.__close_help()
-
-    def __close_help(self):
-        """Close the window"""
         self.closed = True
-        self.parent.destroy()
 
     def isClosed(self):
         return self.closed
 
     def plot(self, x, y, color="black"):
         """Set pixel (x,y) to the given color"""
-        self.__checkOpen()
+        self._checkOpen()
         xs,ys = self.toScreen(x,y)
-        self.create_line(xs,ys,xs+1,ys, fill=color)
+        self.canvas.create_line(xs,ys,xs+1,ys, fill=color)
 
     def plotPixel(self, x, y, color="black"):
         """Set pixel raw (independent of window coordinates) pixel
         (x,y) to color"""
-        self.__checkOpen()
-        self.create_line(x,y,x+1,y, fill=color)
+        self._checkOpen()
+        self.canvas.create_line(x,y,x+1,y, fill=color)
 
     def flush(self):
         """Update drawing to the window"""
-        self.__checkOpen()
-        self.update_idletasks()
-
-    def getMouse(self):
-        """Wait for mouse click and return Point object representing
-        the click"""
-        self.mouseX = None
-        self.mouseY = None
-        while self.mouseX == None or self.mouseY == None:
-            self.update()
-            if self.isClosed(): raise GraphicsError("getMouse in closed window")
-            time.sleep(.1) # give up thread
-        x,y = self.toWorld(self.mouseX, self.mouseY)
-        self.mouseX = None
-        self.mouseY = None
-        return Point(x,y)
-
-    def checkMouse(self):
-        """Return last mouse click or None if mouse has
-        not been clicked since last call"""
-        if self.isClosed():
-            raise GraphicsError("checkMouse in closed window")
-        self.update()
-        if self.mouseX != None and self.mouseY != None:
-            x,y = self.toWorld(self.mouseX, self.mouseY)
-            self.mouseX = None
-            self.mouseY = None
-            return Point(x,y)
-        else:
-            return None
+        self._checkOpen()
 
     def getHeight(self):
         """Return the height of the window"""
@@ -283,6 +245,322 @@ class CanvasFrame(tk.Frame):
             self._mouseCallback(Point(e.x, e.y))
 
 
+class NullCanvas(object):
+
+    """Accepts the tk.Canvas calls made by the graphics objects and does
+    nothing. Item ids are still handed out so objects can be drawn,
+    moved and undrawn as usual."""
+
+    def __init__(self):
+        self.lastId = 0
+
+    def _create(self, *args, **kw):
+        self.lastId = self.lastId + 1
+        return self.lastId
+
+    create_rectangle = create_oval = create_line = create_polygon = _create
+    create_text = create_image = create_window = _create
+
+    def _ignore(self, *args, **kw):
+        pass
+
+    move = delete = coords = itemconfig = itemconfigure = _ignore
+    config = configure = pack = bind = tag_raise = tag_lower = _ignore
+
+    def find_all(self):
+        return ()
+
+
+class RecordingCanvas(object):
+
+    """Counts and logs every canvas operation with its arguments before
+    passing it on to target (a NullCanvas by default, or a real
+    tk.Canvas to record a live window).
+
+    counts maps each method name to the number of calls and log holds
+    (name, args, kw) for every call unless log=False is given. The
+    recording wrapper of a method is made on first use and kept as an
+    attribute, so later calls do not come through __getattr__."""
+
+    def __init__(self, target=None, log=True):
+        if target is None:
+            target = NullCanvas()
+        self.target = target
+        self.counts = {}
+        self.log = [] if log else None
+
+    def __getattr__(self, name):
+        attr = getattr(self.target, name)
+        if not callable(attr):
+            return attr
+        counts = self.counts
+        log = self.log
+        def record(*args, **kw):
+            counts[name] = counts.get(name, 0) + 1
+            if log is not None:
+                log.append((name, args, kw))
+            return attr(*args, **kw)
+        setattr(self, name, record)
+        return record
+
+    def total(self):
+        """Returns the number of operations recorded"""
+        return sum(self.counts.values())
+
+    def reset(self):
+        """Forgets the operations recorded so far"""
+        self.counts.clear()
+        if self.log is not None:
+            del self.log[:]
+
+
+class NullCanvasFrame(BaseCanvasFrame):
+
+    """A CanvasFrame that draws nothing and needs no display, for
+    headless runs. Pass a canvas (e.g. a RecordingCanvas) to see the
+    calls that would have been made."""
+
+    def __init__(self, parent=None, width=200, height=200, canvas=None):
+        self._setup(parent, width, height)
+        if canvas is None:
+            canvas = NullCanvas()
+        self.canvas = canvas
+
+
+class RecordingCanvasFrame(NullCanvasFrame):
+
+    """A headless CanvasFrame that records every canvas operation;
+    see RecordingCanvas."""
+
+    def __init__(self, parent=None, width=200, height=200, log=True):
+        NullCanvasFrame.__init__(self, parent, width, height,
+                                 RecordingCanvas(log=log))
+
+
+class PixmapCanvas(object):
+
+    """Stands in for a tk.Canvas and draws the rectangles it is asked to
+    create into pixmap, one image shown on target (the real canvas),
+    instead of making a canvas item for each. Every other kind of item
+    is made on target as usual, so target holds the same few items
+    however many rectangles there are.
+
+    Changes only mark the region they touch as dirty. redraw repaints
+    the dirty regions, one Pixmap.setRegion per band of rows, and is
+    run when Tk is next idle (or by the frame's flush). Rectangle ids
+    are negative so they can't clash with target's item ids."""
+
+    def __init__(self, target, pixmap, background="white"):
+        self.target = target
+        self.pixmap = pixmap
+        self.width = pixmap.getWidth()
+        self.height = pixmap.getHeight()
+        self.background = background
+        self.rects = {}        # id -> [x1, y1, x2, y2, fill, outline, width]
+        self.lastId = 0
+        self.dirty = []        # [x0, y0, x1, y1] regions to repaint
+        self.scheduled = False
+        self._colors = {}
+        self._rows = {}
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+    def create_rectangle(self, x1, y1, x2, y2, options={}, **kw):
+        self.lastId = self.lastId - 1
+        rect = [int(round(x1)), int(round(y1)), int(round(x2)),
+                int(round(y2)), "", "black", 1]
+        self._configure(rect, options, kw)
+        self.rects[self.lastId] = rect
+        self._mark(rect)
+        return self.lastId
+
+    def create_rectangles(self, rects):
+        """Creates a rectangle for each (x1, y1, x2, y2, options) in
+        rects, like create_rectangle, and returns their ids. The region
+        they cover is marked dirty once, so the next redraw repaints it
+        as one band."""
+        ids = []
+        area = [self.width, self.height, 0, 0]
+        for x1, y1, x2, y2, options in rects:
+            self.lastId = self.lastId - 1
+            rect = [int(round(x1)), int(round(y1)), int(round(x2)),
+                    int(round(y2)), "", "black", 1]
+            self._configure(rect, options, {})
+            self.rects[self.lastId] = rect
+            ids.append(self.lastId)
+            low = rect[6] // 2
+            high = rect[6] - low
+            area[0] = min(area[0], rect[0] - low)
+            area[1] = min(area[1], rect[1] - low)
+            area[2] = max(area[2], rect[2] + high)
+            area[3] = max(area[3], rect[3] + high)
+        if ids:
+            self.dirty.append([max(0, area[0]), max(0, area[1]),
+                               min(self.width, area[2]),
+                               min(self.height, area[3])])
+            self._schedule()
+        return ids
+
+    def move(self, item, dx, dy):
+        rect = self.rects.get(item)
+        if rect is None:
+            return self.target.move(item, dx, dy)
+        self._mark(rect)
+        dx = int(round(dx))
+        dy = int(round(dy))
+        rect[0] += dx
+        rect[1] += dy
+        rect[2] += dx
+        rect[3] += dy
+        self._mark(rect)
+
+    def delete(self, *items):
+        others = []
+        for item in items:
+            if item == "all":
+                for rect in self.rects.values():
+                    self._mark(rect)
+                self.rects.clear()
+                others.append(item)
+            elif item in self.rects:
+                self._mark(self.rects.pop(item))
+            else:
+                others.append(item)
+        if others:
+            self.target.delete(*others)
+
+    def itemconfig(self, item, options={}, **kw):
+        rect = self.rects.get(item)
+        if rect is None:
+            return self.target.itemconfig(item, options, **kw)
+        self._configure(rect, options, kw)
+        self._mark(rect)
+
+    itemconfigure = itemconfig
+
+    def config(self, options={}, **kw):
+        settings = dict(options, **kw)
+        if "bg" in settings or "background" in settings:
+            self.background = settings.get("bg", settings.get("background"))
+            self.dirty = [[0, 0, self.width, self.height]]
+            self._schedule()
+        return self.target.config(options, **kw)
+
+    configure = config
+
+    def _configure(self, rect, options, kw):
+        for settings in (options, kw):
+            if "fill" in settings:
+                rect[4] = settings["fill"]
+            if "outline" in settings:
+                rect[5] = settings["outline"]
+            if "width" in settings:
+                rect[6] = int(round(float(settings["width"])))
+
+    def _mark(self, rect):
+        # the outline is centered on the edges of the rectangle
+        x1, y1, x2, y2, fill, outline, width = rect
+        low = width // 2
+        high = width - low
+        self.dirty.append([max(0, x1 - low), max(0, y1 - low),
+                           min(self.width, x2 + high),
+                           min(self.height, y2 + high)])
+        self._schedule()
+
+    def _schedule(self):
+        if self.scheduled:
+            return
+        try:
+            after_idle = self.target.after_idle
+        except AttributeError:
+            return
+        after_idle(self.redraw)
+        self.scheduled = True
+
+    def redraw(self):
+        """Repaints the dirty regions of the image"""
+        self.scheduled = False
+        if not self.dirty:
+            return
+        regions = sorted(self.dirty, key=lambda region: region[1])
+        self.dirty = []
+
+        # merge the regions into bands of rows that don't overlap
+        bands = [regions[0][:]]
+        for x0, y0, x1, y1 in regions[1:]:
+            band = bands[-1]
+            if y0 <= band[3]:
+                band[0] = min(band[0], x0)
+                band[2] = max(band[2], x1)
+                band[3] = max(band[3], y1)
+            else:
+                bands.append([x0, y0, x1, y1])
+
+        for x0, y0, x1, y1 in bands:
+            if x0 >= x1 or y0 >= y1:
+                continue
+            rects = [rect for rect in self.rects.values()
+                     if rect[0] - rect[6] < x1 and rect[2] + rect[6] > x0
+                     and rect[1] - rect[6] < y1 and rect[3] + rect[6] > y0]
+            rows = [self._row(y, x0, x1, rects) for y in range(y0, y1)]
+            self.pixmap.setRegion(x0, y0, x1 - x0, y1 - y0, b"".join(rows))
+
+    def _row(self, y, x0, x1, rects):
+        # the spans of color the rectangles give row y, in drawing order;
+        # rows with the same spans (most rows inside a rectangle) are
+        # formatted once
+        spans = []
+        for x1r, y1r, x2r, y2r, fill, outline, width in rects:
+            low = width // 2
+            high = width - low
+            if outline and width:
+                if y < y1r - low or y >= y2r + high:
+                    continue
+                if y < y1r + high or y >= y2r - low:
+                    spans.append((x1r - low, x2r + high, outline))
+                else:
+                    spans.append((x1r - low, x1r + high, outline))
+                    if fill:
+                        spans.append((x1r + high, x2r - low, fill))
+                    spans.append((x2r - low, x2r + high, outline))
+            elif fill and y1r <= y < y2r:
+                spans.append((x1r, x2r, fill))
+
+        key = (x0, x1, self.background, tuple(spans))
+        row = self._rows.get(key)
+        if row is None:
+            if len(self._rows) > 4096:
+                self._rows.clear()
+            color = self._color
+            pixels = bytearray(color(self.background) * (x1 - x0))
+            for start, end, fill in spans:
+                start = max(start, x0)
+                end = min(end, x1)
+                if start < end:
+                    pixels[(start - x0) * 3:(end - x0) * 3] = \
+                        color(fill) * (end - start)
+            row = self._rows[key] = bytes(pixels)
+        return row
+
+    def _color(self, name):
+        # the r,g,b bytes of a Tk color name
+        value = self._colors.get(name)
+        if value is None:
+            try:
+                r, g, b = self.target.winfo_rgb(name)
+                value = bytes((r >> 8, g >> 8, b >> 8))
+            except AttributeError:
+                # no Tk to ask (a headless target): only #rrggbb is known
+                if name.startswith("#") and len(name) == 7:
+                    value = bytes.fromhex(name[1:])
+                else:
+                    value = bytes(3)
+            self._colors[name] = value
+        return value
+
+
+
 class Transform(object):
 
     """Internal class for 2-D coordinate transformations"""
@@ -300,8 +578,8 @@ class Transform(object):
 
     def screen(self,x,y):
         # Returns x,y in screen (actually window) coordinates
-        xs = old_div((x-self.xbase), self.xscale)
-        ys = old_div((self.ybase-y), self.yscale)
+        xs = (x-self.xbase) / self.xscale
+        ys = (self.ybase-y) / self.yscale
         return int(xs+0.5),int(ys+0.5)
 
     def world(self,xs,ys):
@@ -321,12 +599,58 @@ DEFAULT_CONFIG = {"fill":"",
           "justify":"center",
                   "font": ("helvetica", 12, "normal")}
 
+
+class _SharedConfig(dict):
+
+    """A read-only configuration dictionary shared by every object made
+    with the same options and settings. An object gets a copy of its own
+    the first time one of its options is changed (see _reconfig)."""
+
+    def _readonly(self, *args, **kw):
+        raise GraphicsError("Shared configuration can't be changed")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = _readonly
+    setdefault = update = _readonly
+
+    def copy(self):
+        return self
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (_SharedConfig, (dict(self),))
+
+_shared_configs = {}
+
+def shared_config(options, **settings):
+    """Returns the shared, read-only configuration holding the default
+    value of each of options, with settings overriding some of them.
+    Setting values must be hashable."""
+    key = (tuple(options), tuple(sorted(settings.items())))
+    config = _shared_configs.get(key)
+    if config is None:
+        values = {}
+        for option in options:
+            values[option] = DEFAULT_CONFIG[option]
+        values.update(settings)
+        config = _shared_configs[key] = _SharedConfig(values)
+    return config
+
+
 class GraphicsObject(object):
 
     """Generic base class for all of the drawable objects"""
     # A subclass of GraphicsObject should override _draw and
     #   and _move methods.
 
+    # Objects with many instances (points and rectangles) keep their
+    # attributes in slots rather than in a per-instance dictionary.
+    __slots__ = ("canvas_frame", "id", "config")
+
     def __init__(self, options):
         # options is a list of strings indicating which options are
         # legal for this object.
@@ -337,11 +661,10 @@ class GraphicsObject(object):
         self.canvas_frame = None
         self.id = None
 
-        # config is the dictionary of configuration options for the widget.
-        config = {}
-        for option in options:
-            config[option] = DEFAULT_CONFIG[option]
-        self.config = config
+        # config is the dictionary of configuration options for the
+        # widget. It starts out shared with every other object with the
+        # same options and is copied before it is first changed.
+        self.config = shared_config(options)
 
     def setFill(self, color):
         """Set interior color to color"""
@@ -388,8 +711,8 @@ class GraphicsObject(object):
         if canvas_frame and not canvas_frame.isClosed():
             trans = canvas_frame.trans
             if trans:
-                x = old_div(dx, trans.xscale)
-                y = old_div(-dy, trans.yscale)
+                x = dx / trans.xscale
+                y = -dy / trans.yscale
             else:
                 x = dx
                 y = dy
@@ -399,9 +722,11 @@ class GraphicsObject(object):
         # Internal method for changing configuration of the object
         # Raises an error if the option does not exist in the config
         #    dictionary for this object
-        if option not in self.config:
-            raise GraphicsError(UNSUPPORTED_METHOD)
         options = self.config
+        if option not in options:
+            raise GraphicsError(UNSUPPORTED_METHOD)
+        if type(options) is _SharedConfig:
+            options = self.config = dict(options)
         options[option] = setting
         if self.canvas_frame and not self.canvas_frame.isClosed():
             self.canvas_frame.canvas.itemconfig(self.id, options)
@@ -416,9 +741,11 @@ class GraphicsObject(object):
         pass # must override in subclass
 
 class Point(GraphicsObject):
+
+    __slots__ = ("x", "y")
+
     def __init__(self, x, y):
         GraphicsObject.__init__(self, ["outline", "fill"])
-        self.setFill = self.setOutline
         self.x = x
         self.y = y
 
@@ -435,6 +762,9 @@ class Point(GraphicsObject):
         other.config = self.config.copy()
         return other
 
+    # a point is drawn as a single pixel, so its fill is its outline
+    setFill = GraphicsObject.setOutline
+
     def getX(self): return self.x
     def getY(self): return self.y
 
@@ -442,6 +772,8 @@ class _BBox(GraphicsObject):
     # Internal base class for objects represented by bounding box
     # (opposite corners) Line segment is a degenerate case.
 
+    __slots__ = ("p1", "p2")
+
     def __init__(self, p1, p2, options=["outline","width","fill"]):
         GraphicsObject.__init__(self, options)
         self.p1 = p1.clone()
@@ -464,6 +796,8 @@ class _BBox(GraphicsObject):
 
 class Rectangle(_BBox):
 
+    __slots__ = ()
+
     def __init__(self, p1, p2):
         _BBox.__init__(self, p1, p2)
 
@@ -516,8 +850,8 @@ class Line(_BBox):
 
     def __init__(self, p1, p2):
         _BBox.__init__(self, p1, p2, ["arrow","fill","width"])
-        self.setFill(DEFAULT_CONFIG['outline'])
-        self.setOutline = self.setFill
+        self.config = shared_config(["arrow","fill","width"],
+                                    fill=DEFAULT_CONFIG['outline'])
 
     def clone(self):
         other = Line(self.p1, self.p2)
@@ -536,6 +870,9 @@ class Line(_BBox):
             raise GraphicsError(BAD_OPTION)
         self._reconfig("arrow", option)
 
+    # a line has no interior, so its outline is its fill
+    setOutline = GraphicsObject.setFill
+
 
 class Polygon(GraphicsObject):
 
@@ -559,22 +896,22 @@ class Polygon(GraphicsObject):
             p.move(dx,dy)
 
     def _draw(self, canvas_frame, options):
-        args = [canvas_frame.canvas]
+        args = []
         for p in self.points:
             x,y = canvas_frame.toScreen(p.x,p.y)
             args.append(x)
             args.append(y)
         args.append(options)
-        return tk.Canvas.create_polygon(*args)
+        return canvas_frame.canvas.create_polygon(*args)
 
 class Text(GraphicsObject):
 
         def __init__(self, p, text):
             GraphicsObject.__init__(self, ["justify","fill","text","font"])
+            self.config = shared_config(["justify","fill","text","font"],
+                                        fill=DEFAULT_CONFIG['outline'])
             self.setText(text)
             self.anchor = p.clone()
-            self.setFill(DEFAULT_CONFIG['outline'])
-            self.setOutline = self.setFill
 
         def _draw(self, canvas_frame, options):
             p = self.anchor
@@ -623,11 +960,14 @@ class Text(GraphicsObject):
             #self.config['fg'] = color;
             self.setFill(color)
 
+        setOutline = GraphicsObject.setFill
+
 
 class Entry(GraphicsObject):
 
     def __init__(self, canvas_frame, p, width):
         GraphicsObject.__init__(self, [])
+        _load_tk()
         self.anchor = p.clone()
         #print self.anchor
         self.width = width
@@ -667,7 +1007,7 @@ class Entry(GraphicsObject):
 
     def __clone_help(self, other):
         other.config = self.config.copy()
-        other.text = tk.StringVar()
+        other.text = _load_tk().StringVar()
         other.text.set(self.text.get())
         other.fill = self.fill
         return other
@@ -722,7 +1062,7 @@ class Image(GraphicsObject):
         self.imageId = Image.idCount
         Image.idCount = Image.idCount + 1
         if type(pixmap) == type(""):
-            self.img = tk.PhotoImage(file=pixmap, master=_root)
+            self.img = _load_tk().PhotoImage(file=pixmap)
         else:
             self.img = pixmap.image
 
@@ -759,19 +1099,20 @@ class Pixmap(object):
 
        pic = Pixmap(512, 512)
 
-
+    getPixel and setPixel make a Tk call per pixel; getRegion and
+    setRegion move a whole rectangle of pixels, as r,g,b bytes, in one.
     """
 
     def __init__(self, *args):
+        _load_tk()
         if len(args) == 1: # a file name or pixmap
             if type(args[0]) == type(""):
-                self.image = tk.PhotoImage( file=args[0], master=_root)
+                self.image = tk.PhotoImage( file=args[0])
             else:
                 self.image = args[0]
         else: # arguments are width and height
             width, height = args
-            self.image = tk.PhotoImage( master=_root,
-                                width=width, height=height)
+            self.image = tk.PhotoImage( width=width, height=height)
 
     def getWidth(self):
         """Returns the width of the image in pixels"""
@@ -801,6 +1142,57 @@ class Pixmap(object):
         (r,g,b) = xxx_todo_changeme
         self.image.put( "{%s}"%color_rgb(r,g,b), (x, y))
 
+    def getRegion(self, x, y, width, height, out=None):
+        """Returns the pixels of the width x height region whose top left
+        corner is (x,y) as bytes: r,g,b for each pixel, row by row. If
+        out is given (a writable buffer such as a bytearray, an array or
+        a NumPy uint8 array of width*height*3 bytes) the pixels are
+        copied into it instead, and it is returned.
+
+        The whole region is read with one call to Tk."""
+        image = self.image
+        try:
+            data = image.tk.call(image.name, "data", "-format", "ppm",
+                                 "-from", x, y, x + width, y + height)
+            if isinstance(data, str):
+                data = data.encode("latin-1")
+            pixels = _ppm_pixels(data)
+        except tk.TclError:
+            pixels = self._colorRegion(x, y, width, height)
+        if len(pixels) != width * height * 3:
+            raise GraphicsError("region extends outside the image")
+        if out is None:
+            return pixels
+        view = memoryview(out).cast("B")
+        if len(view) != len(pixels):
+            raise GraphicsError("buffer size doesn't match the region")
+        view[:] = pixels
+        return out
+
+    def _colorRegion(self, x, y, width, height):
+        # getRegion without PPM support: reads the pixels as the color
+        # strings of Tk's default data format
+        image = self.image
+        rows = image.tk.splitlist(image.tk.call(
+            image.name, "data", "-from", x, y, x + width, y + height))
+        return bytes.fromhex("".join(
+            "".join(image.tk.splitlist(row)).replace("#", "")
+            for row in rows))
+
+    def setRegion(self, x, y, width, height, data):
+        """Sets the pixels of the width x height region whose top left
+        corner is (x,y) from data: bytes, a bytearray, an array or a
+        NumPy uint8 array holding r,g,b for each pixel, row by row.
+
+        The whole region is written with one call to Tk."""
+        pixels = memoryview(data).cast("B")
+        if len(pixels) != width * height * 3:
+            raise GraphicsError("data size doesn't match the region")
+        header = ("P6\n%d %d\n255\n" % (width, height)).encode("ascii")
+        image = self.image
+        image.tk.call(image.name, "put", header + pixels.tobytes(),
+                      "-format", "ppm", "-to", x, y)
+
     def clone(self):
         """Returns a copy of this Pixmap"""
         return Pixmap(self.image.copy())
@@ -816,40 +1208,161 @@ class Pixmap(object):
         self.image.write( filename, format=ext)
 
 
+def _ppm_pixels(data):
+    # the pixel bytes of binary PPM (P6) data with a maximum value of 255
+    fields = []
+    start = 2
+    while len(fields) < 3:
+        while data[start:start + 1].isspace():
+            start = start + 1
+        end = start
+        while not data[end:end + 1].isspace():
+            end = end + 1
+        fields.append(int(data[start:end]))
+        start = end
+    if data[:2] != b"P6" or fields[2] != 255:
+        raise GraphicsError("unsupported PPM data")
+    return data[start + 1:]
+
+
 def color_rgb(r,g,b):
     """r,g,b are intensities of red, green, and blue in range(256)
     Returns color specifier string for the resulting color"""
     return "#%02x%02x%02x" % (r,g,b)
 
-class GraphWin(CanvasFrame):
-    def __init__(self, title, width=200, height=200):
-        self.root = tk.Tk()
-        self.root.title(title)
-        CanvasFrame.__init__(self, self.root, width, height)
-        self.root.protocol("WM_DELETE_WINDOW", self.__close_help)
-        self.root.config(bg = "dark gray")
+##########################################################################
+# Tk widget classes
+#
+# tkinter is only imported, and CanvasFrame, PixmapCanvasFrame, GraphWin
+# and Window (which derive from Tk widgets) only defined, when one of them
+# is first used, so the drawable objects and the headless canvas frames
+# can be used without loading Tk at all. tk (the tkinter module) is not
+# bound until then either, so graphics.tk loads it like the classes.
+
+_TK_NAMES = ("tk", "CanvasFrame", "PixmapCanvasFrame", "GraphWin", "Window")
+
+def _load_tk():
+    """Imports tkinter and defines the Tk widget classes, once.
+    Returns the tkinter module."""
+    global tk, CanvasFrame, PixmapCanvasFrame, GraphWin, Window
+    if "tk" in globals():
+        return tk
+    import tkinter
+    tk = tkinter
+
+    class CanvasFrame(BaseCanvasFrame, tk.Frame):
+
+        """A CanvasFrame is a frame for displaying graphics."""
+
+        def __init__(self, parent, width=200, height=200):
+
+            tk.Frame.__init__(self, parent)
+
+            self._setup(parent, width, height)
+            self.canvas = tk.Canvas(parent, width = width, height = height)
+            self.canvas.pack()
+            parent.resizable(0,0)
+            self.canvas.bind("<Button-1>", self._onClick)
+            parent.lift()
+
+        def close(self):
+            if self.closed: return
+            self.__close_help()
+
+        def __close_help(self):
+            """Close the window"""
+            self.closed = True
+            self.parent.destroy()
+
+        def flush(self):
+            """Update drawing to the window"""
+            self._checkOpen()
+            self.update_idletasks()
+
+        def getMouse(self):
+            """Wait for mouse click and return Point object representing
+            the click"""
+            self.mouseX = None
+            self.mouseY = None
+            while self.mouseX == None or self.mouseY == None:
+                self.update()
+                if self.isClosed(): raise GraphicsError("getMouse in closed window")
+                time.sleep(.1) # give up thread
+            x,y = self.toWorld(self.mouseX, self.mouseY)
+            self.mouseX = None
+            self.mouseY = None
+            return Point(x,y)
+
+        def checkMouse(self):
+            """Return last mouse click or None if mouse has
+            not been clicked since last call"""
+            if self.isClosed():
+                raise GraphicsError("checkMouse in closed window")
+            self.update()
+            if self.mouseX != None and self.mouseY != None:
+                x,y = self.toWorld(self.mouseX, self.mouseY)
+                self.mouseX = None
+                self.mouseY = None
+                return Point(x,y)
+            else:
+                return None
+
+    class PixmapCanvasFrame(CanvasFrame):
+
+        """A CanvasFrame that draws rectangles into a single image
+        rather than as canvas items of their own (see PixmapCanvas)."""
+
+        def __init__(self, parent, width=200, height=200):
+            CanvasFrame.__init__(self, parent, width, height)
+            self.pixmap = Pixmap(width, height)
+            self.image = Image(Point(width / 2, height / 2), self.pixmap)
+            self.image.draw(self)
+            self.canvas = PixmapCanvas(self.canvas, self.pixmap)
+
+        def flush(self):
+            """Update drawing to the window"""
+            self.canvas.redraw()
+            CanvasFrame.flush(self)
+
+    class GraphWin(CanvasFrame):
+        def __init__(self, title, width=200, height=200):
+            self.root = tk.Tk()
+            self.root.title(title)
+            CanvasFrame.__init__(self, self.root, width, height)
+            self.root.protocol("WM_DELETE_WINDOW", self.__close_help)
+            self.root.config(bg = "dark gray")
+
+        def mainloop(self):
+            self.root.mainloop()
+
+        def __close_help(self):
+            """Close the window"""
+            self.root.destroy()
 
-    def mainloop(self):
-        self.root.mainloop()
+    class Window(tk.Tk):
+        def __init__(self, title):
+            tk.Tk.__init__(self)
+            self.title(title)
+            self.config(bg = "dark gray")
+            self.protocol("WM_DELETE_WINDOW", self.__close_help)
 
-    def __close_help(self):
-        """Close the window"""
-        self.root.destroy()
+        def __close_help(self):
+            """Close the window"""
+            self.destroy()
 
-class Window(tk.Tk):
-    def __init__(self, title):
-        tk.Tk.__init__(self)
-        self.title(title)
-        self.config(bg = "dark gray")
-        self.protocol("WM_DELETE_WINDOW", self.__close_help)
+    return tk
 
-    def __close_help(self):
-        """Close the window"""
-        self.destroy()
+def __getattr__(name):
+    # module attribute hook (PEP 562): the Tk names are loaded on first use
+    if name in _TK_NAMES:
+        _load_tk()
+        return globals()[name]
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 def test():
 
+    _load_tk()
     #win = CanvasFrame(_root)
     win = GraphWin("Test")
     win.setCoords(0,0,10,10)
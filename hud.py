@@ -0,0 +1,176 @@
+'''
+hud.py
+
+Performance overlay for the tetris board (press H in the game).
+
+Shows, over the last few hundred ticks:
+    frame - time spent handling a key press or gravity tick
+    input - time from a key press until the canvas has been redrawn
+    drift - how late each gravity tick (Tetris.animate_shape) fired
+    ops   - canvas operations made per tick
+
+The handlers only store raw samples in preallocated rolling windows; the
+percentiles are worked out and the text redrawn every REFRESH
+milliseconds, so the overlay adds very little to what it measures.
+
+@author chindesaurus
+'''
+import time
+
+from graphics import Text, Point, RecordingCanvas
+
+
+class RollingWindow(object):
+    ''' RollingWindow class: the last size samples of a measurement
+        Attributes: samples - type:list - preallocated sample storage
+                    count - type:int - number of samples stored so far
+    '''
+
+    def __init__(self, size):
+        self.samples = [0.0] * size
+        self.count = 0
+
+    def add(self, value):
+        self.samples[self.count % len(self.samples)] = value
+        self.count += 1
+
+    def values(self):
+        return self.samples[:min(self.count, len(self.samples))]
+
+    def percentiles(self, *ps):
+        ''' Returns the given percentiles (0-100) of the stored samples,
+            or None for each if there are no samples yet.
+        '''
+        values = sorted(self.values())
+        if not values:
+            return [None] * len(ps)
+        return [values[min(len(values) - 1, int(len(values) * p / 100.0))]
+                for p in ps]
+
+
+class PerfHUD(object):
+    ''' PerfHUD class: the performance overlay for a game
+        Attributes: game - type:Tetris - the game being measured
+                    visible - type:bool - whether the overlay is shown
+                    frames, inputs, drift, ops - type:RollingWindow
+                    recorder - type:RecordingCanvas - counts the canvas
+                    operations while the overlay is shown, or None
+    '''
+
+    SAMPLES = 240
+    REFRESH = 500 # milliseconds
+
+    def __init__(self, game):
+        self.game = game
+        self.visible = False
+        self.frames = RollingWindow(self.SAMPLES)
+        self.inputs = RollingWindow(self.SAMPLES)
+        self.drift = RollingWindow(self.SAMPLES)
+        self.ops = RollingWindow(self.SAMPLES)
+        self.gravity_due = None
+        self.timer = None
+        self.recorder = None
+        # whether the recorder was put in front of the canvas by the
+        # overlay, and is taken out again when it is hidden
+        self.wrapped = False
+
+        frame = game.board.canvas
+        self.text = Text(Point(frame.getWidth() / 2, 40), '')
+        self.text.setSize(9)
+        self.text.setFace('courier')
+
+
+    def toggle(self):
+        ''' Shows the overlay if it is hidden and hides it otherwise.
+        '''
+        self.visible = not self.visible
+        frame = self.game.board.canvas
+        if self.visible:
+            # count canvas operations by passing them through a recorder,
+            # only while the counts are shown
+            if isinstance(frame.canvas, RecordingCanvas):
+                self.recorder = frame.canvas
+            else:
+                self.recorder = RecordingCanvas(frame.canvas, log=False)
+                frame.canvas = self.recorder
+                self.wrapped = True
+            self.gravity_due = None
+            self.text.draw(frame)
+            self.refresh()
+        else:
+            self.game.win.after_cancel(self.timer)
+            self.text.undraw()
+            if self.wrapped:
+                frame.canvas = self.recorder.target
+                self.wrapped = False
+            self.recorder = None
+
+
+    def begin(self):
+        ''' Called when a tick starts. Returns a token for end.
+        '''
+        recorder = self.recorder
+        return (time.perf_counter(),
+                recorder.total() if recorder is not None else None)
+
+
+    def end(self, token):
+        ''' Called when a tick ends with the token from begin. A tick
+            that began while the overlay was hidden is not counted.
+        '''
+        start, ops = token
+        if not self.visible or ops is None:
+            return
+        self.frames.add(time.perf_counter() - start)
+        self.ops.add(self.recorder.total() - ops)
+
+
+    def end_input(self, token):
+        ''' Called when a key press has been handled. The latency is taken
+            when Tk goes idle, after the canvas has been redrawn.
+        '''
+        self.end(token)
+        if self.visible:
+            self.game.win.after_idle(self._drawn, token[0])
+
+
+    def _drawn(self, start):
+        self.inputs.add(time.perf_counter() - start)
+
+
+    def begin_gravity(self):
+        ''' Called when a gravity tick starts: records how late it is.
+        '''
+        token = self.begin()
+        if self.visible and self.gravity_due is not None:
+            self.drift.add(token[0] - self.gravity_due)
+        return token
+
+
+    def end_gravity(self, token, moved=True):
+        ''' Called when a gravity tick ends, before the next one is
+            scheduled. Ticks in which no row was due (moved False) only
+            count towards the drift.
+        '''
+        if moved:
+            self.end(token)
+        self.gravity_due = time.perf_counter() + self.game.FRAME_MS / 1000.0
+
+
+    def refresh(self):
+        ''' Redraws the overlay text from the stored samples.
+        '''
+        self.text.setText('\n'.join([
+            'frame %s ms' % _summary(self.frames, 1000),
+            'input %s ms' % _summary(self.inputs, 1000),
+            'drift %s ms' % _summary(self.drift, 1000),
+            'ops   %s' % _summary(self.ops, 1)]))
+        self.timer = self.game.win.after(self.REFRESH, self.refresh)
+
+
+def _summary(window, scale):
+    p50, p95, top = window.percentiles(50, 95, 100)
+    if p50 is None:
+        return '-'
+    return 'p50 %6.2f p95 %6.2f max %6.2f' % (p50 * scale, p95 * scale,
+                                             top * scale)
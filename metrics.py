@@ -0,0 +1,218 @@
+'''
+metrics.py
+
+Gameplay and engine metrics for tetris games, flushed to a local file.
+
+A Metrics object keeps counters and histograms in preallocated arrays.
+Attach it to one or more games (game.metrics = metrics) and they record
+pieces locked, lines cleared by size, tick durations, the highest stack
+and completed games. Recording only updates array slots; a
+MetricsFlusher thread periodically writes everything out, either in the
+Prometheus text format (replacing the file, as the node_exporter
+textfile collector expects) or as one JSON object per line.
+
+    metrics = Metrics()
+    flusher = MetricsFlusher(metrics, 'tetris.prom', interval=10)
+    flusher.start()
+    ...
+    flusher.stop()
+
+@author chindesaurus
+'''
+import bisect
+import json
+import os
+import threading
+import time
+from array import array
+
+
+# counter slots
+PIECES_LOCKED = 0
+GAMES_COMPLETED = 1
+TICKS = 2
+
+MAX_LINES = 4
+
+
+class Metrics(object):
+    ''' Metrics class: counters and histograms for tetris games
+        Attributes: counters - type:array - indexed by the slot constants
+                    lines - type:array - line clears, indexed by rows cleared
+                    tick_buckets - type:array - tick duration histogram counts
+                    tick_sum - type:array - total tick duration in seconds
+                    max_stack_height - type:array - highest stack seen, in rows
+                    start - type:float - when recording started
+    '''
+
+    # upper bounds in seconds of the tick duration histogram buckets
+    TICK_BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25)
+
+    def __init__(self):
+        self.counters = array('q', [0] * 3)
+        self.lines = array('q', [0] * (MAX_LINES + 1))
+        self.tick_buckets = array('q', [0] * (len(self.TICK_BOUNDS) + 1))
+        self.tick_sum = array('d', [0.0])
+        self.max_stack_height = array('q', [0])
+        self.start = time.time()
+
+
+    def piece_locked(self, lines, stack_height):
+        ''' Parameters: lines - type:int - rows the piece completed
+                        stack_height - type:int - the height of the stack
+                        with the piece locked, before its rows are cleared
+
+            Records a piece lock and the line clear it caused.
+        '''
+        self.counters[PIECES_LOCKED] += 1
+        if lines:
+            self.lines[min(lines, MAX_LINES)] += 1
+        if stack_height > self.max_stack_height[0]:
+            self.max_stack_height[0] = stack_height
+
+
+    def tick(self, seconds):
+        ''' Records how long a tick (a key press or gravity step) took.
+        '''
+        self.counters[TICKS] += 1
+        self.tick_buckets[bisect.bisect_left(self.TICK_BOUNDS, seconds)] += 1
+        self.tick_sum[0] += seconds
+
+
+    def game_completed(self):
+        self.counters[GAMES_COMPLETED] += 1
+
+
+    def merge(self, values):
+        ''' Parameters: values - type: dict - from Metrics.snapshot, e.g.
+                        of a game played in another process
+
+            Adds the counts and histograms in values to these metrics.
+        '''
+        self.counters[PIECES_LOCKED] += values['pieces_locked']
+        self.counters[GAMES_COMPLETED] += values['games_completed']
+        self.counters[TICKS] += values['ticks']
+        for n in range(1, MAX_LINES + 1):
+            self.lines[n] += values['lines_cleared'][str(n)]
+        for i, count in enumerate(values['tick_seconds_buckets']):
+            self.tick_buckets[i] += count
+        self.tick_sum[0] += values['tick_seconds_sum']
+        if values['max_stack_height'] > self.max_stack_height[0]:
+            self.max_stack_height[0] = values['max_stack_height']
+
+
+    def snapshot(self):
+        ''' Return value: type: dict
+
+            Copies the current values into plain Python objects.
+        '''
+        now = time.time()
+        return {'time': now,
+                'uptime_seconds': now - self.start,
+                'pieces_locked': self.counters[PIECES_LOCKED],
+                'games_completed': self.counters[GAMES_COMPLETED],
+                'lines_cleared': dict((str(n), self.lines[n])
+                                      for n in range(1, MAX_LINES + 1)),
+                'max_stack_height': self.max_stack_height[0],
+                'ticks': self.counters[TICKS],
+                'tick_seconds_sum': self.tick_sum[0],
+                'tick_seconds_buckets': list(self.tick_buckets)}
+
+
+############################################################
+# OUTPUT FORMATS
+############################################################
+
+def prometheus_text(values, pieces_per_second):
+    ''' Parameters: values - type: dict - from Metrics.snapshot
+                    pieces_per_second - type: float
+        Return value: type: string
+
+        Formats a snapshot in the Prometheus text exposition format.
+    '''
+    lines = [
+        '# TYPE tetris_pieces_locked_total counter',
+        'tetris_pieces_locked_total %d' % values['pieces_locked'],
+        '# TYPE tetris_games_completed_total counter',
+        'tetris_games_completed_total %d' % values['games_completed'],
+        '# TYPE tetris_lines_cleared_total counter']
+    for size, count in sorted(values['lines_cleared'].items()):
+        lines.append('tetris_lines_cleared_total{size="%s"} %d' % (size, count))
+    lines += [
+        '# TYPE tetris_pieces_per_second gauge',
+        'tetris_pieces_per_second %g' % pieces_per_second,
+        '# TYPE tetris_max_stack_height gauge',
+        'tetris_max_stack_height %d' % values['max_stack_height'],
+        '# TYPE tetris_tick_duration_seconds histogram']
+    total = 0
+    buckets = values['tick_seconds_buckets']
+    for bound, count in zip(Metrics.TICK_BOUNDS, buckets):
+        total += count
+        lines.append('tetris_tick_duration_seconds_bucket{le="%g"} %d' %
+                     (bound, total))
+    lines += [
+        'tetris_tick_duration_seconds_bucket{le="+Inf"} %d' % values['ticks'],
+        'tetris_tick_duration_seconds_sum %g' % values['tick_seconds_sum'],
+        'tetris_tick_duration_seconds_count %d' % values['ticks']]
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsFlusher(threading.Thread):
+    ''' MetricsFlusher class: a background thread writing metrics out
+        Attributes: metrics - type:Metrics
+                    path - type:string - the output file
+                    interval - type:float - seconds between flushes
+                    format - type:string - 'prometheus' or 'jsonl'; by
+                    default JSON lines for a .jsonl file and prometheus
+                    otherwise
+    '''
+
+    def __init__(self, metrics, path, interval=10.0, format=None):
+        threading.Thread.__init__(self, name='metrics-flusher')
+        self.daemon = True
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        if format is None:
+            format = 'jsonl' if path.endswith('.jsonl') else 'prometheus'
+        if format not in ('prometheus', 'jsonl'):
+            raise ValueError('unknown metrics format %r' % format)
+        self.format = format
+        self._stopped = threading.Event()
+        self._last = None
+
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+
+    def stop(self):
+        ''' Stops the thread and writes the final values. '''
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+        self.flush()
+
+
+    def flush(self):
+        values = self.metrics.snapshot()
+
+        # pieces per second since the last flush
+        last = self._last or {'time': self.metrics.start, 'pieces_locked': 0}
+        elapsed = values['time'] - last['time']
+        rate = 0.0
+        if elapsed > 0:
+            rate = (values['pieces_locked'] - last['pieces_locked']) / elapsed
+        self._last = values
+
+        if self.format == 'jsonl':
+            values = dict(values, pieces_per_second=rate)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(values, sort_keys=True) + '\n')
+        else:
+            temp = self.path + '.tmp'
+            with open(temp, 'w') as f:
+                f.write(prometheus_text(values, rate))
+            os.replace(temp, self.path)
@@ -0,0 +1,278 @@
+'''
+movegen.py
+
+Reachable move generator for tetris pieces.
+
+Runs a breadth first search over the (x, y, rotation) states a piece can
+reach from its spawn position using the same move and rotate rules as
+tetris.Shape, so placements that need a tuck under an overhang or a spin
+in place are found as well as plain drops.
+
+Usage: python movegen.py [depth]
+
+Runs the perft benchmark: counts the placements reachable to the given
+depth (default 2) on a few fixed test boards and checks them against
+known counts.
+
+@author chindesaurus
+'''
+import sys
+import time
+
+from snapshot import Snapshot
+from tetris import Tetris, Shape, Point, I_shape, J_shape, L_shape, \
+                   O_shape, S_shape, T_shape, Z_shape
+
+
+# the inputs the search tries, named like the keys in Tetris.key_pressed
+MOVES = (('Left', -1, 0), ('Right', 1, 0), ('Down', 0, 1))
+ROTATE = 'Up'
+
+
+############################################################
+# PIECE DESCRIPTIONS
+############################################################
+
+class Piece(object):
+    ''' Piece class:
+        The parts of a Shape that the search needs, without any drawing.
+        Attributes: cells - type: tuple - (x, y) of each block, in block order
+                    rotation_dir - type: int - the rotation direction at spawn
+                    shift_rotation_dir - type: bool - whether the direction flips
+                    rotates - type: bool - False for shapes that never rotate
+                    color - type: string - the fill color of the blocks
+    '''
+
+    def __init__(self, shape):
+        self.cells = tuple((block.x, block.y) for block in shape.get_blocks())
+        self.rotation_dir = shape.rotation_dir
+        self.shift_rotation_dir = shape.shift_rotation_dir
+        self.rotates = type(shape).rotate is Shape.rotate
+        self.color = shape.get_blocks()[0].config['fill']
+
+
+_spawn_cache = {}
+
+def spawn_piece(shape_class, width=Tetris.BOARD_WIDTH):
+    ''' Parameters: shape_class - type: Shape subclass
+                    width - type: int - the board width
+        Return value: type: Piece
+
+        Returns the piece a Tetris game would spawn for shape_class,
+        centered like Tetris.create_new_shape does.
+    '''
+    key = (shape_class, width)
+    if key not in _spawn_cache:
+        shape = shape_class(Point(width // 2, 0))
+        _spawn_cache[key] = Piece(shape)
+    return _spawn_cache[key]
+
+
+def rotated(cells, rot_dir):
+    ''' Parameters: cells - type: tuple of (x, y)
+                    rot_dir - type: int
+        Return value: type: tuple of (x, y)
+
+        Returns the cells after a rotation about the second block,
+        exactly as Shape.rotate computes it.
+    '''
+    cx, cy = cells[1]
+    return tuple((cx - rot_dir * cy + rot_dir * y,
+                  cy + rot_dir * cx - rot_dir * x) for x, y in cells)
+
+
+############################################################
+# SEARCH
+############################################################
+
+def search(can_move, width, height, piece):
+    ''' Parameters: can_move - type: function(x, y) -> bool
+                    width - type: int
+                    height - type: int
+                    piece - type: Piece
+        Return value: type: list of (cells, path)
+
+        Finds every lock position reachable from the piece's spawn state.
+        cells is a sorted tuple of the (x, y) squares the piece locks into
+        and path is the shortest list of keys that gets it there (the
+        piece locks on the next 'Down' after the path).
+
+        A state is the piece's cells plus its current rotation direction.
+        Visited states are kept in a bitset indexed by the position of the
+        center block, an orientation number and the rotation direction.
+    '''
+    start = piece.cells
+    for x, y in start:
+        if not can_move(x, y):
+            return []
+
+    # orientations are numbered as they are found, by the offsets of the
+    # blocks from the center block
+    orientations = {}
+    area = width * height
+    visited = bytearray()
+
+    def mark(cells, rot_dir):
+        cx, cy = cells[1]
+        shape = tuple((x - cx, y - cy) for x, y in cells)
+        orient = orientations.get(shape)
+        if orient is None:
+            orient = orientations[shape] = len(orientations)
+            visited.extend(bytes(2 * area))
+        index = ((orient * 2 + (rot_dir > 0)) * height + cy) * width + cx
+        if visited[index]:
+            return False
+        visited[index] = 1
+        return True
+
+    def fits(cells):
+        for x, y in cells:
+            if not can_move(x, y):
+                return False
+        return True
+
+    mark(start, piece.rotation_dir)
+    queue = [(start, piece.rotation_dir, None)]
+    locks = {}
+    placements = []
+    head = 0
+    while head < len(queue):
+        state = queue[head]
+        head += 1
+        cells, rot_dir, _ = state
+
+        for key, dx, dy in MOVES:
+            moved = tuple((x + dx, y + dy) for x, y in cells)
+            if fits(moved):
+                if mark(moved, rot_dir):
+                    queue.append((moved, rot_dir, (key, state)))
+            elif dy:
+                final = tuple(sorted(cells))
+                if final not in locks:
+                    locks[final] = True
+                    placements.append((final, state))
+
+        if piece.rotates:
+            new_cells = rotated(cells, rot_dir)
+            if not fits(new_cells):
+                new_cells = cells
+            new_dir = -rot_dir if piece.shift_rotation_dir else rot_dir
+            if mark(new_cells, new_dir):
+                queue.append((new_cells, new_dir, (ROTATE, state)))
+
+    return [(final, _path(state)) for final, state in placements]
+
+
+def _path(state):
+    # walk the parent links back to the spawn state
+    keys = []
+    link = state[2]
+    while link is not None:
+        keys.append(link[0])
+        link = link[1][2]
+    keys.reverse()
+    return keys
+
+
+def reachable_placements(board, shape):
+    ''' Parameters: board - type: Board
+                    shape - type: Shape
+        Return value: type: list of (cells, path)
+
+        Returns every lock position the shape can reach on the board
+        from where it is now, with the keys that get it there.
+    '''
+    return search(board.can_move, board.width, board.height, Piece(shape))
+
+
+############################################################
+# PERFT
+############################################################
+
+def perft(snapshot, pieces, depth):
+    ''' Parameters: snapshot - type: Snapshot
+                    pieces - type: list of Shape subclasses, used in turn
+                    depth - type: int
+        Return value: type: int
+
+        Counts the boards reachable by placing depth pieces, like the
+        perft node count of a chess move generator.
+    '''
+    if depth == 0:
+        return 1
+    width = snapshot.width
+    piece = spawn_piece(pieces[0], width)
+    placements = search(snapshot.can_move, width, snapshot.height, piece)
+    if depth == 1:
+        return len(placements)
+    rest = pieces[1:] + pieces[:1]
+    total = 0
+    for cells, _ in placements:
+        child, _ = snapshot.place(cells, piece.color)
+        total += perft(child, rest, depth - 1)
+    return total
+
+
+def parse_board(rows):
+    ''' Parameters: rows - type: list of strings, '#' for a block
+        Return value: type: Snapshot
+
+        Builds a standard size board from rows drawn bottom aligned.
+    '''
+    return Snapshot.from_rows(rows, Tetris.BOARD_WIDTH, Tetris.BOARD_HEIGHT)
+
+
+# fixed boards for the perft benchmark
+TEST_BOARDS = {
+    'empty': [],
+    'overhang': ['...###....',
+                 '.......##.',
+                 '#.#######.',
+                 '##.######.'],
+    'tspin': ['##...#####',
+              '#...######',
+              '##.#######'],
+    'well': ['#########.',
+             '#########.',
+             '##.######.',
+             '#########.'],
+}
+
+TEST_PIECES = [T_shape, I_shape, S_shape, L_shape, O_shape, Z_shape, J_shape]
+
+# known perft counts: {board: [depth 1, depth 2, ...]}
+EXPECTED = {
+    'empty': [34, 596, 10632],
+    'overhang': [35, 708, 12606],
+    'tspin': [37, 641, 11707],
+    'well': [34, 595, 10612],
+}
+
+
+def main(argv):
+    depth = int(argv[1]) if len(argv) > 1 else 2
+    if depth < 0:
+        sys.stderr.write('movegen.py: depth must be 0 or more\n')
+        return 2
+    ok = True
+    for name in sorted(TEST_BOARDS):
+        board = parse_board(TEST_BOARDS[name])
+        start = time.perf_counter()
+        count = perft(board, TEST_PIECES, depth)
+        elapsed = time.perf_counter() - start
+        # the board itself is the one node at depth 0
+        expected = [1] + EXPECTED.get(name, [])
+        if depth < len(expected):
+            status = 'ok' if expected[depth] == count else \
+                     'MISMATCH (expected %d)' % expected[depth]
+            ok = ok and status == 'ok'
+        else:
+            status = 'unchecked'
+        print('%-10s depth %d: %10d placements %8.3fs %10.0f/s  %s' %
+              (name, depth, count, elapsed, count / max(elapsed, 1e-9),
+               status))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
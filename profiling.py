@@ -0,0 +1,155 @@
+'''
+profiling.py
+
+Opt-in profiling hooks for the tetris game.
+
+Tracing is switched on with the TETRIS_TRACE environment variable or the
+--trace flag of tetris.py, both naming the output file:
+
+    TETRIS_TRACE=trace.json python tetris.py
+    python tetris.py --trace trace.json --profile-ticks 5
+
+While it is on, spans around the game's phases (input, gravity, move,
+rotate, lock, line_clear, spawn and render) are kept in memory and
+written as Chrome trace-event JSON on exit; open the file in
+chrome://tracing or https://ui.perfetto.dev. With TETRIS_PROFILE_TICKS
+or --profile-ticks N, every tick is also run under cProfile and the
+profiles of the N slowest ticks are saved next to the trace as
+<trace>.tick<k>.prof.
+
+When tracing is off, span and tick return a shared do-nothing context
+manager, so the hooks cost one function call each.
+
+@author chindesaurus
+'''
+import atexit
+import heapq
+import os
+import time
+from _thread import get_ident
+
+
+enabled = False
+
+_path = None
+_events = []
+_profile_ticks = 0
+_slowest = []    # heap of (duration, sequence, name, profile)
+_sequence = 0
+_origin = time.perf_counter()
+_pid = os.getpid()
+
+
+class _NullSpan(object):
+    # the span handed out while tracing is off
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        _events.append((self.name, self.start, end - self.start,
+                        get_ident()))
+        return False
+
+
+class _Tick(_Span):
+    # a span that may also be profiled
+
+    def __enter__(self):
+        self.profile = None
+        if _profile_ticks:
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return _Span.__enter__(self)
+
+    def __exit__(self, *exc):
+        _Span.__exit__(self, *exc)
+        if self.profile is not None:
+            global _sequence
+            self.profile.disable()
+            duration = _events[-1][2]
+            _sequence += 1
+            entry = (duration, _sequence, self.name, self.profile)
+            if len(_slowest) < _profile_ticks:
+                heapq.heappush(_slowest, entry)
+            elif duration > _slowest[0][0]:
+                heapq.heapreplace(_slowest, entry)
+        return False
+
+
+def span(name):
+    ''' Parameters: name - type: string
+        Return value: a context manager
+
+        Times the code run inside the with block as a span called name.
+    '''
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def tick(name):
+    ''' Parameters: name - type: string
+
+        Like span, for a whole event handler; these are the units the
+        slowest-tick profiles are kept for.
+    '''
+    if not enabled:
+        return _NULL_SPAN
+    return _Tick(name)
+
+
+def enable(path, profile_ticks=0):
+    ''' Parameters: path - type: string - where to write the trace
+                    profile_ticks - type: int - slowest ticks to profile
+
+        Turns tracing on. The trace is written when the program exits.
+    '''
+    global enabled, _path, _profile_ticks
+    if not enabled:
+        atexit.register(write)
+    enabled = True
+    _path = path
+    _profile_ticks = profile_ticks
+
+
+def enable_from_environment():
+    ''' Turns tracing on if TETRIS_TRACE is set. '''
+    path = os.environ.get('TETRIS_TRACE')
+    if path:
+        enable(path, int(os.environ.get('TETRIS_PROFILE_TICKS', '0')))
+
+
+def write():
+    ''' Writes the spans recorded so far as Chrome trace-event JSON, and
+        the profiles of the slowest ticks.
+    '''
+    if _path is None:
+        return
+    import json
+    events = [{'name': name, 'ph': 'X', 'pid': _pid, 'tid': tid,
+               'ts': (start - _origin) * 1e6, 'dur': duration * 1e6}
+              for name, start, duration, tid in _events]
+    with open(_path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    base = os.path.splitext(_path)[0]
+    ranked = sorted(_slowest, reverse=True)
+    for rank, (duration, sequence, name, profile) in enumerate(ranked):
+        profile.dump_stats('%s.tick%d.prof' % (base, rank + 1))
@@ -0,0 +1,126 @@
+'''
+replay.py
+
+Recorded tetris games.
+
+A game is fully determined by its seed and the inputs it was given, so a
+Replay stores just those: the seed, and every key press and gravity step
+with the time (in milliseconds from the start of the game) it happened.
+Playing the inputs back on a headless Tetris with the same seed repeats
+the game exactly.
+
+Games played with python tetris.py --record FILE are saved this way.
+The file is text: a header line with the format version and the seed,
+then one "<milliseconds> <key>" line per input. A gravity step of one
+row is "gravity", one of several rows "gravity:<rows>" (version 2 on;
+version 1 files only have single rows).
+
+@author chindesaurus
+'''
+import time
+
+
+MAGIC = 'tetris-replay'
+VERSION = 2
+
+# the key recorded for a gravity step
+GRAVITY = 'gravity'
+
+
+def gravity_key(rows):
+    ''' Returns the key recorded for a gravity step of rows rows. '''
+    if rows == 1:
+        return GRAVITY
+    return '%s:%d' % (GRAVITY, rows)
+
+
+class Replay(object):
+    ''' Replay class: a recorded game
+        Attributes: seed - type:int - the seed of the game's Tetris.rng
+                    events - type:list - (milliseconds, key) for each input,
+                    in order
+    '''
+
+    def __init__(self, seed, events=None):
+        self.seed = seed
+        self.events = [] if events is None else events
+        self.origin = time.perf_counter()
+
+
+    def record(self, key):
+        ''' Parameters: key - type:string - a Tk keysym or GRAVITY
+
+            Records an input given to the game now.
+        '''
+        self.events.append((int((time.perf_counter() - self.origin) * 1000),
+                            key))
+
+
+    def duration(self):
+        ''' Return value: type:int - milliseconds up to the last input
+        '''
+        if not self.events:
+            return 0
+        return self.events[-1][0]
+
+
+    def play(self, game, start=0, until=None):
+        ''' Parameters: game - type:Tetris - a game in the state the replay
+                        had reached by input start (a new game made with
+                        the replay's seed for start=0)
+                        start - type:int - index of the first input to give
+                        until - type:int - milliseconds; inputs after this
+                        are not given (default all)
+            Return value: type:int - index of the next input to give
+
+            Gives the recorded inputs to game, like Tetris.key_pressed and
+            Tetris.animate_shape do.
+        '''
+        events = self.events
+        i = start
+        while i < len(events) and (until is None or events[i][0] <= until):
+            apply_input(game, events[i][1])
+            i += 1
+        return i
+
+
+    def save(self, path):
+        ''' Writes the replay to path. '''
+        with open(path, 'w') as f:
+            f.write('%s %d %d\n' % (MAGIC, VERSION, self.seed))
+            for ms, key in self.events:
+                f.write('%d %s\n' % (ms, key))
+
+
+def apply_input(game, key):
+    ''' Parameters: game - type:Tetris
+                    key - type:string - a Tk keysym or GRAVITY
+
+        Gives one recorded input to game. A gravity step is
+        Tetris.fall; one of a single row does what the Down key does.
+    '''
+    name, sep, rows = key.partition(':')
+    if name == GRAVITY:
+        game.fall(int(rows) if sep else 1)
+    else:
+        game.handle_key(key)
+
+
+def load(path):
+    ''' Parameters: path - type:string
+        Return value: type:Replay
+
+        Reads a replay written by Replay.save.
+    '''
+    with open(path) as f:
+        header = f.readline().split()
+        if len(header) != 3 or header[0] != MAGIC:
+            raise ValueError('%s is not a tetris replay' % path)
+        if not 1 <= int(header[1]) <= VERSION:
+            raise ValueError('%s: unsupported replay version %s' %
+                             (path, header[1]))
+        events = []
+        for line in f:
+            ms, key = line.split()
+            events.append((int(ms), key))
+    return Replay(int(header[2]), events)
@@ -0,0 +1,206 @@
+'''
+savegame.py
+
+Saved tetris games in a compact bit-packed binary format.
+
+A save holds everything Tetris.get_state returns: the board, the current
+shape and its rotation direction, the state of the game's random number
+generator, the gravity and the part of a row it has built up, the tick
+count and the paused and over flags. The board is stored as one
+occupancy bit per square (25 bytes for a 10x20 board) followed by a
+4-bit palette index for every occupied square, so a full board costs
+another 100 bytes at most; the generator state (2.5 KB) is most of the
+file.
+
+Usage: python savegame.py FILE
+
+prints a save. In the game, S saves to the file given with --save and L
+loads it again.
+
+@author chindesaurus
+'''
+import struct
+import sys
+
+from snapshot import Snapshot, _empty_row, _share
+
+
+MAGIC = b'TSG2'
+# magic, width, height, shape index, rotation direction, flags, gravity,
+# gravity progress, ticks, palette size
+HEADER = struct.Struct('<4sBBBbBddIB')
+CELLS = struct.Struct('<8b')           # x, y of each block of the shape
+RNG = struct.Struct('<B625Id')         # version, Mersenne Twister state, gauss
+
+PAUSED = 1
+OVER = 2
+
+
+def dumps(game):
+    ''' Parameters: game - type:Tetris
+        Return value: type:bytes
+
+        Packs the state of game.
+    '''
+    state = game.get_state()
+    board = state['board']
+    index, cells, rotation_dir = state['shape']
+    flags = (PAUSED if state['paused'] else 0) | (OVER if state['over'] else 0)
+
+    # occupancy bits, and the palette index of every occupied square
+    palette = []
+    colors = {}
+    bits = 0
+    nibbles = []
+    width = board.width
+    for y, row in enumerate(board.rows):
+        if not any(row):
+            continue
+        for x, color in enumerate(row):
+            if color is not None:
+                bits |= 1 << (y * width + x)
+                code = colors.get(color)
+                if code is None:
+                    code = colors[color] = len(palette)
+                    palette.append(color)
+                nibbles.append(code)
+    if len(palette) > 16:
+        raise ValueError('a save holds at most 16 block colors')
+    if len(nibbles) % 2:
+        nibbles.append(0)
+    packed = bytes(nibbles[i] | nibbles[i + 1] << 4
+                   for i in range(0, len(nibbles), 2))
+
+    parts = [HEADER.pack(MAGIC, width, board.height, index, rotation_dir,
+                         flags, state['gravity'], state['progress'],
+                         state['ticks'] & 0xffffffff,
+                         len(palette)),
+             CELLS.pack(*[v for cell in cells for v in cell])]
+    for color in palette:
+        name = color.encode('ascii')
+        parts.append(bytes((len(name),)) + name)
+    parts.append(bits.to_bytes((width * board.height + 7) // 8, 'little'))
+    parts.append(packed)
+
+    version, mt, gauss = state['rng']
+    parts.append(RNG.pack(version, *mt,
+                          float('nan') if gauss is None else gauss))
+    return b''.join(parts)
+
+
+def _decode(data):
+    # the state of a save with the board left as it is stored: its size,
+    # and the occupancy bits, palette and palette index of every occupied
+    # square (the arguments of Board.restore_bits)
+    (magic, width, height, index, rotation_dir, flags, gravity, progress,
+     ticks, colors) = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('not a tetris save')
+    offset = HEADER.size
+    values = CELLS.unpack_from(data, offset)
+    cells = tuple(zip(values[0::2], values[1::2]))
+    offset += CELLS.size
+
+    palette = []
+    for i in range(colors):
+        size = data[offset]
+        palette.append(data[offset + 1:offset + 1 + size].decode('ascii'))
+        offset += 1 + size
+
+    size = (width * height + 7) // 8
+    bits = int.from_bytes(data[offset:offset + size], 'little')
+    offset += size
+    count = bin(bits).count('1')
+    packed = data[offset:offset + (count + 1) // 2]
+    codes = [byte >> shift & 15 for byte in packed for shift in (0, 4)]
+    offset += len(packed)
+
+    rng = RNG.unpack_from(data, offset)
+    gauss = rng[-1]
+    return {'size': (width, height),
+            'bits': (bits, palette, codes),
+            'shape': (index, cells, rotation_dir),
+            'rng': (rng[0], rng[1:-1], None if gauss != gauss else gauss),
+            'gravity': gravity,
+            'progress': progress,
+            'paused': bool(flags & PAUSED),
+            'over': bool(flags & OVER),
+            'ticks': ticks}
+
+
+def unpack(data):
+    ''' Parameters: data - type:bytes - from dumps
+        Return value: type:dict - a state for Tetris.set_state
+    '''
+    state = _decode(data)
+    width, height = state.pop('size')
+    bits, palette, codes = state.pop('bits')
+
+    # the occupied squares in order, with their colors
+    rows = [None] * height
+    count = 0
+    while bits:
+        low = bits & -bits
+        square = low.bit_length() - 1
+        bits ^= low
+        y, x = divmod(square, width)
+        row = rows[y]
+        if row is None:
+            row = rows[y] = [None] * width
+        row[x] = palette[codes[count]]
+        count += 1
+    empty = _empty_row(width)
+    state['board'] = Snapshot(width, height,
+                              tuple(empty if row is None else _share(row)
+                                    for row in rows))
+    return state
+
+
+def loads(data, game):
+    ''' Parameters: data - type:bytes - from dumps
+                    game - type:Tetris - the game to restore into
+
+        Puts game into the saved state. The board is rebuilt straight
+        from the occupancy bits of the save (see Board.restore_bits),
+        without a snapshot in between, and redrawn in one pass where the
+        renderer allows it (see Board.draw_blocks).
+    '''
+    state = _decode(data)
+    size = state.pop('size')
+    if size != (game.board.width, game.board.height):
+        raise ValueError('the save is of a %dx%d board' % size)
+    game.set_state(state)
+
+
+def save(game, path):
+    ''' Writes the state of game to path. '''
+    with open(path, 'wb') as f:
+        f.write(dumps(game))
+
+
+def load(path, game):
+    ''' Restores game from the save at path. '''
+    with open(path, 'rb') as f:
+        loads(f.read(), game)
+
+
+def main(argv):
+    with open(argv[1], 'rb') as f:
+        data = f.read()
+    state = unpack(data)
+    board = state['board']
+    index, cells, rotation_dir = state['shape']
+    print('%s: %d bytes, %dx%d board, shape %d at %s, tick %d%s%s' %
+          (argv[1], len(data), board.width, board.height, index,
+           ' '.join('%d,%d' % cell for cell in cells), state['ticks'],
+           ', paused' if state['paused'] else '',
+           ', over' if state['over'] else ''))
+    for y, row in enumerate(board.rows):
+        print(''.join('@' if (x, y) in cells else
+                      '#' if color is not None else '.'
+                      for x, color in enumerate(row)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,148 @@
+'''
+snapshot.py
+
+Immutable tetris board snapshots for search code and tools.
+
+A Snapshot stores the board as a tuple of rows, each row a tuple with the
+color of every square (None for empty). Placing a piece builds new tuples
+only for the rows it touches and shares every other row with the parent
+snapshot, so trying a placement costs time proportional to the rows it
+touches and backing it out is just dropping the new snapshot.
+
+@author chindesaurus
+'''
+
+
+class Snapshot(object):
+    ''' Snapshot class: an immutable tetris board
+        Attributes: width - type:int - width of the board in squares
+                    height - type:int - height of the board in squares
+                    rows - type:tuple - one tuple of colors per row, top first
+    '''
+
+    __slots__ = ('width', 'height', 'rows')
+
+    def __init__(self, width, height, rows=None):
+        self.width = width
+        self.height = height
+        if rows is None:
+            rows = (_empty_row(width),) * height
+        self.rows = rows
+
+
+    @classmethod
+    def from_board(cls, board):
+        ''' Parameters: board - type: Board
+            Return value: type: Snapshot
+
+            Takes a snapshot of the blocks in board.grid.
+        '''
+        rows = [[None] * board.width for y in range(board.height)]
+        for (x, y), block in board.grid.items():
+            rows[y][x] = block.config['fill']
+        return cls(board.width, board.height,
+                   tuple(_share(row) for row in rows))
+
+
+    @classmethod
+    def from_rows(cls, lines, width, height, color='gray'):
+        ''' Parameters: lines - type: list of strings, '#' for a block
+            Return value: type: Snapshot
+
+            Builds a snapshot from rows drawn bottom aligned.
+        '''
+        empty = _empty_row(width)
+        rows = [empty] * (height - len(lines))
+        for line in lines:
+            rows.append(_share(tuple(color if c == '#' else None
+                                     for c in line.ljust(width, '.'))))
+        return cls(width, height, tuple(rows))
+
+
+    def can_move(self, x, y):
+        ''' Parameters: x - type:int
+                        y - type:int
+            Return value: type: bool
+
+            Same rule as Board.can_move: True if square x,y is on the
+            board and empty.
+        '''
+        return (0 <= x < self.width and 0 <= y < self.height
+                and self.rows[y][x] is None)
+
+
+    def color(self, x, y):
+        ''' Returns the color of the block at x,y or None if it is empty.
+        '''
+        return self.rows[y][x]
+
+
+    def occupied(self):
+        ''' Return value: type: list of (x, y)
+
+            Returns the squares that hold a block.
+        '''
+        empty = _empty_row(self.width)
+        return [(x, y) for y, row in enumerate(self.rows) if row is not empty
+                for x, color in enumerate(row) if color is not None]
+
+
+    def place(self, cells, color):
+        ''' Parameters: cells - type: iterable of (x, y)
+                        color - type: string
+            Return value: type: tuple (Snapshot, int)
+
+            Returns the snapshot after locking a piece into cells and
+            removing the complete rows, and the number of rows removed.
+            Only the rows the piece touches are copied; the new tuple of
+            rows is sliced together from the parent's, so every other
+            row is shared and only the references to them are copied.
+        '''
+        rows = self.rows
+        touched = {}
+        for x, y in cells:
+            row = touched.get(y)
+            if row is None:
+                row = touched[y] = list(rows[y])
+            row[x] = color
+
+        # the rows of a piece are next to each other
+        top = min(touched)
+        bottom = max(touched)
+        middle = []
+        full = 0
+        for y in range(top, bottom + 1):
+            row = touched.get(y)
+            if row is None:
+                middle.append(rows[y])
+            elif None in row:
+                middle.append(_share(tuple(row)))
+            else:
+                full += 1
+
+        # drop the full rows and add empty rows at the top
+        rows = ((_empty_row(self.width),) * full + rows[:top] + tuple(middle)
+                + rows[bottom + 1:])
+        return Snapshot(self.width, self.height, rows), full
+
+
+############################################################
+# SHARED ROWS
+############################################################
+
+_empty_rows = {}
+
+def _empty_row(width):
+    # one shared empty row per width
+    row = _empty_rows.get(width)
+    if row is None:
+        row = _empty_rows[width] = (None,) * width
+    return row
+
+
+def _share(row):
+    # use the shared empty row where possible so empty rows cost nothing
+    row = tuple(row)
+    if row.count(None) == len(row):
+        return _empty_row(len(row))
+    return row
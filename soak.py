@@ -0,0 +1,412 @@
+'''
+soak.py
+
+Soak test: bots play tetris back to back, at full speed, for hours, in
+the real window, while the memory and drawing resources of the game are
+measured.
+
+Every game is played in the same window and on the same canvas. A new
+game is put in with Tetris.set_state, the way loading a saved game
+does, so whatever a game leaves behind piles up where it can be seen.
+The bots (see tournament.py) take turns game by game, each piece being
+played by sending the keys movegen.py finds for the bot's placement,
+with the window updated after every key. A game ends when it is over
+or after a piece limit.
+
+Every few seconds a sample is taken of:
+
+    rss              - the resident set size of the process
+    traced           - the bytes allocated by Python (tracemalloc)
+    graphics_objects - live graphics.GraphicsObject instances
+    extra_objects    - those that are not blocks in Board.grid
+    canvas_items     - items on the Tk canvas (and blocks in the image
+                       of the pixmap renderer)
+    stray_items      - canvas items no block or message of the game
+                       accounts for
+    frame_items      - the length of CanvasFrame.items
+    undrawn_blocks   - blocks in Board.grid that are not drawn
+
+canvas_items and graphics_objects follow the height of the stack, so
+they are reported but not judged; stray_items and extra_objects are
+what catch leaked items and objects.
+
+The samples of the first part of the run (the warmup) are left out.
+A resource grows without bound if the mean of the last third of the
+remaining samples is above the mean of the first third by more than
+its limit (LIMITS); the run fails if any does. The allocators that
+grew the most since the warmup, per line of code, are listed too.
+
+Usage: python soak.py [--hours H] [--bot NAME]... [--pieces N]
+                      [--interval SECONDS] [--renderer canvas|pixmap]
+                      [--no-tracemalloc] [--headless] [--metrics FILE]
+                      [-o soak.json]
+
+runs under Xvfb when there is no display. --headless plays on a
+stand-in canvas instead of a window, to check the engine alone.
+--metrics records the games in a metrics.Metrics written to FILE while
+the soak runs.
+
+@author chindesaurus
+'''
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import graphics
+import movegen
+import tournament
+from graphics import GraphicsObject, NullCanvas, NullCanvasFrame, PixmapCanvas
+from metrics import Metrics, MetricsFlusher
+from snapshot import Snapshot
+from tetris import Board, Tetris
+
+
+HOURS = 1.0
+INTERVAL = 10.0         # seconds between samples
+WARMUP = 0.1            # share of the run left out of the verdicts
+PIECES = 1000           # piece limit of a game
+BOTS = ['greedy', 'random']
+TOP = 10                # allocators listed
+
+# the growth each resource is allowed, in its units and as a share of
+# its mean in the first third of the run
+LIMITS = {'rss': (4 << 20, 0.05),
+          'traced': (1 << 20, 0.05),
+          'extra_objects': (100, 0.05),
+          'stray_items': (0, 0.0),
+          'frame_items': (0, 0.0),
+          'undrawn_blocks': (0, 0.0)}
+
+
+class LiveCanvas(NullCanvas):
+    ''' LiveCanvas class: a NullCanvas that keeps the ids of the items
+        that were created and not deleted, so a headless soak can count
+        them like the items of a Tk canvas.
+    '''
+
+    def __init__(self):
+        NullCanvas.__init__(self)
+        self.live = set()
+
+
+    def _create(self, *args, **kw):
+        item = NullCanvas._create(self)
+        self.live.add(item)
+        return item
+
+    create_rectangle = create_oval = create_line = create_polygon = _create
+    create_text = create_image = create_window = _create
+
+
+    def delete(self, *items):
+        self.live.difference_update(items)
+
+
+    def find_all(self):
+        return tuple(self.live)
+
+
+############################################################
+# MEASUREMENTS
+############################################################
+
+def rss():
+    ''' Returns the resident set size of the process in bytes, or the
+        peak resident set size where the current one is not known.
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes, except on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def drawn_items(game):
+    ''' Returns the number of canvas items the game accounts for: its
+        drawn blocks, ghost blocks and game over message.
+    '''
+    blocks = list(game.board.grid.values())
+    blocks.extend(game.current_shape.get_blocks())
+    if game.ghost is not None:
+        blocks.extend(game.ghost)
+    count = sum(block.id is not None for block in blocks)
+    if game.board.message is not None:
+        count += 1
+    return count
+
+
+class Sampler(object):
+    ''' Sampler class: takes samples of the resources of a game
+        Attributes: game - type:Tetris
+                    samples - type:list of dict - one per sample, with the
+                    time, games and pieces so far and a value per resource
+                    baseline - type:tracemalloc.Snapshot - taken at the end
+                    of the warmup, or None
+    '''
+
+    def __init__(self, game):
+        self.game = game
+        self.samples = []
+        self.baseline = None
+
+
+    def canvas_items(self):
+        canvas = self.game.board.canvas.canvas
+        if isinstance(canvas, PixmapCanvas):
+            return len(canvas.target.find_all()) + len(canvas.rects)
+        return len(canvas.find_all())
+
+
+    def sample(self, elapsed, games, pieces):
+        ''' Parameters: elapsed - type:float - seconds since the start
+                        games - type:int - games finished
+                        pieces - type:int - pieces placed
+            Return value: type:dict - the sample
+        '''
+        # count what is alive, not what is waiting for the collector
+        gc.collect()
+        game = self.game
+        items = self.canvas_items()
+        objects = sum(isinstance(obj, GraphicsObject) for obj in gc.get_objects())
+        sample = {'time': elapsed, 'games': games, 'pieces': pieces,
+                  'rss': rss(),
+                  'graphics_objects': objects,
+                  'extra_objects': objects - len(game.board.grid),
+                  'canvas_items': items,
+                  'stray_items': items - drawn_items(game),
+                  'frame_items': len(game.board.canvas.items),
+                  'undrawn_blocks': sum(block.id is None
+                                        for block in game.board.grid.values())}
+        if tracemalloc.is_tracing():
+            sample['traced'] = tracemalloc.get_traced_memory()[0]
+        self.samples.append(sample)
+        return sample
+
+
+    def mark_baseline(self):
+        ''' Takes the snapshot top_allocators compares against. '''
+        if tracemalloc.is_tracing():
+            self.baseline = tracemalloc.take_snapshot()
+
+
+    def top_allocators(self, limit=TOP):
+        ''' Return value: type:list of dict - the lines of code whose
+            allocations grew the most since mark_baseline, with the bytes
+            and blocks they grew by
+        '''
+        if self.baseline is None:
+            return []
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__),
+                  tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                  tracemalloc.Filter(False, '<unknown>'),
+                  # the samples themselves
+                  tracemalloc.Filter(False, __file__))
+        snapshot = tracemalloc.take_snapshot().filter_traces(ignore)
+        stats = snapshot.compare_to(self.baseline.filter_traces(ignore), 'lineno')
+        # compare_to orders by the size of the change, shrinking or not
+        grown = sorted((stat for stat in stats if stat.size_diff > 0),
+                       key=lambda stat: -stat.size_diff)
+        top = []
+        for stat in grown[:limit]:
+            frame = stat.traceback[0]
+            top.append({'where': '%s:%d' % (frame.filename, frame.lineno),
+                        'bytes': stat.size_diff, 'blocks': stat.count_diff})
+        return top
+
+
+def verdicts(samples, warmup):
+    ''' Parameters: samples - type:list of dict - from Sampler.sample
+                    warmup - type:float - seconds of samples to leave out
+        Return value: type:dict - for each resource, the means of the first
+        and last thirds of the samples after the warmup, the growth, its
+        limit and whether it is within it; empty with fewer than three
+        samples after the warmup
+    '''
+    samples = [s for s in samples if s['time'] >= warmup]
+    third = len(samples) // 3
+    if not third:
+        return {}
+    results = {}
+    for name, (absolute, relative) in sorted(LIMITS.items()):
+        if name not in samples[0]:
+            continue
+        first = sum(s[name] for s in samples[:third]) / float(third)
+        last = sum(s[name] for s in samples[-third:]) / float(third)
+        limit = max(absolute, relative * first)
+        results[name] = {'first': first, 'last': last, 'growth': last - first,
+                         'limit': limit, 'ok': last - first <= limit}
+    return results
+
+
+############################################################
+# PLAY
+############################################################
+
+def play_piece(game, bot, rng, update):
+    ''' Parameters: game - type:Tetris
+                    bot - type:function - see tournament.py
+                    rng - type:random.Random - the bot's
+                    update - type:function - called after every key
+
+        Has the bot place the current shape, pressing the keys that get it
+        there and the 'Down' that locks it.
+    '''
+    board = game.board
+    shape = game.current_shape
+    placements = movegen.reachable_placements(board, shape)
+    cells, path = bot(Snapshot.from_board(board), movegen.Piece(shape),
+                      placements, rng)
+    for key in path + ['Down']:
+        game.handle_key(key)
+        update()
+
+
+def soak(game, bots, seconds, interval=INTERVAL, pieces=PIECES, seed=None,
+         update=lambda: None, log=sys.stderr):
+    ''' Parameters: game - type:Tetris - the game, drawn on a canvas
+                    bots - type:list of strings - the bots, taking turns
+                    seconds - type:float - how long to play
+                    interval - type:float - seconds between samples
+                    pieces - type:int - the piece limit of a game
+                    seed - type:int - picks the games
+                    update - type:function - called after every key, e.g.
+                    to let Tk draw
+                    log - type:file - where each sample is reported
+        Return value: type:Sampler - holding the samples
+    '''
+    rng = random.Random(seed)
+    bot_rng = random.Random(None if seed is None
+                            else seed ^ tournament.BOT_SEED_MASK)
+    players = [tournament.load_bot(name) for name in bots]
+    sampler = Sampler(game)
+    warmup = seconds * WARMUP
+    games = placed = in_game = 0
+    start = time.perf_counter()
+    next_sample = 0.0
+    while True:
+        elapsed = time.perf_counter() - start
+        if elapsed >= next_sample:
+            if sampler.baseline is None and elapsed >= warmup:
+                sampler.mark_baseline()
+            s = sampler.sample(elapsed, games, placed)
+            log.write('%7.0fs %6d games %8d pieces  rss %7.1f MiB  '
+                      'traced %7.1f MiB  %6d objects  %5d items  %3d stray  '
+                      '%3d undrawn\n' %
+                      (elapsed, games, placed, s['rss'] / 1048576.0,
+                       s.get('traced', 0) / 1048576.0, s['graphics_objects'],
+                       s['canvas_items'], s['stray_items'],
+                       s['undrawn_blocks']))
+            log.flush()
+            if elapsed >= seconds:
+                return sampler
+            next_sample += interval
+        if game.over or in_game >= pieces:
+            # a game over is recorded by the game itself
+            if not game.over and game.metrics is not None:
+                game.metrics.game_completed()
+            games += 1
+            in_game = 0
+            game.set_state(Tetris(None, seed=rng.randrange(2 ** 32)).get_state())
+            update()
+        play_piece(game, players[games % len(players)], bot_rng, update)
+        placed += 1
+        in_game += 1
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='soak.py')
+    parser.add_argument('--hours', type=float, default=HOURS)
+    parser.add_argument('--bot', action='append',
+                        help='a bot (see tournament.py), repeated for bots '
+                             'that take turns (default %s)' % ' and '.join(BOTS))
+    parser.add_argument('--pieces', type=int, default=PIECES)
+    parser.add_argument('--interval', type=float, default=INTERVAL)
+    parser.add_argument('--renderer', choices=sorted(Board.RENDERERS),
+                        default='canvas')
+    parser.add_argument('--seed', type=int, default=tournament.SEED)
+    parser.add_argument('--no-tracemalloc', action='store_true')
+    parser.add_argument('--headless', action='store_true',
+                        help='play on a stand-in canvas, without a window')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='write the game metrics to FILE every 10 s (JSON '
+                             'lines for a .jsonl file, else Prometheus text)')
+    parser.add_argument('-o', '--output')
+    args = parser.parse_args(argv[1:])
+    bots = args.bot or BOTS
+    for name in bots:
+        tournament.load_bot(name)
+
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+    win = None
+    update = lambda: None
+    if args.headless:
+        game = Tetris(None, seed=args.seed,
+                      canvas=NullCanvasFrame(canvas=LiveCanvas()))
+    else:
+        if not os.environ.get('DISPLAY'):
+            from bench_render import start_xvfb
+            start_xvfb()
+        win = graphics.Window('Tetris soak')
+        game = Tetris(win, seed=args.seed, renderer=args.renderer)
+        game.stop()
+        update = win.update
+        update()
+
+    flusher = None
+    if args.metrics:
+        game.metrics = Metrics()
+        flusher = MetricsFlusher(game.metrics, args.metrics)
+        flusher.start()
+
+    seconds = args.hours * 3600
+    try:
+        sampler = soak(game, bots, seconds, args.interval, args.pieces,
+                       args.seed, update)
+    finally:
+        if flusher is not None:
+            flusher.stop()
+    results = verdicts(sampler.samples, seconds * WARMUP)
+    top = sampler.top_allocators()
+    if win is not None:
+        win.destroy()
+
+    print('%-18s %14s %14s %12s %12s' % ('resource', 'first third',
+                                         'last third', 'growth', 'limit'))
+    for name, result in sorted(results.items()):
+        print('%-18s %14.1f %14.1f %12.1f %12.1f  %s' %
+              (name, result['first'], result['last'], result['growth'],
+               result['limit'], 'ok' if result['ok'] else 'GROWING'))
+    if top:
+        print('\nallocations grown since the warmup:')
+        for stat in top:
+            print('%10.1f KiB %+8d blocks  %s' %
+                  (stat['bytes'] / 1024.0, stat['blocks'], stat['where']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': {'hours': args.hours, 'bots': bots,
+                                'pieces': args.pieces,
+                                'renderer': 'headless' if args.headless
+                                            else args.renderer,
+                                'seed': args.seed,
+                                'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+                       'samples': sampler.samples,
+                       'verdicts': results,
+                       'allocators': top}, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if not results:
+        print('too few samples after the warmup to tell')
+        return 1
+    return 0 if all(result['ok'] for result in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,426 @@
+'''
+spectate.py
+
+Live tetris games streamed to spectators over TCP, with asyncio.
+
+A spectator connects, sends the name of the game it wants to watch on
+one line (an empty line for the first game) and is then sent a HELLO
+with the board size, followed by a frame every time the game changes.
+Frames are deltas: the tick, the falling piece (its index in
+Tetris.SHAPES and its squares) and only the rows that changed, each as
+a bitmask of its occupied squares. A spectator that joins late is sent
+a keyframe, which has every row, to start from.
+
+Every spectator has a task of its own that writes the newest frame and,
+once about a keyframe is waiting to be sent, waits for the socket to
+drain. A spectator that cannot keep up misses the frames that came
+meanwhile and is then sent one delta from the last frame it got, so a
+slow spectator never holds up the game or the others; one that falls
+too far behind gets a keyframe. The encoded frames are cached per
+tick, so hundreds of spectators that are up to date share one delta.
+
+Usage: python spectate.py serve REPLAY... [--address HOST:PORT] [--fps N]
+       python spectate.py watch [GAME] [--address HOST:PORT]
+       python spectate.py load [GAME] [--address HOST:PORT] [-n CLIENTS]
+
+serve streams replays (see replay.py) in real time, over and over;
+python tetris.py --spectate HOST:PORT streams the game being played.
+watch draws a game in the terminal, and load connects many spectators
+and reports the frames they got.
+
+@author chindesaurus
+'''
+import argparse
+import asyncio
+import socket
+import struct
+import sys
+import threading
+import time
+
+import replay
+from tetris import Tetris
+
+
+ADDRESS = '127.0.0.1:7070'
+FPS = 30
+HISTORY = 64            # ticks a delta can be made from
+
+MAGIC = b'TSP1'
+HELLO = struct.Struct('<4sBB')          # magic, width, height
+# kind, tick, piece index (-1 once the game is over), the piece's squares
+# as x, y pairs, rows that follow
+FRAME = struct.Struct('<BIb8bB')
+KEYFRAME = 1
+DELTA = 2
+
+
+def parse_address(address):
+    ''' Return value: type:tuple - (host, port) of a host:port string
+    '''
+    host, sep, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def board_state(game):
+    ''' Parameters: game - type:Tetris
+        Return value: type:tuple - (rows, piece)
+
+        Returns the board of game as a tuple with the bitmask of every
+        row (bit x for square x), and the falling piece as (index, x, y
+        of each square), with index -1 once the game is over.
+    '''
+    board = game.board
+    masks = [0] * board.height
+    for x, y in board.grid:
+        masks[y] |= 1 << x
+    if game.over:
+        piece = (-1,) + (0,) * 8
+    else:
+        shape = game.current_shape
+        piece = (Tetris.SHAPES.index(type(shape)),) + \
+            tuple(v for block in shape.get_blocks() for v in (block.x, block.y))
+    return tuple(masks), piece
+
+
+class GameStream(object):
+    ''' GameStream class: the frames of one game, for its spectators
+        Attributes: width - type:int
+                    height - type:int
+                    tick - type:int - the newest frame, -1 before the first
+                    rows - type:tuple of int - the row bitmasks of the
+                    newest frame
+                    piece - type:tuple - the falling piece of the newest frame
+                    history - type:dict - tick to the rows of that frame,
+                    for the last HISTORY ticks
+                    spectators - type:int - connected spectators
+
+        Must be published to and read from in the asyncio thread.
+    '''
+
+    def __init__(self, width=Tetris.BOARD_WIDTH, height=Tetris.BOARD_HEIGHT):
+        self.width = width
+        self.height = height
+        self.mask_size = (width + 7) // 8
+        self.tick = -1
+        self.rows = None
+        self.piece = None
+        self.history = {}
+        self.cache = {}
+        self.changed = asyncio.Event()
+        self.spectators = 0
+
+
+    def hello(self):
+        return HELLO.pack(MAGIC, self.width, self.height)
+
+
+    def keyframe_size(self):
+        ''' Return value: type:int - the bytes of a keyframe '''
+        return FRAME.size + self.height * (1 + self.mask_size)
+
+
+    def publish(self, rows, piece):
+        ''' Parameters: rows, piece - from board_state
+
+            Makes a new frame, unless nothing changed, and wakes the
+            spectators.
+        '''
+        if rows == self.rows and piece == self.piece:
+            return
+        self.tick += 1
+        self.rows = rows
+        self.piece = piece
+        self.history[self.tick] = rows
+        self.history.pop(self.tick - HISTORY, None)
+        self.cache = {}
+        changed = self.changed
+        self.changed = asyncio.Event()
+        changed.set()
+
+
+    def frame(self, since):
+        ''' Parameters: since - type:int - the tick the spectator has, or
+                        None
+            Return value: type:bytes
+
+            Encodes the newest frame as a delta from tick since, or as a
+            keyframe if since is too old or None.
+        '''
+        data = self.cache.get(since)
+        if data is None:
+            old = self.history.get(since)
+            rows = self.rows
+            if old is None:
+                kind = KEYFRAME
+                changed = range(self.height)
+            else:
+                kind = DELTA
+                changed = [y for y in range(self.height) if rows[y] != old[y]]
+            size = self.mask_size
+            parts = [FRAME.pack(kind, self.tick, *(self.piece + (len(changed),)))]
+            for y in changed:
+                parts.append(bytes((y,)) + rows[y].to_bytes(size, 'little'))
+            data = self.cache[since] = b''.join(parts)
+        return data
+
+
+    async def wait(self, since):
+        ''' Returns once there is a frame newer than tick since. '''
+        while self.tick == since or self.tick < 0:
+            await self.changed.wait()
+
+
+############################################################
+# SERVER
+############################################################
+
+class Server(object):
+    ''' Server class: serves spectators the games in streams
+        Attributes: streams - type:dict - game name to GameStream; the
+                    first one added is the default
+    '''
+
+    def __init__(self, streams):
+        self.streams = streams
+
+
+    async def handle(self, reader, writer):
+        # one spectator: the name of a game, then frames until it leaves
+        try:
+            name = (await asyncio.wait_for(reader.readline(), 10)).strip()
+        except (asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+        stream = self.streams.get(name.decode('utf-8', 'replace'))
+        if stream is None and not name and self.streams:
+            stream = next(iter(self.streams.values()))
+        if stream is None:
+            writer.close()
+            return
+
+        # drain waits once about a keyframe is buffered, rather than the
+        # 64 KiB asyncio allows by default (and the megabytes the kernel
+        # may), so a spectator that can't keep up skips to the newest
+        # frame instead of being sent every old one
+        size = stream.keyframe_size()
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, size)
+        writer.transport.set_write_buffer_limits(high=size)
+        stream.spectators += 1
+        since = None
+        try:
+            writer.write(stream.hello())
+            while True:
+                await stream.wait(since)
+                writer.write(stream.frame(since))
+                since = stream.tick
+                # frames published while this waits are skipped; the next
+                # write is one delta from since
+                await writer.drain()
+        except ConnectionError:
+            pass    # gone
+        finally:
+            stream.spectators -= 1
+            writer.close()
+
+
+    async def start(self, address=ADDRESS):
+        ''' Starts listening; returns the asyncio server. '''
+        host, port = parse_address(address)
+        return await asyncio.start_server(self.handle, host, port,
+                                          backlog=1024)
+
+
+async def stream_replay(stream, recording, fps=FPS, loop=True):
+    ''' Parameters: stream - type:GameStream
+                    recording - type:replay.Replay
+                    fps - type:int - frames published per second
+                    loop - type:bool - start over at the end
+
+        Plays a replay in real time, publishing it to stream.
+    '''
+    while True:
+        game = Tetris(None, seed=recording.seed)
+        start = time.perf_counter()
+        i = 0
+        while i < len(recording.events):
+            i = recording.play(game, i, (time.perf_counter() - start) * 1000)
+            stream.publish(*board_state(game))
+            await asyncio.sleep(1.0 / fps)
+        if not loop:
+            return
+        await asyncio.sleep(2)
+
+
+class LiveStream(object):
+    ''' LiveStream class: streams a game being played in a window
+        Attributes: game - type:Tetris
+                    stream - type:GameStream
+                    loop - type:asyncio event loop - runs the server in a
+                    thread of its own
+
+        The board is read in the Tk thread FPS times a second and handed
+        to the server thread when it changed.
+    '''
+
+    def __init__(self, game, address=ADDRESS, fps=FPS):
+        self.game = game
+        self.fps = fps
+        self.loop = asyncio.new_event_loop()
+        self.stream = GameStream(game.board.width, game.board.height)
+        self.server = Server({'live': self.stream})
+        self.last = None
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.server.start(address))
+            started.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        started.wait()
+        self.timer = game.win.after(0, self.poll)
+
+
+    def poll(self):
+        state = board_state(self.game)
+        if state != self.last:
+            self.last = state
+            self.loop.call_soon_threadsafe(self.stream.publish, *state)
+        self.timer = self.game.win.after(1000 // self.fps, self.poll)
+
+
+############################################################
+# SPECTATORS
+############################################################
+
+class Spectator(object):
+    ''' Spectator class: a client that keeps the board it is sent
+        Attributes: width - type:int
+                    height - type:int
+                    rows - type:list of int - row bitmasks
+                    piece - type:tuple - as in board_state
+                    tick - type:int - the last frame received
+                    frames - type:int - frames received
+                    keyframes - type:int - keyframes among them
+    '''
+
+    async def connect(self, address=ADDRESS, game=''):
+        host, port = parse_address(address)
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(game.encode('utf-8') + b'\n')
+        magic, self.width, self.height = HELLO.unpack(
+            await self.reader.readexactly(HELLO.size))
+        if magic != MAGIC:
+            raise ValueError('not a tetris spectator server')
+        self.mask_size = (self.width + 7) // 8
+        self.rows = [0] * self.height
+        self.piece = None
+        self.tick = -1
+        self.frames = 0
+        self.keyframes = 0
+
+
+    async def receive(self):
+        ''' Reads one frame and applies it to rows. '''
+        values = FRAME.unpack(await self.reader.readexactly(FRAME.size))
+        kind, self.tick = values[0], values[1]
+        self.piece = values[2:11]
+        count = values[11]
+        size = self.mask_size + 1
+        data = await self.reader.readexactly(count * size)
+        for offset in range(0, len(data), size):
+            self.rows[data[offset]] = int.from_bytes(
+                data[offset + 1:offset + size], 'little')
+        self.frames += 1
+        if kind == KEYFRAME:
+            self.keyframes += 1
+
+
+    def draw(self):
+        ''' Return value: type:string - the board as text '''
+        cells = set(zip(self.piece[1::2], self.piece[2::2])) \
+            if self.piece[0] >= 0 else set()
+        return '\n'.join(''.join('@' if (x, y) in cells else
+                                 '#' if row >> x & 1 else '.'
+                                 for x in range(self.width))
+                         for y, row in enumerate(self.rows))
+
+
+    def close(self):
+        self.writer.close()
+
+
+async def watch(address, game):
+    spectator = Spectator()
+    await spectator.connect(address, game)
+    while True:
+        await spectator.receive()
+        sys.stdout.write('\x1b[H\x1b[2J%s\ntick %d\n' %
+                         (spectator.draw(), spectator.tick))
+        sys.stdout.flush()
+
+
+async def load(address, game, clients, seconds):
+    ''' Connects clients spectators for seconds seconds and returns
+        them.
+    '''
+    spectators = [Spectator() for i in range(clients)]
+    await asyncio.gather(*[s.connect(address, game) for s in spectators])
+
+    async def run(spectator):
+        while True:
+            await spectator.receive()
+
+    tasks = [asyncio.ensure_future(run(s)) for s in spectators]
+    await asyncio.sleep(seconds)
+    for task in tasks:
+        task.cancel()
+    for spectator in spectators:
+        spectator.close()
+    return spectators
+
+
+async def serve(paths, address, fps):
+    streams = {}
+    for path in paths:
+        streams[path] = GameStream()
+    server = await Server(streams).start(address)
+    for path, stream in streams.items():
+        asyncio.ensure_future(stream_replay(stream, replay.load(path), fps))
+    sys.stderr.write('serving %d games at %s\n' % (len(streams), address))
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='spectate.py')
+    parser.add_argument('command', choices=['serve', 'watch', 'load'])
+    parser.add_argument('games', nargs='*')
+    parser.add_argument('--address', default=ADDRESS)
+    parser.add_argument('--fps', type=int, default=FPS)
+    parser.add_argument('-n', '--clients', type=int, default=200)
+    parser.add_argument('-t', '--seconds', type=float, default=10)
+    args = parser.parse_args(argv[1:])
+    game = args.games[0] if args.games else ''
+
+    if args.command == 'serve':
+        asyncio.run(serve(args.games, args.address, args.fps))
+    elif args.command == 'watch':
+        asyncio.run(watch(args.address, game))
+    else:
+        spectators = asyncio.run(load(args.address, game, args.clients,
+                                      args.seconds))
+        frames = sorted(s.frames for s in spectators)
+        print('%d spectators, frames received: min %d, median %d, max %d; '
+              '%d keyframes' % (len(spectators), frames[0],
+                                frames[len(frames) // 2], frames[-1],
+                                sum(s.keyframes for s in spectators)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
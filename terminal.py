@@ -0,0 +1,335 @@
+'''
+terminal.py
+
+Plays tetris in a terminal, for when a Tk window is not an option (e.g.
+over SSH, where X forwarding of the canvas is too slow to play).
+
+A TerminalFrame draws a headless game as text, two columns per square.
+It keeps the square it drew last at every position and, for each frame,
+only writes the squares that changed: a cursor move, unless the cursor
+is already there after the square before it, a color change, unless
+the color in effect is already right, and the two characters of the
+square. The output of a frame is joined and written in one write
+(continued if the terminal takes only part of it), so a piece moving one
+column costs a few dozen bytes.
+
+curses sets the terminal up (no echo, keys without Enter, the keypad,
+no cursor) and the escape sequences come from its terminfo entry, but
+curses itself draws nothing: its screen would diff the frame a second
+time and decide its own writes.
+
+Usage: python terminal.py [--seed N] [--save game.sav]
+
+The arrow keys move and rotate, space drops, p pauses, s and l save and
+load the game and q quits.
+
+@author chindesaurus
+'''
+import argparse
+import os
+import select
+import sys
+import time
+
+from metrics import Metrics, PIECES_LOCKED
+from tetris import Tetris
+
+
+# the colors of the game as (8 color, 256 color) terminal color numbers
+COLORS = {'blue': (4, 21),
+          'orange': (3, 208),
+          'cyan': (6, 51),
+          'red': (1, 196),
+          'green': (2, 46),
+          'yellow': (3, 226),
+          'magenta': (5, 201),
+          'purple': (5, 129),
+          'gray': (7, 250)}
+
+HELP = 'arrows move/rotate  space drops  p pause  s/l save/load  q quit'
+
+
+class Escapes(object):
+    ''' Escapes class: the escape sequences a TerminalFrame writes
+        Attributes: colors - type:int - the colors the terminal has
+
+        The sequences are ANSI ones unless they are read from terminfo
+        (see from_terminfo).
+    '''
+
+    def __init__(self, colors=256):
+        self.colors = colors
+        self.terminfo = None
+
+
+    @classmethod
+    def from_terminfo(cls):
+        ''' Returns the Escapes of the terminal curses was set up for. '''
+        import curses
+        escapes = cls(max(curses.tigetnum('colors'), 8))
+        names = ('cup', 'sgr0', 'setaf', 'setab', 'clear')
+        strings = dict((name, curses.tigetstr(name)) for name in names)
+        if all(strings.values()):
+            escapes.terminfo = strings
+            escapes.tparm = curses.tparm
+        return escapes
+
+
+    def move(self, row, column):
+        if self.terminfo is not None:
+            return self.tparm(self.terminfo['cup'], row, column)
+        return b'\x1b[%d;%dH' % (row + 1, column + 1)
+
+
+    def reset(self):
+        if self.terminfo is not None:
+            return self.terminfo['sgr0']
+        return b'\x1b[0m'
+
+
+    def clear(self):
+        if self.terminfo is not None:
+            return self.terminfo['clear']
+        return b'\x1b[H\x1b[2J'
+
+
+    def color(self, name, background):
+        ''' Returns the sequence that sets the foreground, or background,
+            color to the color of the game called name.
+        '''
+        number = COLORS[name][self.colors >= 256]
+        if self.terminfo is not None:
+            return self.tparm(self.terminfo['setab' if background else 'setaf'],
+                              number)
+        if number < 8:
+            return b'\x1b[%dm' % ((40 if background else 30) + number)
+        return b'\x1b[%d;5;%dm' % (48 if background else 38, number)
+
+
+class TerminalFrame(object):
+    ''' TerminalFrame class: a board drawn in a terminal
+        Attributes: width - type:int - board width in squares
+                    height - type:int - board height in squares
+                    escapes - type:Escapes
+                    cells - type:list - the look drawn in each square
+                    frames - type:int - frames rendered
+                    written - type:int - bytes rendered
+
+        A look is the (attributes, text) bytes of a square. Looks are
+        made once and shared, so a square that did not change is found
+        by identity.
+    '''
+
+    def __init__(self, escapes, width=Tetris.BOARD_WIDTH,
+                 height=Tetris.BOARD_HEIGHT):
+        self.escapes = escapes
+        self.width = width
+        self.height = height
+        self.empty = (escapes.reset(), b' .')
+        self.blocks = {}
+        self.ghosts = {}
+        self.looks = [self.empty] * (width * height)
+        self.frames = 0
+        self.written = 0
+        self.invalidate()
+
+
+    def invalidate(self):
+        ''' Makes the next frame redraw the whole screen, e.g. after the
+            terminal was resized.
+        '''
+        escapes = self.escapes
+        self.cells = [None] * (self.width * self.height)
+        self.status = ''
+        self.attributes = escapes.reset()
+        # nowhere on the board, so the first square moves the cursor
+        self.cursor = (-1, -1)
+        # the border, drawn once
+        rule = b'+' + b'-' * (2 * self.width) + b'+'
+        self.pending = [escapes.reset(), escapes.clear()]
+        for y in range(self.height):
+            self.pending.append(escapes.move(y, 0) + b'|')
+            self.pending.append(escapes.move(y, 2 * self.width + 1) + b'|')
+        self.pending.append(escapes.move(self.height, 0) + rule)
+        self.pending.append(escapes.move(self.height + 2, 0) +
+                            HELP.encode('ascii'))
+
+
+    def block(self, color):
+        look = self.blocks.get(color)
+        if look is None:
+            look = self.blocks[color] = (self.escapes.reset() +
+                                         self.escapes.color(color, True), b'  ')
+        return look
+
+
+    def ghost(self, color):
+        look = self.ghosts.get(color)
+        if look is None:
+            look = self.ghosts[color] = (self.escapes.reset() +
+                                         self.escapes.color(color, False), b'[]')
+        return look
+
+
+    def render(self, game, status=''):
+        ''' Parameters: game - type:Tetris - a headless game
+                        status - type:string - shown under the board
+            Return value: type:bytes - what to write to the terminal
+
+            Draws the board, the falling shape and where it would land,
+            writing only the squares and the status that changed.
+        '''
+        width = self.width
+        looks = self.looks
+        empty = self.empty
+        for i in range(len(looks)):
+            looks[i] = empty
+        for block in game.board.grid.values():
+            looks[block.y * width + block.x] = self.block(block.config['fill'])
+        if not game.over:
+            blocks = game.current_shape.get_blocks()
+            color = blocks[0].config['fill']
+            distance = game.board.drop_distance(game.current_shape)
+            if distance:
+                ghost = self.ghost(color)
+                for block in blocks:
+                    looks[(block.y + distance) * width + block.x] = ghost
+            look = self.block(color)
+            for block in blocks:
+                if 0 <= block.y < self.height:
+                    looks[block.y * width + block.x] = look
+
+        out = self.pending
+        self.pending = []
+        move = self.escapes.move
+        cells = self.cells
+        attributes = self.attributes
+        cursor_row, cursor_column = self.cursor
+        for i in range(len(looks)):
+            look = looks[i]
+            if cells[i] is look:
+                continue
+            cells[i] = look
+            y, x = divmod(i, width)
+            column = 2 * x + 1
+            if y != cursor_row or column != cursor_column:
+                out.append(move(y, column))
+            if look[0] != attributes:
+                attributes = look[0]
+                out.append(attributes)
+            out.append(look[1])
+            cursor_row, cursor_column = y, column + 2
+
+        if status != self.status:
+            if attributes != empty[0]:
+                attributes = empty[0]
+                out.append(attributes)
+            # pad with spaces over the end of a longer status
+            out.append(move(self.height + 1, 0) +
+                       status.ljust(len(self.status)).encode('ascii'))
+            cursor_row, cursor_column = self.height + 1, max(len(status),
+                                                             len(self.status))
+            self.status = status
+
+        self.attributes = attributes
+        self.cursor = (cursor_row, cursor_column)
+        data = b''.join(out)
+        self.frames += 1
+        self.written += len(data)
+        return data
+
+
+############################################################
+# PLAY
+############################################################
+
+def status_line(game):
+    ''' Returns the line shown under the board. '''
+    lines = sum(rows * count for rows, count in enumerate(game.metrics.lines))
+    text = 'lines %d  pieces %d' % (lines, game.metrics.counters[PIECES_LOCKED])
+    if game.over:
+        text += '  GAME OVER - q quits'
+    elif game.paused:
+        text += '  paused'
+    return text
+
+
+def write_all(fd, data):
+    ''' Writes all of data to fd: a terminal may take a large write,
+        e.g. a full redraw, in parts.
+    '''
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def play(stdscr, game):
+    ''' Parameters: stdscr - type:curses window - from curses.wrapper
+                    game - type:Tetris - a headless game with metrics
+        Return value: type:TerminalFrame
+
+        Plays game in the terminal until q is pressed: a frame is drawn
+        after every key and every frame of gravity (Tetris.FRAME_MS).
+    '''
+    import curses
+    keys = {curses.KEY_LEFT: 'Left', curses.KEY_RIGHT: 'Right',
+            curses.KEY_UP: 'Up', curses.KEY_DOWN: 'Down', ord(' '): 'space'}
+    try:
+        curses.curs_set(0)
+    except curses.error:
+        pass
+    stdscr.nodelay(True)
+    stdscr.keypad(True)
+    # curses clears the screen on its first refresh; get it over with
+    # before drawing, and never touch stdscr again
+    stdscr.refresh()
+
+    frame = TerminalFrame(Escapes.from_terminfo(), game.board.width,
+                          game.board.height)
+    fd = sys.stdout.fileno()
+    write_all(fd, frame.render(game, status_line(game)))
+    frame_time = game.FRAME_MS / 1000.0
+    next_tick = time.monotonic() + frame_time
+    while True:
+        timeout = max(0.0, next_tick - time.monotonic())
+        select.select([sys.stdin], [], [], timeout)
+        while True:
+            key = stdscr.getch()
+            if key == -1:
+                break
+            if key == ord('q'):
+                return frame
+            if key == curses.KEY_RESIZE:
+                frame.invalidate()
+            elif key in keys:
+                game.handle_key(keys[key])
+            elif 0 < key < 256:
+                game.handle_key(chr(key))
+        if time.monotonic() >= next_tick:
+            next_tick += frame_time
+            game.step()
+        data = frame.render(game, status_line(game))
+        if data:
+            write_all(fd, data)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='terminal.py')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--save', metavar='FILE', default='tetris.sav',
+                        help='where s saves the game and l loads it from '
+                             '(default %(default)s)')
+    args = parser.parse_args(argv[1:])
+    import curses
+
+    game = Tetris(None, seed=args.seed)
+    game.save_path = args.save
+    game.metrics = Metrics()
+    frame = curses.wrapper(play, game)
+    print('%d frames, %.1f bytes per frame' %
+          (frame.frames, frame.written / float(max(frame.frames, 1))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,138 @@
+'''
+test_board.py
+
+Tests that the skyline index of a Board (its column heights, row counts
+and hole count) matches what a scan of its grid gives, through seeded
+random games.
+
+Usage: python -m unittest test_board
+
+@author chindesaurus
+'''
+import random
+import unittest
+
+import movegen
+from graphics import Point
+from tetris import Board, Tetris
+
+
+def scan_heights(board):
+    heights = [0] * board.width
+    for x, y in board.grid:
+        heights[x] = max(heights[x], board.height - y)
+    return heights
+
+
+def scan_row_counts(board):
+    counts = [0] * board.height
+    for x, y in board.grid:
+        counts[y] += 1
+    return counts
+
+
+def scan_holes(board):
+    holes = 0
+    for x, height in enumerate(scan_heights(board)):
+        for y in range(board.height - height, board.height):
+            if (x, y) not in board.grid:
+                holes += 1
+    return holes
+
+
+def scan_drop(board, shape):
+    # moves the shape down a row at a time
+    cells = [(block.x, block.y) for block in shape.get_blocks()]
+    fall = 0
+    while all(board.can_move(x, y + fall + 1) for x, y in cells):
+        fall += 1
+    return fall
+
+
+def make_shape(shape_class, cells):
+    shape = shape_class(Point(0, 0))
+    for block, (x, y) in zip(shape.get_blocks(), cells):
+        block.x = x
+        block.y = y
+    return shape
+
+
+class SkylineTest(unittest.TestCase):
+
+    def check(self, board):
+        heights = scan_heights(board)
+        for x in range(board.width):
+            self.assertEqual(board.column_height(x), heights[x])
+        counts = scan_row_counts(board)
+        for y in range(board.height):
+            self.assertEqual(board.row_count(y), counts[y])
+        self.assertEqual(board.hole_count(), scan_holes(board))
+
+
+    def drops(self, board, shape_class):
+        # drops the spawned shape, turned every way, in every column it
+        # fits in, checking drop_distance on the way; returns where it
+        # lands
+        landed = []
+        cells = movegen.spawn_piece(shape_class, board.width).cells
+        for turn in range(4):
+            for dx in range(-board.width, board.width):
+                moved = [(x + dx, y) for x, y in cells]
+                if all(board.can_move(x, y) for x, y in moved):
+                    shape = make_shape(shape_class, moved)
+                    fall = scan_drop(board, shape)
+                    self.assertEqual(board.drop_distance(shape), fall)
+                    landed.append([(x, y + fall) for x, y in moved])
+            cells = movegen.rotated(cells, -1)
+        return landed
+
+
+    def test_apply_undo(self):
+        cleared = undone = 0
+        for seed in range(10):
+            rng = random.Random(seed)
+            board = Board(None, Tetris.BOARD_WIDTH, Tetris.BOARD_HEIGHT)
+            for step in range(150):
+                if board.history and rng.random() < 0.25:
+                    board.undo()
+                    undone += 1
+                    self.check(board)
+                    continue
+                shape_class = rng.choice(Tetris.SHAPES)
+                placements = self.drops(board, shape_class)
+                if rng.random() < 0.1:
+                    # every reachable placement, tucked under overhangs too
+                    placements = [cells for cells, path in movegen.search(
+                        board.can_move, board.width, board.height,
+                        movegen.spawn_piece(shape_class, board.width))]
+                if not placements:
+                    break
+                # mostly the lowest placement, which fills rows
+                if rng.random() < 0.7:
+                    cells = max(placements, key=lambda p: sum(y for x, y in p))
+                else:
+                    cells = rng.choice(placements)
+                shape = make_shape(shape_class, cells)
+                self.assertEqual(board.drop_distance(shape), 0)
+                cleared += board.apply(shape)
+                self.check(board)
+        self.assertTrue(cleared)
+        self.assertTrue(undone)
+
+
+    def test_game(self):
+        keys = ['Left', 'Right', 'Down', 'Up', 'space']
+        for seed in range(5):
+            rng = random.Random(seed)
+            game = Tetris(None, seed=seed)
+            for step in range(2000):
+                game.handle_key(rng.choice(keys))
+                if game.over:
+                    break
+                self.check(game.board)
+                self.assertEqual(game.board.drop_distance(game.current_shape),
+                                 scan_drop(game.board, game.current_shape))
+
+
+if __name__ == '__main__':
+    unittest.main()
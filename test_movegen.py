@@ -0,0 +1,49 @@
+'''
+test_movegen.py
+
+Tests perft against placement counts worked out by hand.
+
+Usage: python -m unittest test_movegen
+
+@author chindesaurus
+'''
+import unittest
+
+import movegen
+from movegen import parse_board, perft, TEST_BOARDS
+from tetris import I_shape, O_shape, S_shape, T_shape
+
+
+class PerftTest(unittest.TestCase):
+
+    def test_depth_0_is_the_board(self):
+        self.assertEqual(perft(parse_board([]), [T_shape], 0), 1)
+
+
+    def test_empty_board(self):
+        empty = parse_board([])
+        # I: 7 columns lying down, 10 standing up
+        self.assertEqual(perft(empty, [I_shape], 1), 17)
+        # O: 9 columns, one way up
+        self.assertEqual(perft(empty, [O_shape], 1), 9)
+        # S: 8 columns lying down, 9 standing up
+        self.assertEqual(perft(empty, [S_shape], 1), 17)
+        # T: 8 columns pointing up or down, 9 pointing left or right
+        self.assertEqual(perft(empty, [T_shape], 1), 34)
+
+
+    def test_well(self):
+        # a stack of four rows with a well in the last column: the
+        # standing I fills the well, and lands on the stack in the 9
+        # other columns; lying down it has 7 columns on the stack
+        board = parse_board(TEST_BOARDS['well'])
+        self.assertEqual(perft(board, [I_shape], 1), 17)
+        piece = movegen.spawn_piece(I_shape, board.width)
+        placements = movegen.search(board.can_move, board.width,
+                                    board.height, piece)
+        well = [(9, 16), (9, 17), (9, 18), (9, 19)]
+        self.assertIn(well, [sorted(cells) for cells, path in placements])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+'''
+test_replay.py
+
+Tests that a recorded game plays back to the same state.
+
+Usage: python -m unittest test_replay
+
+@author chindesaurus
+'''
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import replay
+from replay import Replay
+from tetris import Tetris
+
+
+class Key(object):
+    # stands in for the Tk event key_pressed is given
+    def __init__(self, keysym):
+        self.keysym = keysym
+
+
+def board_state(game):
+    state = game.get_state()
+    return state['board'].rows, state['shape'], state['over']
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'game.rep')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def play(self, game, rng, frames):
+        # random keys and frames of gravity, as the window plays them
+        for i in range(frames):
+            if rng.random() < 0.3:
+                game.key_pressed(Key(rng.choice(['Left', 'Right', 'Up', 'Down'])))
+            game.step()
+
+
+    def test_log_with_save_and_load(self):
+        seed = 11
+        live = Tetris(None, seed=seed, replay=Replay(seed))
+        live.save_path = os.path.join(self.directory, 'game.sav')
+        live.gravity = 0.25
+        rng = random.Random(3)
+        self.play(live, rng, 100)
+        live.key_pressed(Key('s'))
+        self.play(live, rng, 100)
+        live.key_pressed(Key('l'))
+        self.play(live, rng, 100)
+        live.replay.save(self.path)
+
+        played = Tetris(None, seed=seed)
+        played.gravity = live.gravity
+        replay.load(self.path).play(played)
+        self.assertIn('l', [key for ms, key in live.replay.events])
+        self.assertEqual(board_state(played), board_state(live))
+
+
+    def test_gravity_steps(self):
+        for gravity in (Tetris.FRAME_MS / 1000.0, 1, 3, Tetris.BOARD_HEIGHT):
+            live = Tetris(None, seed=5, replay=Replay(5))
+            live.gravity = gravity
+            self.play(live, random.Random(7), 300)
+            live.replay.save(self.path)
+            played = Tetris(None, seed=5)
+            replay.load(self.path).play(played)
+            self.assertEqual(board_state(played), board_state(live))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+'''
+test_savegame.py
+
+Tests that a game saved and loaded again plays on as the original.
+
+Usage: python -m unittest test_savegame
+
+@author chindesaurus
+'''
+import random
+import unittest
+
+import savegame
+from snapshot import Snapshot
+from tetris import Tetris
+
+
+def play(game, seed, pieces):
+    # drops pieces at random columns and rotations; a dropped piece is
+    # added to the board on the next move down
+    rng = random.Random(seed)
+    for i in range(pieces):
+        for key in ['Up'] * rng.randint(0, 3):
+            game.handle_key(key)
+        for key in [rng.choice(['Left', 'Right'])] * rng.randint(0, 5):
+            game.handle_key(key)
+        game.handle_key('space')
+        game.handle_key('Down')
+        if game.over:
+            break
+
+
+def cells(game):
+    return [(block.x, block.y) for block in game.current_shape.get_blocks()]
+
+
+class RoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.game = Tetris(None, seed=7)
+        play(self.game, 7, 25)
+        # part of the way to the next row
+        for i in range(5):
+            self.game.step()
+        self.copy = Tetris(None)
+        savegame.loads(savegame.dumps(self.game), self.copy)
+
+
+    def test_board(self):
+        board, copy = self.game.board, self.copy.board
+        self.assertEqual(Snapshot.from_board(copy).rows,
+                         Snapshot.from_board(board).rows)
+        self.assertEqual(copy.heights, board.heights)
+        self.assertEqual(copy.row_counts, board.row_counts)
+        self.assertEqual(copy.height_sum, board.height_sum)
+
+
+    def test_shape(self):
+        self.assertIs(type(self.copy.current_shape),
+                      type(self.game.current_shape))
+        self.assertEqual(cells(self.copy), cells(self.game))
+        self.assertEqual(self.copy.current_shape.rotation_dir,
+                         self.game.current_shape.rotation_dir)
+        for i in range(3):
+            self.game.handle_key('Up')
+            self.copy.handle_key('Up')
+            self.assertEqual(cells(self.copy), cells(self.game))
+
+
+    def test_gravity(self):
+        self.assertNotEqual(self.game.gravity_progress, 0.0)
+        self.assertEqual(self.copy.gravity, self.game.gravity)
+        self.assertEqual(self.copy.gravity_progress,
+                         self.game.gravity_progress)
+        for i in range(100):
+            self.game.step()
+            self.copy.step()
+            self.assertEqual(cells(self.copy), cells(self.game))
+
+
+    def test_plays_on(self):
+        # the rng continues where it was, so the same keys give the same
+        # pieces and the same board
+        play(self.game, 8, 10)
+        play(self.copy, 8, 10)
+        self.assertEqual(Snapshot.from_board(self.copy.board).rows,
+                         Snapshot.from_board(self.game.board).rows)
+        self.assertEqual(cells(self.copy), cells(self.game))
+        self.assertEqual(self.copy.rng.getstate(), self.game.rng.getstate())
+
+
+    def test_unpack(self):
+        data = savegame.dumps(self.game)
+        state = self.game.get_state()
+        self.assertEqual(savegame.unpack(data)['board'].rows,
+                         state['board'].rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,15 +3,47 @@ tetris.py
 
 Usage: python tetris.py
 
+Importing this module has no side effects and does not load tkinter:
+the engine classes can be used headless (see Board and Tetris), and the
+window is only created by main(). The performance overlay, saved games,
+the flight recorder and profiling are imported when first used.
+
 @author chindesaurus
 '''
-from __future__ import division
-
-from builtins import range
-from past.utils import old_div
-from builtins import object
-from graphics import *
+import graphics
+from graphics import GraphicsObject, Rectangle, Point, Text, shared_config
+from replay import gravity_key
+from snapshot import Snapshot
+import contextlib
+import os
 import random
+import sys
+import time
+
+
+############################################################
+# PROFILING HOOKS
+############################################################
+
+# the span handed out while tracing is off
+_NULL_SPAN = contextlib.nullcontext()
+
+def span(name):
+    ''' Same as profiling.span. profiling is not imported here: tracing
+        can only be on once something has imported it to turn it on.
+    '''
+    profiling = sys.modules.get('profiling')
+    if profiling is None:
+        return _NULL_SPAN
+    return profiling.span(name)
+
+
+def tick(name):
+    ''' Same as profiling.tick (see span). '''
+    profiling = sys.modules.get('profiling')
+    if profiling is None:
+        return _NULL_SPAN
+    return profiling.tick(name)
 
 
 ############################################################
@@ -31,17 +63,64 @@ class Block(Rectangle):
     BLOCK_SIZE = 30
     OUTLINE_WIDTH = 3
 
+    # A board holds hundreds of blocks, so a block keeps no instance
+    # dictionary and no corner points (p1 and p2 are worked out from x
+    # and y when the block is drawn), and shares one configuration with
+    # every other block of its color.
+    __slots__ = ('x', 'y')
+
     def __init__(self, pos, color):
+        GraphicsObject.__init__(self, [])
         self.x = pos.x
         self.y = pos.y
-        
-        p1 = Point(pos.x*Block.BLOCK_SIZE + Block.OUTLINE_WIDTH,
-                   pos.y*Block.BLOCK_SIZE + Block.OUTLINE_WIDTH)
-        p2 = Point(p1.x + Block.BLOCK_SIZE, p1.y + Block.BLOCK_SIZE)
+        self.config = Block.color_config(color)
+
+
+    @staticmethod
+    def color_config(color):
+        ''' Returns the configuration shared by the blocks of color. '''
+        return shared_config(['outline', 'width', 'fill'],
+                             width=Block.OUTLINE_WIDTH, fill=color)
+
+
+    @staticmethod
+    def ghost_config(color):
+        ''' Returns the configuration shared by the ghost blocks of
+            color: an outline of that color and no fill.
+        '''
+        return shared_config(['outline', 'width', 'fill'],
+                             width=Block.OUTLINE_WIDTH, fill='', outline=color)
 
-        Rectangle.__init__(self, p1, p2)
-        self.setWidth(Block.OUTLINE_WIDTH)
-        self.setFill(color)
+
+    @classmethod
+    def make(cls, x, y, config):
+        ''' Parameters: x - type: int
+                        y - type: int
+                        config - type: dict - from color_config
+
+            Makes an undrawn block at square x,y like Block(Point(x, y),
+            color), but without the Point and the configuration lookup,
+            for code that makes many blocks at once.
+        '''
+        block = cls.__new__(cls)
+        block.canvas_frame = None
+        block.id = None
+        block.config = config
+        block.x = x
+        block.y = y
+        return block
+
+
+    @property
+    def p1(self):
+        return Point(self.x*Block.BLOCK_SIZE + Block.OUTLINE_WIDTH,
+                     self.y*Block.BLOCK_SIZE + Block.OUTLINE_WIDTH)
+
+
+    @property
+    def p2(self):
+        return Point((self.x + 1)*Block.BLOCK_SIZE + Block.OUTLINE_WIDTH,
+                     (self.y + 1)*Block.BLOCK_SIZE + Block.OUTLINE_WIDTH)
 
 
     def can_move(self, board, dx, dy):
@@ -70,6 +149,17 @@ class Block(Rectangle):
         Rectangle.move(self, dx*Block.BLOCK_SIZE, dy*Block.BLOCK_SIZE)
 
 
+    def _move(self, dx, dy):
+        # the corners follow x and y, which move has already updated
+        pass
+
+
+    def __getstate__(self):
+        # leave the computed corners out when pickling or copying
+        return (None, {'canvas_frame': self.canvas_frame, 'id': self.id,
+                       'config': self.config, 'x': self.x, 'y': self.y})
+
+
 ############################################################
 # SHAPE CLASS
 ############################################################
@@ -301,23 +391,59 @@ class Board(object):
         Attributes: width - type:int - width of the board in squares
                     height - type:int - height of the board in squares
                     canvas - type:CanvasFrame - where the pieces will be drawn
+                    (None for a headless board)
+                    RENDERERS - type:dictionary - renderer name to the
+                    graphics CanvasFrame class a windowed board draws with
                     grid - type:Dictionary - keeps track of the current state of
                     the board; stores the blocks for a given position
+                    heights - type:list - the height of every column, 0 if
+                    it is empty
+                    row_counts - type:list - the number of blocks in every row
+                    message - type:Text - the game over message, once shown
+
+        heights, row_counts and the hole count are kept up to date as
+        blocks are added and rows removed, so they cost nothing to read.
+        Blocks must go in and out of grid through the Board methods
+        (add_block and remove_block for single blocks) for this to hold.
     '''
+
+    # 'canvas' makes a canvas rectangle per block; 'pixmap' draws every
+    # block into one image, so the canvas item count stays constant
+    RENDERERS = {'canvas': 'CanvasFrame', 'pixmap': 'PixmapCanvasFrame'}
     
-    def __init__(self, win, width, height):
+    def __init__(self, win, width, height, canvas=None, renderer='canvas'):
         self.width = width
         self.height = height
 
         # create a canvas to draw the tetris shapes on
-        self.canvas = CanvasFrame(win, self.width * Block.BLOCK_SIZE,
-                                        self.height * Block.BLOCK_SIZE)
-        self.canvas.setBackground('light gray')
+        # a board created without a window or canvas is headless (used by
+        # search code and tools) and draws nothing at all; pass a
+        # NullCanvasFrame or RecordingCanvasFrame to run the drawing code
+        # without a display
+        self.canvas = canvas
+        if canvas is None and win is not None:
+            frame = getattr(graphics, Board.RENDERERS[renderer])
+            self.canvas = frame(win, self.width * Block.BLOCK_SIZE,
+                                self.height * Block.BLOCK_SIZE)
+        if self.canvas is not None:
+            self.canvas.setBackground('light gray')
 
         # create an empty dictionary
         # currently we have no shapes on the board
         self.grid = {}
 
+        # the skyline and the blocks per row; the sum of the column
+        # heights less the number of blocks is the number of holes
+        self.heights = [0] * width
+        self.row_counts = [0] * height
+        self.height_sum = 0
+
+        # (shape, removed rows) for each apply, so it can be undone
+        self.history = []
+
+        # the game over message, once it is shown
+        self.message = None
+
 
     def draw_shape(self, shape):
         ''' Parameters: shape - type: Shape
@@ -327,7 +453,8 @@ class Board(object):
             and returns True, else returns False.
         '''
         if shape.can_move(self, 0, 0):
-            shape.draw(self.canvas)
+            if self.canvas is not None:
+                shape.draw(self.canvas)
             return True
         return False
 
@@ -348,7 +475,7 @@ class Board(object):
             
         '''
         # boolean - is position x,y within the board boundaries?
-        withinBoard = (x in range(Tetris.BOARD_WIDTH) and y in range(Tetris.BOARD_HEIGHT))
+        withinBoard = (x in range(self.width) and y in range(self.height))
 
         # boolean - is there a block at position x,y?
         occupied = ((x, y) in self.grid)
@@ -356,6 +483,101 @@ class Board(object):
         return (withinBoard and not occupied)
 
 
+    ############################################################
+    # SKYLINE
+    ############################################################
+
+    def column_height(self, x):
+        ''' Returns the height of column x: the number of rows from
+            the bottom of the board to the top of its highest block.
+        '''
+        return self.heights[x]
+
+
+    def row_count(self, y):
+        ''' Returns the number of blocks in row y. '''
+        return self.row_counts[y]
+
+
+    def hole_count(self):
+        ''' Returns the number of holes: empty squares with a block
+            somewhere above them in their column.
+        '''
+        return self.height_sum - len(self.grid)
+
+
+    def drop_distance(self, shape):
+        ''' Parameter: shape - type:Shape
+            Return value: type:int
+
+            Returns how many rows the shape can fall before it lands.
+            A block above the top of its column lands on the skyline; only
+            a block tucked under an overhang looks down its column.
+        '''
+        height = self.height
+        heights = self.heights
+        grid = self.grid
+        distance = height
+        for block in shape.get_blocks():
+            x = block.x
+            y = block.y
+            top = height - heights[x]
+            if y < top:
+                fall = top - 1 - y
+            else:
+                fall = 0
+                while y + fall + 1 < height and (x, y + fall + 1) not in grid:
+                    fall += 1
+            if fall < distance:
+                distance = fall
+        return distance
+
+
+    def _raise_column(self, x, y):
+        # a block went into x,y: the column is at least that high
+        height = self.height - y
+        if height > self.heights[x]:
+            self.height_sum += height - self.heights[x]
+            self.heights[x] = height
+
+
+    def _lower_column(self, x, y):
+        # the block at x,y is gone: if it was the top of its column, the
+        # next block down is
+        if self.heights[x] != self.height - y:
+            return
+        grid = self.grid
+        below = y + 1
+        while below < self.height and (x, below) not in grid:
+            below += 1
+        self.height_sum -= self.heights[x] - (self.height - below)
+        self.heights[x] = self.height - below
+
+
+    def add_block(self, block):
+        ''' Parameter: block - type:Block
+
+            Puts block into the grid at its x,y square (without drawing it).
+        '''
+        self.grid[block.x, block.y] = block
+        self.row_counts[block.y] += 1
+        self._raise_column(block.x, block.y)
+
+
+    def remove_block(self, x, y):
+        ''' Parameters: x - type:int
+                        y - type:int
+            Return value: type:Block
+
+            Takes the block at x,y out of the grid (without undrawing it)
+            and returns it.
+        '''
+        block = self.grid.pop((x, y))
+        self.row_counts[y] -= 1
+        self._lower_column(x, y)
+        return block
+
+
     def add_shape(self, shape):
         ''' Parameter: shape - type:Shape
             
@@ -368,7 +590,7 @@ class Board(object):
 
         # add to dictionary: (x,y) coordinates as key, block as value
         for block in listBlocks:
-            self.grid.update({(block.x, block.y):block})
+            self.add_block(block)
 
 
     def delete_row(self, y):
@@ -378,27 +600,18 @@ class Board(object):
         '''
         # remove all blocks in row y from the grid
         # and undraw them
-        for x in range(Tetris.BOARD_WIDTH):
-            self.grid[x, y].undraw()
-            del self.grid[x, y]
+        for x in range(self.width):
+            self.remove_block(x, y).undraw()
         
  
     def is_row_complete(self, y):        
         ''' Parameter: y - type: int
             Return value: type: bool
 
-            For each block in row y
-            check if there is a block in the grid (use the in operator).
-            If there is one square that is not occupied, return False
-            otherwise return True.
+            The row is complete when it holds a block in every column,
+            which row_counts tells without looking at the grid.
         '''
-        # for each block in row y
-        for x in range(Tetris.BOARD_WIDTH):
-
-            # if there is not a block in the row
-            if not((x, y) in self.grid):
-                return False
-        return True
+        return self.row_counts[y] == self.width
    
  
     def move_down_rows(self, y_start):
@@ -414,7 +627,7 @@ class Board(object):
                     and then place it back in the grid in the new position
         '''
         for y in range(y_start, -1, -1):
-            for x in range(Tetris.BOARD_WIDTH):
+            for x in range(self.width):
                 if (x, y) in self.grid:
 
                     block = self.grid[(x, y)]
@@ -427,18 +640,33 @@ class Board(object):
     
                     # place block back in the grid in the new position
                     self.grid[(x, y + 1)] = block
+
+        # the rows moved down, and so did every column topped in one
+        counts = self.row_counts
+        counts[1:y_start + 2] = counts[0:y_start + 1]
+        counts[0] = 0
+        top = self.height - y_start
+        for x in range(self.width):
+            if self.heights[x] >= top:
+                self.heights[x] -= 1
+                self.height_sum -= 1
                    
  
     def remove_complete_rows(self):
-        ''' Removes all the complete rows
+        ''' Return value: type: int
+
+            Removes all the complete rows
             1. for each row, y, 
             2. check if the row is complete
                 if it is,
                     delete the row
                     move all rows down starting at row y - 1
+            Returns the number of rows removed.
         '''
+        removed = 0
+
         # for each row y
-        for y in range(Tetris.BOARD_HEIGHT):
+        for y in range(self.height):
             
             # if the row is complete 
             if self.is_row_complete(y):
@@ -448,14 +676,216 @@ class Board(object):
 
                 # move all rows down starting at row y - 1
                 self.move_down_rows(y - 1)
+                removed += 1
+
+        return removed
+
+
+    def apply(self, shape):
+        ''' Parameter: shape - type:Shape
+            Return value: type: int
+
+            Locks the shape into the board like add_shape followed by
+            remove_complete_rows, but records what changed so that undo
+            can put it back. Only the rows the shape touches are checked.
+            Returns the number of rows removed.
+        '''
+        self.add_shape(shape)
+
+        # only rows holding one of the new blocks can have become complete
+        rows = sorted(set(block.y for block in shape.get_blocks()))
+        cleared = []
+        for y in rows:
+            if self.is_row_complete(y):
+                row = [self.remove_block(x, y) for x in range(self.width)]
+                for block in row:
+                    block.undraw()
+                self.move_down_rows(y - 1)
+                cleared.append((y, row))
+
+        self.history.append((shape, cleared))
+        return len(cleared)
+
+
+    def undo(self):
+        ''' Return value: type:Shape
+
+            Reverts the last apply: moves the rows above each removed row
+            back up, puts the removed blocks back and takes the shape's
+            blocks off the board, and off the canvas. Returns the shape
+            that was applied.
+        '''
+        shape, cleared = self.history.pop()
+
+        for y, row in reversed(cleared):
+            self.move_up_rows(y - 1)
+            for x, block in enumerate(row):
+                self.add_block(block)
+                if self.canvas is not None:
+                    block.draw(self.canvas)
+
+        for block in shape.get_blocks():
+            self.remove_block(block.x, block.y)
+            if self.canvas is not None:
+                block.undraw()
+        return shape
+
+
+    def move_up_rows(self, y_end):
+        ''' Parameters: y_end - type:int
+
+            The reverse of move_down_rows: moves all rows from the top
+            down to y_end + 1 (inclusive) up one square.
+        '''
+        for y in range(1, y_end + 2):
+            for x in range(self.width):
+                if (x, y) in self.grid:
+                    block = self.grid.pop((x, y))
+                    block.move(0, -1)
+                    self.grid[(x, y - 1)] = block
+
+        # the rows moved up, and so did every column topped in one
+        counts = self.row_counts
+        counts[0:y_end + 1] = counts[1:y_end + 2]
+        counts[y_end + 1] = 0
+        top = self.height - (y_end + 1)
+        for x in range(self.width):
+            if self.heights[x] >= top:
+                self.heights[x] += 1
+                self.height_sum += 1
+
+
+    def clear(self):
+        ''' Removes every block and the game over message from the
+            board and forgets the apply history. The canvas items of the
+            blocks are deleted in one call.
+        '''
+        if self.canvas is not None:
+            items = [block.id for block in self.grid.values()
+                     if block.id is not None]
+            if items:
+                self.canvas.canvas.delete(*items)
+        if self.message is not None:
+            self.message.undraw()
+            self.message = None
+        self.grid = {}
+        self.history = []
+        self.heights = [0] * self.width
+        self.row_counts = [0] * self.height
+        self.height_sum = 0
+
+
+    def restore(self, snapshot):
+        ''' Parameter: snapshot - type:snapshot.Snapshot
+
+            Replaces the blocks on the board with those of snapshot. The
+            blocks are made in bulk (see Block.make) and, if the board
+            has a canvas, drawn in one pass afterwards (see draw_blocks).
+            The apply history is forgotten.
+        '''
+        self.clear()
+        grid = self.grid
+        make = Block.make
+        configs = {}
+        heights = self.heights
+        for y, row in enumerate(snapshot.rows):
+            if not any(row):
+                continue
+            count = 0
+            for x, color in enumerate(row):
+                if color is not None:
+                    config = configs.get(color)
+                    if config is None:
+                        config = configs[color] = Block.color_config(color)
+                    grid[x, y] = make(x, y, config)
+                    count += 1
+                    if not heights[x]:
+                        heights[x] = self.height - y
+            self.row_counts[y] = count
+        self.height_sum = sum(heights)
+        if self.canvas is not None:
+            self.draw_blocks(list(grid.values()))
+
+
+    def restore_bits(self, bits, palette, codes):
+        ''' Parameters: bits - type:int - bit y * width + x is set for an
+                        occupied square x,y
+                        palette - type:list of strings - block colors
+                        codes - type:list of int - the palette index of
+                        every occupied square, in bit order
+
+            Like restore, from the occupancy bitmask of a save (see
+            savegame.py) rather than a snapshot. The row counts and the
+            skyline come from the bits of each row, not from the squares;
+            only the blocks themselves are made square by square.
+        '''
+        self.clear()
+        grid = self.grid
+        make = Block.make
+        configs = [Block.color_config(color) for color in palette]
+        heights = self.heights
+        counts = self.row_counts
+        width = self.width
+        mask = (1 << width) - 1
+        topped = 0    # the columns whose top block has been seen
+        i = 0
+        for y in range(self.height):
+            row = (bits >> (y * width)) & mask
+            if not row:
+                continue
+            counts[y] = bin(row).count('1')
+            new = row & ~topped
+            topped |= new
+            while new:
+                low = new & -new
+                heights[low.bit_length() - 1] = self.height - y
+                new ^= low
+            while row:
+                low = row & -row
+                x = low.bit_length() - 1
+                grid[x, y] = make(x, y, configs[codes[i]])
+                i += 1
+                row ^= low
+        self.height_sum = sum(heights)
+        if self.canvas is not None:
+            self.draw_blocks(list(grid.values()))
+
+
+    def draw_blocks(self, blocks):
+        ''' Parameter: blocks - type:list of Block - undrawn blocks
+
+            Draws blocks on the board's canvas. A renderer that makes
+            many rectangles in one call (PixmapCanvas.create_rectangles)
+            gets them all at once and repaints them as one band. A Tk
+            canvas has no such call, so on the default renderer this is
+            not a bulk pass: every block is a create_rectangle of its own.
+        '''
+        frame = self.canvas
+        bulk = getattr(frame.canvas, 'create_rectangles', None)
+        if bulk is None:
+            for block in blocks:
+                block.draw(frame)
+            return
+        rects = []
+        for block in blocks:
+            p1 = block.p1
+            p2 = block.p2
+            x1, y1 = frame.toScreen(p1.x, p1.y)
+            x2, y2 = frame.toScreen(p2.x, p2.y)
+            rects.append((x1, y1, x2, y2, block.config))
+        for block, item in zip(blocks, bulk(rects)):
+            block.canvas_frame = frame
+            block.id = item
 
 
     def game_over(self):
         ''' Display "Game Over !!!" message in the center of the board
         '''
-        message = Text(Point(150, 150), "Game Over !!!\n Thanks for playing.")
-        message.setSize(32)
-        message.draw(self.canvas)
+        if self.canvas is None or self.message is not None:
+            return
+        self.message = Text(Point(150, 150), "Game Over !!!\n Thanks for playing.")
+        self.message.setSize(32)
+        self.message.draw(self.canvas)
 
 
 ############################################################
@@ -467,58 +897,116 @@ class Tetris(object):
         Attributes:
             SHAPES - type: list (list of Shape classes)
             DIRECTION - type: dictionary - converts string direction to (dx, dy)
-            BOARD_WIDTH - type:int - the width of the board
-            BOARD_HEIGHT - type:int - the height of the board
+            BOARD_WIDTH - type:int - the width of the board, unless
+            another is given
+            BOARD_HEIGHT - type:int - the height of the board, unless
+            another is given
             board - type:Board - the tetris board
             win - type:Window - the window for the tetris game
-            delay - type:int - the speed in milliseconds for moving the shapes
+            FRAME_MS - type:int - milliseconds per frame of gravity
+            gravity - type:float - the speed of the shapes in rows per frame
+            (FRAME_MS / 1000.0 is a row a second, BOARD_HEIGHT is 20G)
+            gravity_progress - type:float - the part of a row gravity has
+            built up towards the next
             current_shape - type: Shape - the current moving shape on the board
             paused - type: boolean - whether or not the game is currently paused
+            over - type: boolean - whether or not the game has ended
+            rng - type: random.Random - picks the shapes; seeded for repeatable games
+            hud - type: PerfHUD - the performance overlay, or None
+            metrics - type: metrics.Metrics - where gameplay metrics go, or None
+            recorder - type: flightrec.FlightRecorder - recent events, or None
+            ticks - type: int - key presses and gravity steps handled so far
+            replay - type: replay.Replay - where inputs are recorded, or None
+            save_path - type: string - where S saves the game and L loads it
+            from (see savegame.py), or None
+            ghost - type: list of Block - the outline of where the current
+            shape would land, or None when there is nothing to show
+
+        A game created without a window (win=None) is headless: it has no
+        keyboard bindings and no animation timer, and is driven by calling
+        do_move, do_rotate and do_drop directly. It draws nothing unless
+        a canvas (e.g. a graphics.RecordingCanvasFrame) is given. With a
+        window, renderer picks how the board is drawn (see
+        Board.RENDERERS). width and height make a board of another size
+        for this game alone.
     '''
     SHAPES = [I_shape, J_shape, L_shape, O_shape, S_shape, T_shape, Z_shape]
     DIRECTION = {'Left':(-1, 0), 'Right':(1, 0), 'Down':(0, 1)}
     BOARD_WIDTH = 10
     BOARD_HEIGHT = 20
+    FRAME_MS = 16
    
  
-    def __init__(self, win):
-        self.board = Board(win, self.BOARD_WIDTH, self.BOARD_HEIGHT)
+    def __init__(self, win, seed=None, canvas=None, renderer='canvas',
+                 replay=None, width=None, height=None):
+        self.board = Board(win, width or self.BOARD_WIDTH,
+                           height or self.BOARD_HEIGHT, canvas, renderer)
         self.win = win
-        self.delay = 1000 # milliseconds
+        self.gravity = self.FRAME_MS / 1000.0 # a row a second
+        self.gravity_progress = 0.0
+        self.rng = random.Random(seed)
 
         # sets up the keyboard events
         # when a key is called the method key_pressed will be called
-        self.win.bind_all('<Key>', self.key_pressed)
+        if self.win is not None:
+            self.win.bind_all('<Key>', self.key_pressed)
 
         # set the current shape to a random new shape
         self.current_shape = self.create_new_shape()
 
-        # draw the current_shape on the board
+        # draw the current_shape on the board, and where it would land
         Board.draw_shape(self.board, self.current_shape)
 
         # the game is initially not paused
         self.paused = False
 
+        # set once a new shape no longer fits on the board
+        self.over = False
+
+        # the outline of where the current shape would land
+        self.ghost = None
+        self.update_ghost()
+
+        # the performance overlay, created when it is first shown
+        self.hud = None
+
+        # a metrics.Metrics to record gameplay metrics into, if any
+        self.metrics = None
+
+        # a flightrec.FlightRecorder keeping the last engine events, if any,
+        # and the number of key presses and gravity steps so far
+        self.recorder = None
+        self.ticks = 0
+
+        # a replay.Replay recording the inputs, if any; given here so the
+        # first gravity step is recorded too
+        self.replay = replay
+
+        # where the S and L keys save and load the game, if anywhere
+        self.save_path = None
+
         # animate the shape!
-        self.animate_shape()
+        self.timer = None
+        if self.win is not None:
+            self.animate_shape()
 
 
     def create_new_shape(self):
         ''' Return value: type: Shape
             
             Creates a random new shape that is centered
-            at y = 0 and x = int(self.BOARD_WIDTH/2).
+            at y = 0 and x = int(self.board.width/2).
             Returns the shape.
         '''
 
         # generate a pseudorandom integer in this range (inclusive)
-        index = random.randint(0, len(Tetris.SHAPES) - 1)
+        index = self.rng.randint(0, len(Tetris.SHAPES) - 1)
 
         # select a shape
         shape = Tetris.SHAPES[index]
 
         # center the shape at this point
-        point = Point(int(old_div(self.BOARD_WIDTH, 2)), 0)
+        point = Point(self.board.width // 2, 0)
 
         if shape == I_shape:
             ref = I_shape(point)
@@ -540,13 +1028,187 @@ class Tetris(object):
      
     
     def animate_shape(self):
-        ''' Animate the shape - move down at equal intervals
-            specified by the delay attribute so long as the 
-            game is not paused.
+        ''' Animate the shape - runs a frame of gravity (see step) every
+            FRAME_MS milliseconds.
+        '''
+        hud = self.hud
+        if hud is not None:
+            token = hud.begin_gravity()
+        rows = self.step()
+        if hud is not None:
+            hud.end_gravity(token, rows > 0)
+        self.timer = self.win.after(self.FRAME_MS, self.animate_shape)
+
+
+    def step(self):
+        ''' Return value: type: int - the rows that fell
+
+            Runs a frame of gravity. Frames in which no whole row is due
+            do nothing but add to gravity_progress; the others are gravity
+            steps, which count as a tick and are recorded in the replay,
+            the profile and the metrics. Every frontend calls this once
+            per frame.
         '''
-        if not self.paused:
+        rows = self.gravity_rows()
+        if rows:
+            start = time.perf_counter()
+            self.ticks += 1
+            if self.replay is not None:
+                self.replay.record(gravity_key(rows))
+
+            with tick('gravity'):
+                self.fall(rows)
+                self.flush()
+
+            if self.metrics is not None:
+                self.metrics.tick(time.perf_counter() - start)
+        return rows
+
+
+    def gravity_rows(self):
+        ''' Return value: type: int - the rows due this frame
+
+            Adds a frame of gravity to gravity_progress and takes the whole
+            rows out of it. Nothing builds up while the game is paused or
+            over.
+        '''
+        if self.paused or self.over:
+            return 0
+        progress = self.gravity_progress + self.gravity
+        rows = int(progress)
+        self.gravity_progress = progress - rows
+        return rows
+
+
+    def fall(self, rows):
+        ''' Parameters: rows - type: int
+
+            Moves the current shape down rows rows, or as far as it can
+            go, in one move of at most Board.drop_distance rows. A shape
+            that is already resting is locked, as a move down would lock
+            it, so one row of gravity is the Down key. Any number of rows,
+            up to 20G, costs one drop_distance query.
+        '''
+        if self.paused or self.over:
+            return
+        distance = self.board.drop_distance(self.current_shape)
+        if not distance:
             self.do_move('Down')
-        self.win.after(self.delay, self.animate_shape)
+            return
+        with span('move'):
+            self.current_shape.move(0, min(rows, distance))
+            self.update_ghost()
+        self.record('move')
+
+
+    def flush(self):
+        ''' While profiling, redraws the canvas straight away so the time
+            Tk spends drawing is part of the tick. Otherwise Tk redraws
+            when it is idle.
+        '''
+        profiling = sys.modules.get('profiling')
+        if profiling is not None and profiling.enabled and \
+           self.board.canvas is not None:
+            with span('render'):
+                self.board.canvas.flush()
+
+
+    def stop(self):
+        ''' Stops the animation timer, e.g. before the window is reused
+            for another game.
+        '''
+        if self.timer is not None:
+            self.win.after_cancel(self.timer)
+            self.timer = None
+   
+ 
+    def get_state(self):
+        ''' Return value: type: dict
+
+            Returns the state of the game as plain, picklable values: the
+            board as a snapshot.Snapshot, the current shape (its index in
+            SHAPES, its squares and its rotation direction), the state of
+            rng, and the gravity, gravity_progress (as progress), paused,
+            over and ticks attributes. set_state puts a game, e.g. a new
+            one in another process, into it.
+        '''
+        shape = self.current_shape
+        return {'board': Snapshot.from_board(self.board),
+                'shape': (self.SHAPES.index(type(shape)),
+                          tuple((block.x, block.y) for block in shape.get_blocks()),
+                          shape.rotation_dir),
+                'rng': self.rng.getstate(),
+                'gravity': self.gravity,
+                'progress': self.gravity_progress,
+                'paused': self.paused,
+                'over': self.over,
+                'ticks': self.ticks}
+
+
+    def set_state(self, state):
+        ''' Parameter: state - type: dict - from get_state
+
+            Puts the game into the given state, redrawing the board if it
+            has a canvas. Instead of a snapshot, the board may be given as
+            bits, the arguments of Board.restore_bits (see savegame.loads).
+        '''
+        for block in self.current_shape.get_blocks():
+            block.undraw()
+        if 'bits' in state:
+            self.board.restore_bits(*state['bits'])
+        else:
+            self.board.restore(state['board'])
+
+        index, cells, rotation_dir = state['shape']
+        shape = self.SHAPES[index](Point(0, 0))
+        for block, (x, y) in zip(shape.get_blocks(), cells):
+            block.x = x
+            block.y = y
+        shape.rotation_dir = rotation_dir
+        self.current_shape = shape
+        self.rng.setstate(state['rng'])
+        self.gravity = state['gravity']
+        self.gravity_progress = state['progress']
+        self.paused = state['paused']
+        self.over = state['over']
+        self.ticks = state['ticks']
+        if self.board.canvas is not None and not self.over:
+            shape.draw(self.board.canvas)
+        self.update_ghost()
+
+
+    def update_ghost(self):
+        ''' Moves the ghost piece to where the current shape would land.
+            The landing row comes from Board.drop_distance, so the board
+            is not scanned, and only ghost blocks whose square changed are
+            moved. A new shape gets new ghost blocks in its color. There
+            is no ghost once the shape has landed, when the game is over
+            or in a game that does not draw.
+        '''
+        canvas = self.board.canvas
+        if canvas is None:
+            return
+        blocks = self.current_shape.get_blocks()
+        distance = 0 if self.over else self.board.drop_distance(self.current_shape)
+        ghost = self.ghost
+        config = Block.ghost_config(blocks[0].config['fill'])
+        if ghost is not None and (distance == 0 or ghost[0].config is not config):
+            for block in ghost:
+                block.undraw()
+            ghost = self.ghost = None
+        if distance == 0:
+            return
+        if ghost is None:
+            ghost = self.ghost = [Block.make(block.x, block.y + distance, config)
+                                  for block in blocks]
+            for block in ghost:
+                block.draw(canvas)
+            return
+        for block, target in zip(ghost, blocks):
+            dx = target.x - block.x
+            dy = target.y + distance - block.y
+            if dx or dy:
+                block.move(dx, dy)
    
  
     def do_move(self, direction):
@@ -560,10 +1222,14 @@ class Tetris(object):
             2. remove the completed rows if any 
             3. create a new random shape and set current_shape attribute
             4. If the shape cannot be drawn on the board, display a
-               game over message
+               game over message and mark the game as over
 
             Return False
         '''
+        # nothing moves once the game is over
+        if self.over:
+            return False
+
         # get the x and y displacements from DIRECTION attribute
         displacement = self.DIRECTION.get(direction)
         x = displacement[0]
@@ -571,7 +1237,10 @@ class Tetris(object):
 
         # move the shape (if possible)
         if self.current_shape.can_move(self.board, x, y):
-            self.current_shape.move(x, y)
+            with span('move'):
+                self.current_shape.move(x, y)
+                self.update_ghost()
+            self.record('move')
 
             return True
 
@@ -581,18 +1250,38 @@ class Tetris(object):
             if direction == 'Down':
 
                 # add the current shape to the board
-                self.board.add_shape(self.current_shape)
+                with span('lock'):
+                    self.board.add_shape(self.current_shape)
+                self.record('lock')
+                # the stack at its highest, before the rows are cleared
+                stack_height = max(self.board.heights)
 
                 # remove completed rows (if any)
-                self.board.remove_complete_rows()
+                with span('line_clear'):
+                    lines = self.board.remove_complete_rows()
 
-                # update Tetris.current_shape with a new random shape
-                self.current_shape = self.create_new_shape()
+                if self.metrics is not None:
+                    self.metrics.piece_locked(lines, stack_height)
+                if lines:
+                    self.record('row_clear', lines)
 
+                # update Tetris.current_shape with a new random shape
                 # draw the new shape on the board
                 # if not possible, then the game is over
-                if not self.board.draw_shape(self.current_shape):
+                with span('spawn'):
+                    self.current_shape = self.create_new_shape()
+                    drawn = self.board.draw_shape(self.current_shape)
+                self.record('spawn')
+                if not drawn:
+                    self.over = True
+                self.update_ghost()
+                if not drawn:
                     self.board.game_over()
+                    if self.metrics is not None:
+                        self.metrics.game_completed()
+                    if self.recorder is not None:
+                        self.record('game_over')
+                        self.recorder.dump('game over')
                 return False
             
 
@@ -600,11 +1289,62 @@ class Tetris(object):
         ''' Checks if the current_shape can be rotated and
             rotates if it can.
         '''
-        self.current_shape.rotate(self.board)
+        with span('rotate'):
+            self.current_shape.rotate(self.board)
+            self.update_ghost()
+        self.record('rotate')
+
+
+    def do_drop(self):
+        ''' Moves the current_shape down until it can no longer move,
+            in one move of Board.drop_distance rows. The shape is added to
+            the board on the next move down.
+        '''
+        with span('move'):
+            distance = self.board.drop_distance(self.current_shape)
+            if distance:
+                self.current_shape.move(0, distance)
+            self.update_ghost()
+        self.record('drop')
+
+
+    def record(self, event, extra=None):
+        ''' Parameters: event - type:string - a flightrec event name
+                        (see flightrec.EVENT_NAMES)
+                        extra - type:int - see FlightRecorder.record
+
+            Records an engine event in the flight recorder, if there is one.
+        '''
+        if self.recorder is not None:
+            self.recorder.record(self.ticks, self.recorder.CODES[event],
+                                 self.current_shape, extra)
    
  
     def key_pressed(self, event):
         ''' This function is called when a key is pressed on the keyboard.
+            It handles the key (see handle_key) and does the bookkeeping
+            for the performance overlay and profiling.
+        '''
+        hud = self.hud
+        if hud is not None:
+            token = hud.begin()
+        start = time.perf_counter()
+        self.ticks += 1
+        if self.replay is not None:
+            self.replay.record(event.keysym)
+
+        with tick('input'):
+            self.handle_key(event.keysym)
+            self.flush()
+
+        if self.metrics is not None:
+            self.metrics.tick(time.perf_counter() - start)
+        if hud is not None:
+            hud.end_input(token)
+
+
+    def handle_key(self, key):
+        ''' Parameters: key - type: string - the Tk keysym of the key
 
             If the user presses the arrow keys
             'Left', 'Right' or 'Down', the current_shape will move in
@@ -615,19 +1355,24 @@ class Tetris(object):
 
             If the user presses the 'Up' arrow key,
             the shape rotates.
+
+            'h' or 'H' shows and hides the performance overlay.
+
+            's' or 'S' saves the game to save_path and 'l' or 'L' loads
+            it back, if save_path is set. Loading is off while the game is
+            recorded (replay is set): a replay only holds inputs, and one
+            played back could not repeat the load.
         '''
-        key = event.keysym
         #print key   # for debugging
 
-        if not self.paused:
+        if not self.paused and not self.over:
             # move left, right, and down
             if key in self.DIRECTION: 
                 self.do_move(key)
 
             # drop piece
             elif key == "space":
-                while (self.current_shape.can_move(self.board, 0, 1)):
-                    self.current_shape.move(0, 1)
+                self.do_drop()
 
             # rotate 
             elif key == "Up":
@@ -637,11 +1382,122 @@ class Tetris(object):
         if key == 'p' or key == 'P':
             self.paused = not self.paused
 
+        # show and hide the performance overlay
+        if key == 'h' or key == 'H':
+            self.toggle_hud()
+
+        # save and load the game
+        if self.save_path is not None:
+            if key == 's' or key == 'S':
+                import savegame
+                savegame.save(self, self.save_path)
+            elif (key == 'l' or key == 'L') and self.replay is None and \
+                 os.path.exists(self.save_path):
+                import savegame
+                savegame.load(self.save_path, self)
+
+
+    def toggle_hud(self):
+        ''' Shows or hides the performance overlay, creating it the first
+            time it is needed.
+        '''
+        if self.board.canvas is None:
+            return
+        if self.hud is None:
+            from hud import PerfHUD
+            self.hud = PerfHUD(self)
+        self.hud.toggle()
+
        
 ################################################################
 # Start the game
 ################################################################
 
-win = Window("Tetris")
-game = Tetris(win)
-win.mainloop()
+def main(argv=None):
+    ''' Parameters: argv - type: list of strings - the command line
+                    arguments (default sys.argv[1:])
+
+        Parses the command line, opens the window and plays the game.
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(description='the relentless building block game!')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='write a Chrome trace of the game phases to FILE on exit')
+    parser.add_argument('--profile-ticks', metavar='N', type=int, default=0,
+                        help='with --trace, also save cProfile data for the N slowest ticks')
+    parser.add_argument('--flight-recorder', metavar='FILE',
+                        default=os.environ.get('TETRIS_FLIGHT_RECORDER'),
+                        help='keep the last engine events and dump them to FILE '
+                             'on game over, crash or SIGUSR1')
+    parser.add_argument('--renderer', choices=sorted(Board.RENDERERS),
+                        default='canvas',
+                        help='draw a canvas rectangle per block (canvas) or '
+                             'the whole board as one image (pixmap)')
+    parser.add_argument('--record', metavar='FILE',
+                        help='save the seed and inputs of the game to FILE, to '
+                             'replay or render later (see capture.py)')
+    parser.add_argument('--save', metavar='FILE', default='tetris.sav',
+                        help='where the S key saves the game and L loads it '
+                             'from (default %(default)s); L does nothing '
+                             'with --record')
+    parser.add_argument('--capture', metavar='FILE',
+                        help='write the game as a raw PPM video stream to FILE '
+                             '("-" for standard output)')
+    parser.add_argument('--spectate', metavar='HOST:PORT',
+                        help='stream the game to spectators (see spectate.py)')
+    parser.add_argument('--gravity', metavar='ROWS', type=float,
+                        help='how fast the shapes fall, in rows per frame of '
+                             '%d ms (default a row a second; %d is instant, '
+                             '20G)' % (Tetris.FRAME_MS, Tetris.BOARD_HEIGHT))
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='write the game metrics to FILE every 10 s (JSON '
+                             'lines for a .jsonl file, else Prometheus text)')
+    args = parser.parse_args(argv)
+    import profiling
+    profiling.enable_from_environment()
+    if args.trace:
+        profiling.enable(args.trace, args.profile_ticks)
+
+    seed = None
+    recording = None
+    if args.record:
+        from replay import Replay
+        seed = random.randrange(2 ** 32)
+        recording = Replay(seed)
+
+    win = graphics.Window("Tetris")
+    game = Tetris(win, seed=seed, renderer=args.renderer, replay=recording)
+    game.save_path = args.save
+    if args.gravity is not None:
+        game.gravity = args.gravity
+    if args.flight_recorder:
+        import flightrec
+        game.recorder = flightrec.FlightRecorder(Tetris.SHAPES,
+                                                 path=args.flight_recorder)
+        game.recorder.install(win)
+    flusher = None
+    if args.metrics:
+        from metrics import Metrics, MetricsFlusher
+        game.metrics = Metrics()
+        flusher = MetricsFlusher(game.metrics, args.metrics)
+        flusher.start()
+    live = None
+    if args.capture:
+        import capture
+        live = capture.LiveCapture(game, capture.open_output(args.capture))
+    if args.spectate:
+        import spectate
+        spectate.LiveStream(game, args.spectate)
+    try:
+        win.mainloop()
+    finally:
+        if recording is not None:
+            recording.save(args.record)
+        if live is not None:
+            live.close()
+        if flusher is not None:
+            flusher.stop()
+
+
+if __name__ == '__main__':
+    main()
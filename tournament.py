@@ -0,0 +1,359 @@
+'''
+tournament.py
+
+Bot tournaments: several bots play the same games, in parallel.
+
+A bot is a function choose(snapshot, piece, placements, rng) that is
+given the board (a snapshot.Snapshot), the piece to place (a
+movegen.Piece), every placement movegen.search finds for it and a
+random.Random of its own, and returns one of the placements. The built
+in bots are random and greedy; any other is named module:function.
+
+Every bot plays every game. A game is a seed, and the pieces of a game
+come from random.Random(seed) exactly as Tetris.create_new_shape draws
+them, so all bots get the same pieces in the same order, and so does
+Tetris(None, seed=seed). A game ends when a piece cannot spawn, or after
+the piece limit.
+
+Games run in a pool of worker processes. The longest games are started
+first, so no long game is left running alone at the end: every bot first
+plays a short probe game in the parent to time it, and a game's expected
+duration is its bot's seconds per piece times the piece limit (or the
+pieces it lasted, if it topped out in the probe).
+
+Usage: python tournament.py BOT... [-g GAMES] [-p PIECES] [-j JOBS]
+                            [--seed N] [--metrics FILE] [-o results.json]
+
+prints the mean lines, survival (pieces placed) and pieces per second of
+every bot with 95% confidence intervals, and writes them with the result
+of every game to results.json. With --metrics, the games are also
+recorded in a metrics.Metrics (a tick being a placement) that is
+written to FILE while the tournament runs: each worker sends the
+metrics of a game back with its result.
+
+@author chindesaurus
+'''
+import argparse
+import functools
+import importlib
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import movegen
+from metrics import Metrics, MetricsFlusher
+from snapshot import Snapshot
+from tetris import Tetris
+
+
+SEED = 2009
+GAMES = 20
+PIECES = 500
+PROBE_PIECES = 20
+# mixed into the seed of a game to seed the bots' random.Random, so the
+# choices of a random bot do not follow the pieces it is given
+BOT_SEED_MASK = 0x5bd1e995
+
+
+############################################################
+# BOTS
+############################################################
+
+def random_bot(snapshot, piece, placements, rng):
+    ''' Picks any placement. '''
+    return rng.choice(placements)
+
+
+def board_features(snapshot):
+    ''' Parameters: snapshot - type:Snapshot
+        Return value: type:tuple - (aggregate height, holes, bumpiness)
+
+        Aggregate height is the sum of the column heights, holes are the
+        empty squares under the top block of their column and bumpiness
+        is the sum of the height differences of neighboring columns.
+    '''
+    width, height = snapshot.width, snapshot.height
+    heights = [0] * width
+    holes = 0
+    for y, row in enumerate(snapshot.rows):
+        if not any(row):
+            continue
+        for x, color in enumerate(row):
+            if color is not None:
+                if not heights[x]:
+                    heights[x] = height - y
+            elif heights[x]:
+                holes += 1
+    bumpiness = sum(abs(heights[x] - heights[x + 1]) for x in range(width - 1))
+    return sum(heights), holes, bumpiness
+
+
+# weights of lines, aggregate height, holes and bumpiness for greedy
+GREEDY_WEIGHTS = (0.76, -0.51, -0.36, -0.18)
+
+def greedy_bot(snapshot, piece, placements, rng):
+    ''' Picks the placement whose board scores best on lines cleared,
+        aggregate height, holes and bumpiness.
+    '''
+    w_lines, w_height, w_holes, w_bumps = GREEDY_WEIGHTS
+    best = None
+    best_score = None
+    for placement in placements:
+        child, lines = snapshot.place(placement[0], piece.color)
+        total, holes, bumpiness = board_features(child)
+        score = (w_lines * lines + w_height * total + w_holes * holes
+                 + w_bumps * bumpiness)
+        if best_score is None or score > best_score:
+            best = placement
+            best_score = score
+    return best
+
+
+BOTS = {'random': random_bot, 'greedy': greedy_bot}
+
+
+def load_bot(name):
+    ''' Parameters: name - type:string - a built in bot or module:function
+        Return value: type:function
+    '''
+    if name in BOTS:
+        return BOTS[name]
+    module, sep, function = name.partition(':')
+    if not sep:
+        raise ValueError('unknown bot %r (not %s, nor module:function)' %
+                         (name, ', '.join(sorted(BOTS))))
+    return getattr(importlib.import_module(module), function)
+
+
+############################################################
+# GAMES
+############################################################
+
+def stack_height(snapshot, cells):
+    ''' Parameters: snapshot - type:Snapshot
+                    cells - type:list of (x, y) - where a piece locks
+        Return value: type:int - the height of the stack with the piece
+        locked, before any rows are cleared
+    '''
+    top = min(y for x, y in cells)
+    for y in range(top):
+        if any(snapshot.rows[y]):
+            top = y
+            break
+    return snapshot.height - top
+
+
+def play(bot, seed, pieces=PIECES, width=Tetris.BOARD_WIDTH,
+         height=Tetris.BOARD_HEIGHT, metrics=None):
+    ''' Parameters: bot - type:function - see the module docstring
+                    seed - type:int - the game
+                    pieces - type:int - the piece limit
+                    metrics - type:metrics.Metrics - where the game is
+                    recorded, or None
+        Return value: type:dict - lines, pieces (placed), over (whether
+        the bot topped out) and seconds
+    '''
+    rng = random.Random(seed)
+    bot_rng = random.Random(seed ^ BOT_SEED_MASK)
+    snapshot = Snapshot(width, height)
+    last = len(Tetris.SHAPES) - 1
+    lines = 0
+    placed = 0
+    over = False
+    start = time.perf_counter()
+    while placed < pieces:
+        tick = time.perf_counter()
+        piece = movegen.spawn_piece(Tetris.SHAPES[rng.randint(0, last)], width)
+        placements = movegen.search(snapshot.can_move, width, height, piece)
+        if not placements:
+            over = True
+            break
+        cells, path = bot(snapshot, piece, placements, bot_rng)
+        if metrics is not None:
+            top = stack_height(snapshot, cells)
+        snapshot, cleared = snapshot.place(cells, piece.color)
+        lines += cleared
+        placed += 1
+        if metrics is not None:
+            metrics.piece_locked(cleared, top)
+            metrics.tick(time.perf_counter() - tick)
+    if metrics is not None:
+        metrics.game_completed()
+    return {'lines': lines, 'pieces': placed, 'over': over,
+            'seconds': time.perf_counter() - start}
+
+
+def _play_task(task, record=False):
+    # runs in a worker process: one game of one bot, with its metrics if
+    # they are recorded
+    name, seed, pieces = task
+    metrics = Metrics() if record else None
+    result = play(load_bot(name), seed, pieces, metrics=metrics)
+    result.update(bot=name, seed=seed)
+    if metrics is not None:
+        result['metrics'] = metrics.snapshot()
+    return result
+
+
+def schedule(bots, seeds, pieces):
+    ''' Parameters: bots - type:list of strings
+                    seeds - type:list of int
+                    pieces - type:int
+        Return value: type:list of tuples - (bot, seed, pieces) tasks
+
+        Returns a task per bot and game, longest expected first. Each
+        bot is timed on a probe game of PROBE_PIECES pieces.
+    '''
+    expected = {}
+    for name in bots:
+        probe = play(load_bot(name), seeds[0], PROBE_PIECES)
+        rate = probe['seconds'] / max(probe['pieces'], 1)
+        # a bot that tops out in the probe is not expected to last long
+        expected[name] = rate * (probe['pieces'] if probe['over'] else pieces)
+    tasks = [(name, seed, pieces) for name in bots for seed in seeds]
+    # sorted is stable, so tasks of equal length keep their order
+    return sorted(tasks, key=lambda task: -expected[task[0]])
+
+
+############################################################
+# STATISTICS
+############################################################
+
+# two-sided 95% critical values of Student's t for 1 to 30 degrees of
+# freedom; the normal value is used beyond
+T95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+       2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101,
+       2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052,
+       2.048, 2.045, 2.042)
+
+
+def mean_interval(values):
+    ''' Parameters: values - type:list of numbers
+        Return value: type:tuple - (mean, half width of the 95%
+        confidence interval of the mean)
+    '''
+    n = len(values)
+    mean = sum(values) / float(n)
+    if n < 2:
+        return mean, float('nan')
+    variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+    t = T95[n - 2] if n - 1 <= len(T95) else 1.96
+    return mean, t * math.sqrt(variance / n)
+
+
+def aggregate(results):
+    ''' Parameters: results - type:list of dict - from _play_task
+        Return value: type:dict - for each bot, the mean and 95%
+        interval of lines, pieces (survival) and pieces per second, and
+        the share of games it survived to the piece limit
+    '''
+    by_bot = {}
+    for result in results:
+        by_bot.setdefault(result['bot'], []).append(result)
+    summary = {}
+    for name, games in by_bot.items():
+        stats = {'games': len(games),
+                 'survived': sum(not g['over'] for g in games) / float(len(games))}
+        for key, values in (('lines', [g['lines'] for g in games]),
+                            ('pieces', [g['pieces'] for g in games]),
+                            ('pieces_per_second',
+                             [g['pieces'] / max(g['seconds'], 1e-9)
+                              for g in games])):
+            mean, half = mean_interval(values)
+            stats[key] = {'mean': mean, 'ci95': half}
+        summary[name] = stats
+    return summary
+
+
+############################################################
+# RUNNER
+############################################################
+
+def run(bots, games=GAMES, pieces=PIECES, jobs=None, seed=SEED, metrics=None):
+    ''' Parameters: bots - type:list of strings - bot names
+                    games - type:int - games each bot plays
+                    pieces - type:int - the piece limit
+                    jobs - type:int - worker processes (default one per CPU)
+                    seed - type:int - picks the games
+                    metrics - type:metrics.Metrics - where every game is
+                    recorded as it finishes, or None
+        Return value: type:dict - the seeds, every game's result and the
+        summary of every bot
+    '''
+    import multiprocessing
+    master = random.Random(seed)
+    seeds = [master.randrange(2 ** 32) for i in range(games)]
+    tasks = schedule(bots, seeds, pieces)
+    jobs = jobs or os.cpu_count() or 1
+    start = time.perf_counter()
+    results = []
+    task = functools.partial(_play_task, record=metrics is not None)
+    with multiprocessing.Pool(jobs) as pool:
+        for result in pool.imap_unordered(task, tasks):
+            if metrics is not None:
+                metrics.merge(result.pop('metrics'))
+            results.append(result)
+            sys.stderr.write('\r%d/%d games' % (len(results), len(tasks)))
+    sys.stderr.write('\n')
+    # in a fixed order, however the games finished
+    rank = dict((name, i) for i, name in enumerate(bots))
+    game = dict((s, i) for i, s in enumerate(seeds))
+    results.sort(key=lambda result: (rank[result['bot']], game[result['seed']]))
+    return {'meta': {'seed': seed, 'games': games, 'pieces': pieces,
+                     'jobs': jobs, 'seconds': time.perf_counter() - start},
+            'seeds': seeds,
+            'games': results,
+            'summary': aggregate(results)}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='tournament.py')
+    parser.add_argument('bots', nargs='+')
+    parser.add_argument('-g', '--games', type=int, default=GAMES)
+    parser.add_argument('-p', '--pieces', type=int, default=PIECES)
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='worker processes; 0 for one per CPU')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='write the game metrics to FILE every 10 s (JSON '
+                             'lines for a .jsonl file, else Prometheus text)')
+    parser.add_argument('-o', '--output')
+    args = parser.parse_args(argv[1:])
+    for name in args.bots:
+        load_bot(name)
+
+    metrics = flusher = None
+    if args.metrics:
+        metrics = Metrics()
+        flusher = MetricsFlusher(metrics, args.metrics)
+        flusher.start()
+    try:
+        results = run(args.bots, args.games, args.pieces, args.jobs or None,
+                      args.seed, metrics)
+    finally:
+        if flusher is not None:
+            flusher.stop()
+    print('%-16s %6s %18s %18s %20s %9s' % ('bot', 'games', 'lines', 'pieces',
+                                            'pieces/s', 'survived'))
+    for name in args.bots:
+        stats = results['summary'][name]
+        print('%-16s %6d %18s %18s %20s %8.0f%%' %
+              (name, stats['games'],
+               '%.1f +- %.1f' % (stats['lines']['mean'], stats['lines']['ci95']),
+               '%.1f +- %.1f' % (stats['pieces']['mean'], stats['pieces']['ci95']),
+               '%.0f +- %.0f' % (stats['pieces_per_second']['mean'],
+                                 stats['pieces_per_second']['ci95']),
+               stats['survived'] * 100))
+    print('%.1f s' % results['meta']['seconds'])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
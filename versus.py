@@ -0,0 +1,569 @@
+'''
+versus.py
+
+Two-player tetris over the network, with rollback.
+
+Both players' computers simulate both games. The games start from the
+same seed and only the inputs are sent: every frame (FRAME_MS) a player's
+keys are packed into one byte, and each packet carries the inputs the
+other side has not acknowledged yet behind a 10-byte header, about 11
+bytes a frame on a local network. A player plays on without the other's
+inputs: until they arrive the opponent is predicted to press nothing;
+when they do arrive and the prediction was wrong, the match is put back
+to the state it had before the first wrong frame (Tetris.get_state and
+set_state) and played forward again with the real inputs, which takes
+well under a frame. A player only stops to wait when more than WINDOW
+frames ahead of the other's inputs.
+
+Clearing two, three or four lines at once sends the other player one,
+two or four garbage lines, which are pushed in at the bottom of their
+board when their next piece locks. Garbage comes from the simulation,
+so it costs no bandwidth either.
+
+Usage: python versus.py host ADDRESS
+       python versus.py join ADDRESS
+
+ADDRESS is host:port for UDP (e.g. 127.0.0.1:7000), or otherwise the
+path of a Unix datagram socket. The host picks the seed and plays on the
+left. Keys: arrows and space, as in the single player game.
+
+@author chindesaurus
+'''
+import argparse
+import os
+import random
+import socket
+import struct
+import sys
+import time
+
+import graphics
+import replay
+from graphics import Rectangle, Point, Text
+from replay import gravity_key
+from snapshot import Snapshot
+from tetris import Tetris, Block
+
+
+FRAME_MS = Tetris.FRAME_MS      # one simulation frame, about 60 per second
+WINDOW = 30             # frames a player may run ahead of the other's inputs
+RESEND = 0.05           # seconds before inputs not acknowledged are sent again
+
+# the keys a frame's input byte holds, bit 0 first; they are handled in
+# this order when several are pressed in one frame
+KEYS = ('Left', 'Right', 'Down', 'Up', 'space')
+KEY_BITS = dict((key, 1 << i) for i, key in enumerate(KEYS))
+
+# garbage lines sent for the lines cleared by one piece
+GARBAGE = {2: 1, 3: 2, 4: 4}
+GARBAGE_COLOR = 'gray'
+
+
+def encode(keys):
+    ''' Parameters: keys - type:iterable of strings - Tk keysyms
+        Return value: type:int - the input byte of a frame
+    '''
+    bits = 0
+    for key in keys:
+        bits |= KEY_BITS.get(key, 0)
+    return bits
+
+
+def decode(bits):
+    ''' Return value: type:list of strings - the keys of an input byte
+    '''
+    return [key for i, key in enumerate(KEYS) if bits >> i & 1]
+
+
+############################################################
+# MATCH
+############################################################
+
+class Match(object):
+    ''' Match class: the two games of a versus match, stepped a frame
+        at a time
+        Attributes: games - type:list of Tetris - headless, player 0 first
+                    frame - type:int - frames played so far
+                    pending - type:list of int - garbage lines waiting
+                    for each player's next lock
+                    holes - type:list of int - the state of each player's
+                    garbage hole generator
+
+        Everything about a frame follows from the inputs given to step,
+        so both players' Matches go through the same states.
+    '''
+
+    def __init__(self, seed):
+        self.games = [Tetris(None, seed=seed), Tetris(None, seed=seed)]
+        self.frame = 0
+        self.pending = [0, 0]
+        self.holes = [seed & 0x7fffffff, (seed >> 1) & 0x7fffffff]
+
+
+    def over(self):
+        ''' Return value: type:int - the player who lost, or None
+        '''
+        for player, game in enumerate(self.games):
+            if game.over:
+                return player
+        return None
+
+
+    def step(self, inputs):
+        ''' Parameters: inputs - type:tuple of int - each player's input
+                        byte for this frame
+
+            Plays one frame: the inputs, then a frame of each game's
+            gravity (see Tetris.gravity_rows).
+        '''
+        for player, bits in enumerate(inputs):
+            for key in decode(bits):
+                self.handle_key(player, key)
+            rows = self.games[player].gravity_rows()
+            if rows:
+                self.handle_key(player, gravity_key(rows))
+        self.frame += 1
+
+
+    def handle_key(self, player, key):
+        # gives a key (or a gravity step, as replays record it) to one
+        # game, and deals out garbage if it locked a piece
+        game = self.games[player]
+        shape = game.current_shape
+        blocks = len(game.board.grid)
+        replay.apply_input(game, key)
+        if game.current_shape is shape:
+            return
+        lines = (blocks + len(shape.get_blocks()) - len(game.board.grid)) // \
+            game.board.width
+        if lines in GARBAGE:
+            self.pending[1 - player] += GARBAGE[lines]
+        if self.pending[player] and not game.over:
+            self.raise_garbage(player, self.pending[player])
+            self.pending[player] = 0
+
+
+    def raise_garbage(self, player, lines):
+        ''' Parameters: player - type:int
+                        lines - type:int
+
+            Pushes the stack of player's board up by lines rows and
+            fills the bottom with garbage, a row with one hole. The game
+            is over if blocks are pushed off the top or into the
+            falling shape.
+        '''
+        game = self.games[player]
+        board = game.board
+        width = board.width
+        self.holes[player] = (self.holes[player] * 1103515245 + 12345) & 0x7fffffff
+        hole = (self.holes[player] >> 16) % width
+        row = tuple(None if x == hole else GARBAGE_COLOR for x in range(width))
+
+        snapshot = Snapshot.from_board(board)
+        topped = any(any(color is not None for color in old)
+                     for old in snapshot.rows[:lines])
+        board.restore(Snapshot(width, board.height,
+                               snapshot.rows[lines:] + (row,) * lines))
+        for block in game.current_shape.get_blocks():
+            if (block.x, block.y) in board.grid:
+                topped = True
+        if topped:
+            game.over = True
+
+
+    def get_state(self):
+        ''' Returns the state of the match as plain values. '''
+        return (self.frame, [game.get_state() for game in self.games],
+                list(self.pending), list(self.holes))
+
+
+    def set_state(self, state):
+        ''' Puts the match back into a state from get_state. '''
+        frame, games, pending, holes = state
+        self.frame = frame
+        for game, game_state in zip(self.games, games):
+            game.set_state(game_state)
+        self.pending = list(pending)
+        self.holes = list(holes)
+
+
+############################################################
+# ROLLBACK
+############################################################
+
+class Session(object):
+    ''' Session class: one player's side of a match
+        Attributes: match - type:Match
+                    player - type:int - 0 or 1
+                    local - type:bytearray - this player's input of every
+                    frame played
+                    remote - type:bytearray - the other player's input of
+                    every frame received so far
+                    states - type:dict - frame to the match state before
+                    it, for the frames played without the other's input
+                    rollbacks - type:int - how many times frames were
+                    played again
+                    worst - type:float - the longest rollback in seconds
+    '''
+
+    def __init__(self, match, player):
+        self.match = match
+        self.player = player
+        self.local = bytearray()
+        self.remote = bytearray()
+        self.states = {}
+        self.rollbacks = 0
+        self.worst = 0.0
+
+
+    def inputs(self, frame):
+        # both players' input bytes for a frame, predicting no keys for a
+        # remote input not received yet
+        local = self.local[frame]
+        remote = self.remote[frame] if frame < len(self.remote) else 0
+        return (local, remote) if self.player == 0 else (remote, local)
+
+
+    def stalled(self):
+        ''' Returns True if this player has to wait for the other's
+            inputs before playing another frame.
+        '''
+        return self.match.frame - len(self.remote) >= WINDOW
+
+
+    def advance(self, bits):
+        ''' Parameters: bits - type:int - this player's input byte
+
+            Plays the next frame.
+        '''
+        frame = self.match.frame
+        self.local.append(bits)
+        if frame >= len(self.remote):
+            self.states[frame] = self.match.get_state()
+        self.match.step(self.inputs(frame))
+
+
+    def receive(self, first, inputs):
+        ''' Parameters: first - type:int - the frame of inputs[0]
+                        inputs - type:bytes - the other player's input bytes
+
+            Takes inputs from the other player. If frames were played
+            with a wrong guess of them, plays those frames again.
+        '''
+        known = len(self.remote)
+        if first > known or first + len(inputs) <= known:
+            return      # a gap, to be resent, or nothing new
+        played = self.match.frame
+        wrong = None
+        for frame in range(known, first + len(inputs)):
+            bits = inputs[frame - first]
+            self.remote.append(bits)
+            if wrong is None and frame < played and bits:
+                wrong = frame
+
+        if wrong is not None:
+            start = time.perf_counter()
+            self.match.set_state(self.states[wrong])
+            for frame in range(wrong, played):
+                if frame >= len(self.remote):
+                    self.states[frame] = self.match.get_state()
+                self.match.step(self.inputs(frame))
+            self.rollbacks += 1
+            self.worst = max(self.worst, time.perf_counter() - start)
+
+        for frame in range(known, min(len(self.remote), played)):
+            self.states.pop(frame, None)
+
+
+############################################################
+# NETWORK
+############################################################
+
+# kind, acknowledged frames, first frame, input count
+PACKET = struct.Struct('<BIIB')
+HELLO = 1
+START = 2
+INPUTS = 3
+
+
+class Link(object):
+    ''' Link class: the datagram socket to the other player
+        Attributes: sock - type:socket.socket
+                    peer - the other player's address
+                    acked - type:int - how many of this player's inputs
+                    the other has received
+                    sent - type:int - bytes sent
+                    welcome - type:bytes - the host's START packet, sent
+                    again if the other player's hello is repeated
+    '''
+
+    def __init__(self, sock, peer, path=None, welcome=None):
+        self.sock = sock
+        self.peer = peer
+        self.path = path
+        self.welcome = welcome
+        self.acked = 0
+        self.sent = 0
+        self.last = (0, 0.0)    # frames played and time at the last send
+        sock.setblocking(False)
+
+
+    def send(self, session):
+        ''' Sends the inputs of session the other player does not have
+            yet, and acknowledges the ones received. Nothing is sent
+            unless a frame was played since the last send, or RESEND
+            seconds went by (for a lost packet, or while stalled).
+        '''
+        now = time.perf_counter()
+        frames, then = self.last
+        if len(session.local) == frames and now - then < RESEND:
+            return
+        self.last = (len(session.local), now)
+        inputs = bytes(session.local[self.acked:self.acked + 255])
+        data = PACKET.pack(INPUTS, len(session.remote), self.acked,
+                           len(inputs)) + inputs
+        try:
+            self.sent += self.sock.sendto(data, self.peer)
+        except (BlockingIOError, ConnectionRefusedError, FileNotFoundError):
+            pass    # lost, like any datagram; the next send repeats it
+
+
+    def poll(self, session):
+        ''' Passes every packet waiting on the socket to session. '''
+        while True:
+            try:
+                data = self.sock.recv(PACKET.size + 255)
+            except (BlockingIOError, ConnectionRefusedError):
+                return
+            if len(data) < PACKET.size:
+                continue
+            kind, acked, first, count = PACKET.unpack_from(data)
+            if kind == HELLO and self.welcome is not None:
+                self.sock.sendto(self.welcome, self.peer)
+            if kind != INPUTS:
+                continue
+            self.acked = max(self.acked, acked)
+            session.receive(first, data[PACKET.size:PACKET.size + count])
+
+
+    def close(self):
+        self.sock.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def parse_address(address):
+    ''' Return value: type:tuple - (family, address) for a host:port or
+        a socket path
+    '''
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    return socket.AF_UNIX, address
+
+
+def host(address, timeout=60.0):
+    ''' Parameters: address - type:string - see parse_address
+        Return value: type:tuple - (Link, seed)
+
+        Waits for the other player to join, and sends them the seed.
+    '''
+    family, address = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    path = None
+    if family == socket.AF_UNIX:
+        if os.path.exists(address):
+            os.remove(address)
+        path = address
+    sock.bind(address)
+    sock.settimeout(timeout)
+    while True:
+        data, peer = sock.recvfrom(PACKET.size)
+        if data[:1] == bytes((HELLO,)):
+            break
+    seed = random.randrange(2 ** 32)
+    welcome = PACKET.pack(START, 0, seed, 0)
+    sock.sendto(welcome, peer)
+    return Link(sock, peer, path, welcome), seed
+
+
+def join(address, timeout=60.0):
+    ''' Parameters: address - type:string - the host's address
+        Return value: type:tuple - (Link, seed)
+
+        Says hello to the host until it answers with the seed.
+    '''
+    family, peer = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    path = None
+    if family == socket.AF_UNIX:
+        # the host can only answer a Unix datagram socket with a name
+        path = '%s.%d' % (peer, os.getpid())
+        sock.bind(path)
+    else:
+        sock.bind((peer[0], 0))
+    sock.settimeout(0.2)
+    deadline = time.time() + timeout
+    while True:
+        try:
+            sock.sendto(PACKET.pack(HELLO, 0, 0, 0), peer)
+            data = sock.recv(PACKET.size)
+        except (socket.timeout, ConnectionRefusedError, FileNotFoundError):
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+            continue
+        kind, acked, seed, count = PACKET.unpack(data)
+        if kind == START:
+            return Link(sock, peer, path), seed
+
+
+############################################################
+# WINDOW
+############################################################
+
+class BoardView(object):
+    ''' BoardView class: draws a game of a match
+        Attributes: frame - type:CanvasFrame
+                    cells - type:list of Rectangle - one per square
+                    colors - type:list - the color drawn in each square
+
+        Every square has a rectangle of its own, made once; showing a
+        game redraws only the squares that changed, however the game got
+        there (a rollback included).
+    '''
+
+    def __init__(self, frame, width=Tetris.BOARD_WIDTH,
+                 height=Tetris.BOARD_HEIGHT):
+        self.frame = frame
+        self.width = width
+        self.height = height
+        self.colors = [None] * (width * height)
+        self.cells = []
+        size = Block.BLOCK_SIZE
+        for y in range(height):
+            for x in range(width):
+                cell = Rectangle(Point(x * size, y * size),
+                                 Point((x + 1) * size, (y + 1) * size))
+                cell.setWidth(Block.OUTLINE_WIDTH)
+                self.cells.append(cell)
+        self.message = None
+
+
+    def show(self, game, message):
+        ''' Parameters: game - type:Tetris
+                        message - type:string - drawn over the board, or None
+        '''
+        width = self.width
+        colors = [None] * len(self.colors)
+        for (x, y), block in game.board.grid.items():
+            colors[y * width + x] = block.config['fill']
+        if not game.over:
+            for block in game.current_shape.get_blocks():
+                if 0 <= block.y < self.height:
+                    colors[block.y * width + block.x] = block.config['fill']
+
+        for i, color in enumerate(colors):
+            if color != self.colors[i]:
+                cell = self.cells[i]
+                if color is None:
+                    cell.undraw()
+                else:
+                    cell.setFill(color)
+                    if self.colors[i] is None:
+                        cell.draw(self.frame)
+                self.colors[i] = color
+
+        if self.message is not None and self.message.getText() != message:
+            self.message.undraw()
+            self.message = None
+        if message and self.message is None:
+            self.message = Text(Point(150, 150), message)
+            self.message.setSize(32)
+            self.message.draw(self.frame)
+
+
+class Versus(object):
+    ''' Versus class: plays a match in a window
+        Attributes: session - type:Session
+                    link - type:Link
+                    keys - type:list of strings - keys pressed since the
+                    last frame
+    '''
+
+    def __init__(self, win, session, link):
+        self.win = win
+        self.session = session
+        self.link = link
+        self.keys = []
+        self.views = []
+        width = Tetris.BOARD_WIDTH * Block.BLOCK_SIZE
+        height = Tetris.BOARD_HEIGHT * Block.BLOCK_SIZE
+        for player in range(2):
+            frame = graphics.CanvasFrame(win, width, height)
+            frame.canvas.pack_configure(side='left', padx=4)
+            frame.setBackground('light gray')
+            self.views.append(BoardView(frame))
+        win.bind_all('<Key>', self.key_pressed)
+        self.start = time.perf_counter()
+        self.tick()
+
+
+    def key_pressed(self, event):
+        if event.keysym in KEY_BITS:
+            self.keys.append(event.keysym)
+
+
+    def tick(self):
+        session = self.session
+        self.link.poll(session)
+        due = int((time.perf_counter() - self.start) * 1000 / FRAME_MS)
+        # after a wait, carry on from now rather than catching up
+        if due - session.match.frame > 4:
+            self.start += (due - session.match.frame - 4) * FRAME_MS / 1000.0
+            due = session.match.frame + 4
+        while session.match.frame < due and not session.stalled():
+            session.advance(encode(self.keys))
+            self.keys = []
+        self.link.send(session)
+
+        loser = session.match.over()
+        for player, view in enumerate(self.views):
+            message = None
+            if loser is not None:
+                message = 'You lose' if loser == player else 'You win'
+                if player != session.player:
+                    message = 'They ' + message[4:]
+            view.show(session.match.games[player], message)
+        self.win.after(FRAME_MS // 2, self.tick)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='versus.py')
+    parser.add_argument('role', choices=['host', 'join'])
+    parser.add_argument('address')
+    args = parser.parse_args(argv[1:])
+
+    if args.role == 'host':
+        print('waiting for a player to join at %s' % args.address)
+        link, seed = host(args.address)
+        player = 0
+    else:
+        link, seed = join(args.address)
+        player = 1
+    session = Session(Match(seed), player)
+    win = graphics.Window('Tetris versus')
+    Versus(win, session, link)
+    try:
+        win.mainloop()
+    finally:
+        link.close()
+        frames = max(session.match.frame, 1)
+        print('%d frames, %.1f bytes sent per frame, %d rollbacks, '
+              'longest %.2f ms' % (session.match.frame, link.sent / float(frames),
+                                   session.rollbacks, session.worst * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,227 @@
+'''
+wall.py
+
+Many tetris games shown at once, tiled into a single canvas.
+
+A BoardWall draws every game it is given as a thumbnail in one image on
+one canvas, so a wall of 64 games costs one Tk widget and one image
+rather than a window and a canvas item per block for each. The games
+are headless (Tetris(None)) and driven by whoever owns them; the wall
+only looks at them, on one shared render tick. Each board is rasterized
+into a capture.FrameBuffer of its own, which repaints just the squares
+that changed, and only the boards that changed since the last tick are
+copied into the image, one Tk call each.
+
+Usage: python wall.py [-n GAMES] [--columns N] [--cell PIXELS] [--seed N]
+
+shows a wall of games played by random key presses, restarting the ones
+that end.
+
+@author chindesaurus
+'''
+import argparse
+import random
+import sys
+import time
+
+import graphics
+from graphics import Point, Text
+from capture import FrameBuffer
+from tetris import Tetris
+
+
+CELL = 6                # pixels per square of a thumbnail
+GAP = 6                 # pixels between thumbnails
+LABEL = 14              # pixels under a thumbnail for its name
+FPS = 30
+
+
+class Tile(object):
+    ''' Tile class: one game on a BoardWall
+        Attributes: game - type:Tetris
+                    name - type:string
+                    x - type:int - left of the thumbnail in the image
+                    y - type:int - top of the thumbnail in the image
+                    frame - type:capture.FrameBuffer - the thumbnail
+                    label - type:graphics.Text - the name under it
+                    over - type:bool - whether the label says game over
+    '''
+
+    def __init__(self, game, name, x, y, frame, label):
+        self.game = game
+        self.name = name
+        self.x = x
+        self.y = y
+        self.frame = frame
+        self.label = label
+        self.over = False
+
+
+class BoardWall(object):
+    ''' BoardWall class: games tiled into one canvas
+        Attributes: columns - type:int - thumbnails per row
+                    rows - type:int - rows of thumbnails
+                    cell - type:int - pixels per square
+                    tiles - type:list of Tile
+                    frame - type:CanvasFrame - holds the image
+                    pixmap - type:graphics.Pixmap - the image
+                    redrawn - type:int - thumbnails copied to the image
+                    renders - type:int - render ticks so far
+                    spent - type:float - seconds spent rendering
+    '''
+
+    def __init__(self, win, columns, rows, cell=CELL,
+                 width=Tetris.BOARD_WIDTH, height=Tetris.BOARD_HEIGHT):
+        self.win = win
+        self.columns = columns
+        self.rows = rows
+        self.cell = cell
+        self.board_size = (width, height)
+        self.tile_width = width * cell
+        self.tile_height = height * cell
+        image_width = columns * (self.tile_width + GAP) + GAP
+        image_height = rows * (self.tile_height + GAP + LABEL) + GAP
+        self.frame = graphics.CanvasFrame(win, image_width, image_height)
+        self.frame.setBackground('dark gray')
+        self.pixmap = graphics.Pixmap(image_width, image_height)
+        graphics.Image(Point(image_width / 2, image_height / 2),
+                       self.pixmap).draw(self.frame)
+        self.tiles = []
+        self.redrawn = 0
+        self.renders = 0
+        self.spent = 0.0
+        self.timer = None
+
+
+    def add(self, game, name=None):
+        ''' Parameters: game - type:Tetris - a headless game
+                        name - type:string - shown under it (default its
+                        number)
+            Return value: type:int - the index of its tile
+        '''
+        index = len(self.tiles)
+        if index >= self.columns * self.rows:
+            raise ValueError('the wall holds %d games' %
+                             (self.columns * self.rows))
+        row, column = divmod(index, self.columns)
+        x = GAP + column * (self.tile_width + GAP)
+        y = GAP + row * (self.tile_height + GAP + LABEL)
+        if name is None:
+            name = str(index + 1)
+        label = Text(Point(x + self.tile_width / 2,
+                           y + self.tile_height + LABEL / 2), name)
+        label.setSize(8)
+        label.draw(self.frame)
+        width, height = self.board_size
+        frame = FrameBuffer(width, height, self.cell)
+        self.pixmap.setRegion(x, y, self.tile_width, self.tile_height,
+                              frame.view[frame.offset:])
+        self.tiles.append(Tile(game, name, x, y, frame, label))
+        return index
+
+
+    def set_game(self, index, game):
+        ''' Shows game in tile index instead of the game it had. '''
+        self.tiles[index].game = game
+
+
+    def render(self):
+        ''' Return value: type:int - the thumbnails redrawn
+
+            Brings the image up to date with the games. Boards that did
+            not change since the last render cost a comparison of their
+            squares and no Tk calls.
+        '''
+        start = time.perf_counter()
+        redrawn = 0
+        pixmap = self.pixmap
+        width = self.tile_width
+        height = self.tile_height
+        for tile in self.tiles:
+            frame = tile.frame
+            if frame.render(tile.game):
+                pixmap.setRegion(tile.x, tile.y, width, height,
+                                 frame.view[frame.offset:])
+                redrawn += 1
+            if tile.game.over != tile.over:
+                tile.over = tile.game.over
+                tile.label.setText(tile.name + (' - over' if tile.over else ''))
+        self.redrawn += redrawn
+        self.renders += 1
+        self.spent += time.perf_counter() - start
+        return redrawn
+
+
+    def start(self, fps=FPS, before=None):
+        ''' Parameters: fps - type:int - render ticks per second
+                        before - type:function - called before each render,
+                        e.g. to step the games
+
+            Renders fps times a second from now on.
+        '''
+        def tick():
+            if before is not None:
+                before()
+            self.render()
+            self.timer = self.win.after(1000 // fps, tick)
+        self.timer = self.win.after(0, tick)
+
+
+    def stop(self):
+        if self.timer is not None:
+            self.win.after_cancel(self.timer)
+            self.timer = None
+
+
+############################################################
+# DEMO
+############################################################
+
+KEYS = ['Left', 'Right', 'Up', 'Down', 'Down', 'space', None, None]
+GRAVITY = 15            # ticks between gravity steps in the demo
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='wall.py')
+    parser.add_argument('-n', '--games', type=int, default=64)
+    parser.add_argument('--columns', type=int, default=8)
+    parser.add_argument('--cell', type=int, default=CELL)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv[1:])
+
+    rng = random.Random(args.seed)
+    win = graphics.Window('Tetris wall')
+    wall = BoardWall(win, args.columns, -(-args.games // args.columns),
+                     args.cell)
+    for i in range(args.games):
+        wall.add(Tetris(None, seed=rng.randrange(2 ** 32)))
+
+    ticks = [0]
+
+    def step():
+        ticks[0] += 1
+        for index, tile in enumerate(wall.tiles):
+            game = tile.game
+            if game.over:
+                if rng.random() < 0.01:
+                    wall.set_game(index, Tetris(None, seed=rng.randrange(2 ** 32)))
+                continue
+            key = rng.choice(KEYS)
+            if key is not None:
+                game.handle_key(key)
+            if ticks[0] % GRAVITY == 0:
+                game.handle_key('Down')
+
+    wall.start(FPS, step)
+    try:
+        win.mainloop()
+    finally:
+        renders = max(wall.renders, 1)
+        print('%d renders, %.1f boards redrawn and %.2f ms spent per render' %
+              (wall.renders, wall.redrawn / float(renders),
+               wall.spent * 1000 / renders))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))